@@ -0,0 +1,12 @@
+"""
+Production settings for the ASGI entry point (asgi.py). Requests are
+routed through asgi_urls.py, whose read-only essay pages are async views.
+Serve it with any ASGI server, for example:
+
+    uvicorn Avarion.asgi:application --workers 4
+"""
+from .production_settings import *
+
+ROOT_URLCONF = 'Avarion.asgi_urls'
+
+ASGI_APPLICATION = 'Avarion.asgi.application'
@@ -0,0 +1,22 @@
+"""
+The URLconf of the ASGI entry point (see asgi_settings.py). It routes the
+same URLs as urls.py, but the read-only essay pages and the home page go
+to async views.
+"""
+from django.contrib import admin
+from django.urls import path
+
+from django.conf.urls import url, include
+
+from Essay import views as essay_views
+
+from . import metrics, views
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics, name='metrics'),
+    url(r'^sitemap\.xml$', essay_views.sitemap_index, name="essay_sitemap_index"),
+    url(r'^sitemap-(?P<part>\d+)\.xml$', essay_views.sitemap, name="essay_sitemap"),
+    url(r'^note/', include('Essay.async_urls')),
+    url(r'^$', views.home_async, name="home"),
+]
@@ -0,0 +1,199 @@
+"""
+Bundled, minified and precompressed stylesheets.
+
+Each page links one stylesheet (root/css/base-*.css) that pulls in the
+others with @import, so a browser fetches them one after the other. The
+build_assets command turns every entry point listed in ASSET_BUNDLES
+into a single file:
+
+- the @import rules are inlined and the result is minified,
+- the file name carries a hash of the content (root/css/base-note.3f2a1b.css),
+  so it never changes and can be cached forever,
+- a .gz sibling, and a .br one if the brotli package is installed, are
+  written next to it.
+
+The bundles and a manifest mapping entry points to bundles (assets.json)
+are written to STATIC_ROOT. The asset_url template tag looks entry points
+up in the manifest, and falls back to the plain static URL when there is
+none (e.g. in development).
+
+PrecompressedStaticMiddleware serves the bundles with far-future,
+immutable caching headers, choosing the smallest encoding the client
+accepts.
+"""
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.http import FileResponse
+from django.templatetags.static import static
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MANIFEST_NAME = 'assets.json'
+
+# The manifest of this process, see load_manifest
+_manifest = None
+
+IMPORT_RULE = re.compile(r'''@import\s+(?:url\(\s*)?['"]?([^'")\s]+)['"]?\s*\)?\s*;''')
+COMMENT = re.compile(r'/\*.*?\*/', re.S)
+SPACE_AROUND_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+SPACE_AFTER_COLON = re.compile(r':\s+')
+
+# (encoding, file suffix), preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def read_source(path):
+    """The text of a static file, looked up with the staticfiles finders"""
+    absolute_path = finders.find(path)
+    if absolute_path is None:
+        raise ValueError("Static file %s not found" % path)
+    with open(absolute_path, encoding='utf-8') as f:
+        return f.read()
+
+
+def inline_imports(path, seen=None):
+    """
+    The text of a stylesheet with its @import rules replaced by the
+    stylesheets they import, recursively. Each file is included once.
+    """
+    seen = set() if seen is None else seen
+    seen.add(path)
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        imported = posixpath.normpath(posixpath.join(directory, match.group(1)))
+        if imported in seen:
+            return ''
+        return inline_imports(imported, seen)
+
+    return IMPORT_RULE.sub(replace, read_source(path))
+
+
+def minify(css):
+    """
+    Removes comments and the whitespace that does not matter. Spaces inside
+    selectors are kept, since "a :hover" and "a:hover" differ.
+    """
+    css = COMMENT.sub('', css)
+    css = ' '.join(css.split())
+    css = SPACE_AROUND_PUNCTUATION.sub(r'\1', css)
+    css = SPACE_AFTER_COLON.sub(':', css)
+    return css.replace(';}', '}').strip()
+
+
+def hashed_name(path, content):
+    root, ext = posixpath.splitext(path)
+    return '%s.%s%s' % (root, hashlib.md5(content).hexdigest()[:12], ext)
+
+
+def compress(content):
+    """:return: A list of (suffix, compressed content) pairs"""
+    variants = [('.gz', gzip.compress(content, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content, mode=brotli.MODE_TEXT)))
+    return variants
+
+
+def build(bundles=None, output_dir=None):
+    """
+    Builds every bundle into output_dir and writes the manifest.
+    :param bundles: The entry points, defaults to ASSET_BUNDLES
+    :param output_dir: Defaults to STATIC_ROOT
+    :return: The manifest, a dictionary from entry point to bundle
+    """
+    bundles = settings.ASSET_BUNDLES if bundles is None else bundles
+    output_dir = settings.STATIC_ROOT if output_dir is None else output_dir
+
+    manifest = {}
+    for path in bundles:
+        content = minify(inline_imports(path)).encode('utf-8')
+        name = hashed_name(path, content)
+        target = os.path.join(output_dir, *name.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+        for suffix, compressed in compress(content):
+            with open(target + suffix, 'wb') as f:
+                f.write(compressed)
+        manifest[path] = name
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    clear_manifest()
+    return manifest
+
+
+def load_manifest():
+    """
+    The manifest written by build(), read once per process. Empty if
+    the bundles have not been built.
+    """
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(settings.STATIC_ROOT, MANIFEST_NAME)) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def clear_manifest():
+    """Makes the next load_manifest read the manifest again"""
+    global _manifest
+    _manifest = None
+
+
+def asset_url(path):
+    """The URL of the bundle of an entry point, or its plain static URL if it has none"""
+    return static(load_manifest().get(path, path))
+
+
+class PrecompressedStaticMiddleware(object):
+    """
+    Answers requests for built bundles straight from STATIC_ROOT, before
+    any other middleware runs. The .br or .gz sibling is sent when the client
+    accepts it. Since a bundle's name changes with its content, responses
+    may be cached for a year without revalidation. Every other request,
+    including other static files, is passed on.
+    """
+
+    max_age = 60 * 60 * 24 * 365
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(settings.STATIC_URL):
+            name = request.path[len(settings.STATIC_URL):]
+            if name in load_manifest().values():
+                return self.serve(request, name)
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        path = os.path.join(settings.STATIC_ROOT, *name.split('/'))
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        encoding = None
+        for candidate, suffix in ENCODINGS:
+            if candidate in accepted and os.path.exists(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        response = FileResponse(open(path, 'rb'), content_type='text/css; charset=utf-8')
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+        response['Cache-Control'] = 'public, max-age=%d, immutable' % self.max_age
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -0,0 +1,141 @@
+"""
+Caching of public pages by a shared cache in front of the site (a CDN or a
+reverse proxy such as Varnish).
+
+The essay and list pages are the same for every visitor, so they are sent
+with `Cache-Control: public, s-maxage=EDGE_CACHE_MAX_AGE` and a
+`Surrogate-Key` header naming what they show (e.g. the slug of an essay
+and its category). Browsers are told to revalidate (max-age=0), the
+shared cache keeps the page until it expires or is purged. What depends on
+the visitor (edit links, drafts) is fetched by the page from a JSON
+endpoint that is never cached, see Essay.views.essay_extras. Pages only
+ask for it when the SIGNED_IN_COOKIE is set, so that anonymous visitors,
+nearly all of them, are answered by the shared cache alone. The cookie
+only says there may be something to fetch; the endpoint checks the
+session.
+
+When an essay changes, the surrogate keys of the pages showing it are
+purged through the backend named by EDGE_PURGE_BACKEND once the
+transaction commits. A backend is a class with a purge(keys) method:
+PurgeRequestBackend sends the keys to the proxy or CDN, LocalPurgeBackend
+(for development, where there is none) only logs them.
+"""
+import logging
+import urllib.request
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.dispatch import receiver
+from django.utils.cache import patch_cache_control
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+
+# Set while the visitor is signed in. Not HttpOnly: the pages read it, see
+# static/root/js/extras.js.
+SIGNED_IN_COOKIE = 'signed_in'
+
+
+def get_max_age():
+    """How long (in seconds) the shared cache may keep a page"""
+    return getattr(settings, 'EDGE_CACHE_MAX_AGE', 60 * 60 * 24)
+
+
+def cache_publicly(response, keys):
+    """Marks a response as cacheable by shared caches, under the given surrogate keys"""
+    patch_cache_control(response, public=True, max_age=0, s_maxage=get_max_age())
+    response[SURROGATE_KEY_HEADER] = ' '.join(keys)
+    return response
+
+
+class PurgeBackend(object):
+
+    def purge(self, keys):
+        """Removes every cached page tagged with one of the surrogate keys"""
+        raise NotImplementedError
+
+
+class LocalPurgeBackend(PurgeBackend):
+    """Logs the keys it is asked to purge and does nothing else"""
+
+    def purge(self, keys):
+        logger.debug("Purging %s", ' '.join(keys))
+
+
+class PurgeRequestBackend(PurgeBackend):
+    """
+    Sends a PURGE request to EDGE_PURGE_URL with the keys in its
+    Surrogate-Key header, which Varnish (with a VCL banning on that header)
+    and the purge endpoints of CDNs answer by dropping the tagged pages.
+    It is sent when the edit commits, so a slow proxy holds up the request
+    that saved the essay by up to `timeout` seconds.
+    """
+
+    timeout = 5
+
+    def purge(self, keys):
+        request = urllib.request.Request(settings.EDGE_PURGE_URL, method='PURGE',
+                                         headers={SURROGATE_KEY_HEADER: ' '.join(keys)})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def get_backend():
+    path = getattr(settings, 'EDGE_PURGE_BACKEND', 'Avarion.edge.LocalPurgeBackend')
+    return import_string(path)()
+
+
+def purge(keys):
+    """
+    Purges surrogate keys from the shared cache. A failure is logged rather
+    than raised: the change is committed by then, and the pages expire
+    after EDGE_CACHE_MAX_AGE anyway.
+    """
+    if not keys:
+        return
+    try:
+        get_backend().purge(list(keys))
+    except Exception:
+        logger.exception("Could not purge %s", ' '.join(keys))
+
+
+def set_signed_in_cookie(response, signed_in):
+    """Sets or deletes the SIGNED_IN_COOKIE on a response"""
+    if signed_in:
+        response.set_cookie(SIGNED_IN_COOKIE, '1', max_age=settings.SESSION_COOKIE_AGE,
+                            secure=settings.SESSION_COOKIE_SECURE, httponly=False, samesite='Lax')
+    else:
+        response.delete_cookie(SIGNED_IN_COOKIE, samesite='Lax')
+
+
+@receiver(user_logged_in)
+def remember_sign_in(sender, request, user, **kwargs):
+    if request is not None:
+        request.edge_signed_in = True
+
+
+@receiver(user_logged_out)
+def remember_sign_out(sender, request, user, **kwargs):
+    if request is not None:
+        request.edge_signed_in = False
+
+
+class SignedInCookieMiddleware(object):
+    """
+    Sets the SIGNED_IN_COOKIE on the response to a request that signed the
+    user in, and deletes it on one that signed them out. Other requests are
+    left alone, so that the session of a visitor is never loaded for it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        signed_in = getattr(request, 'edge_signed_in', None)
+        if signed_in is not None:
+            set_signed_in_cookie(response, signed_in)
+        return response
@@ -0,0 +1,184 @@
+"""
+Lightweight per-view request metrics.
+
+MetricsMiddleware measures, for every request, the total latency, the
+number of SQL queries and the time spent in them, and the time spent
+rendering templates. The measurements are aggregated in memory into
+histograms per view (the URL name the request resolved to), and the
+metrics view exposes them in the Prometheus text format.
+
+Template render time is only seen for templates loaded through
+TimedDjangoTemplates, the template backend the metrics settings profile
+configures (see metrics_settings.py).
+
+The histograms live in the memory of each worker process, so every
+process reports its own numbers.
+"""
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates
+
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram(object):
+    """
+    Counts observations per bucket, like a Prometheus histogram. The
+    counts are kept per bucket and only made cumulative when exported.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yields (le, cumulative count) pairs, ending with +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry(object):
+    """The histograms of every metric, per view"""
+
+    METRICS = (
+        ('request_duration_seconds', "Total time spent handling a request.", SECONDS_BUCKETS),
+        ('db_queries', "Number of SQL queries run by a request.", QUERIES_BUCKETS),
+        ('db_duration_seconds', "Time a request spent waiting on SQL queries.", SECONDS_BUCKETS),
+        ('template_duration_seconds', "Time a request spent rendering templates.", SECONDS_BUCKETS),
+    )
+
+    def __init__(self, prefix='avarion_'):
+        self.prefix = prefix
+        self.lock = Lock()
+        self.views = {}
+
+    def observe(self, view, values):
+        """
+        :param view: The name of the view the request went to
+        :param values: One value per metric, in the order of METRICS
+        """
+        with self.lock:
+            histograms = self.views.get(view)
+            if histograms is None:
+                histograms = self.views[view] = [Histogram(buckets) for _, _, buckets in self.METRICS]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.views = {}
+
+    def export(self):
+        """The histograms in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for index, (name, description, _) in enumerate(self.METRICS):
+                name = self.prefix + name
+                lines.append('# HELP %s %s' % (name, description))
+                lines.append('# TYPE %s histogram' % name)
+                for view in sorted(self.views):
+                    histogram = self.views[view][index]
+                    for bound, count in histogram.samples():
+                        lines.append('%s_bucket{view="%s",le="%s"} %d' % (name, view, bound, count))
+                    lines.append('%s_sum{view="%s"} %r' % (name, view, float(histogram.sum)))
+                    lines.append('%s_count{view="%s"} %d' % (name, view, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# The measurements of the request being handled in the current thread or task
+current_request = ContextVar('avarion_request_metrics', default=None)
+
+
+class RequestMetrics(object):
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def time_query(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries += 1
+
+
+class MetricsMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = perf_counter()
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.time_query))
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+        match = request.resolver_match
+        view = (match.view_name if match is not None else None) or 'unresolved'
+        registry.observe(view, (perf_counter() - start, metrics.queries, metrics.db_time, metrics.template_time))
+        return response
+
+
+class TimedTemplate(object):
+    """Wraps a template of the Django backend to time its rendering"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        start = perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics = current_request.get()
+            if metrics is not None:
+                metrics.template_time += perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with every render timed for MetricsMiddleware"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super(TimedDjangoTemplates, self).from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super(TimedDjangoTemplates, self).get_template(template_name))
+
+
+@staff_member_required
+def metrics(request):
+    return HttpResponse(registry.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,14 @@
+"""
+Production settings with request metrics turned on. MetricsMiddleware
+records the latency, query count, database time and template render time
+of every request per view, and staff users can read them in the
+Prometheus text format at /metrics. Select them with:
+
+    DJANGO_SETTINGS_MODULE=Avarion.metrics_settings
+"""
+from .production_settings import *
+
+MIDDLEWARE = ['Avarion.metrics.MetricsMiddleware'] + MIDDLEWARE
+
+# Same engine, but every template render is timed
+TEMPLATES[0]['BACKEND'] = 'Avarion.metrics.TimedDjangoTemplates'
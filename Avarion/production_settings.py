@@ -0,0 +1,79 @@
+"""
+Production settings for Avarion. They extend settings.py and are selected
+through the environment:
+
+    DJANGO_SETTINGS_MODULE=Avarion.production_settings
+"""
+import os
+
+from .settings import *
+
+DEBUG = False
+
+
+# Database
+# Connections are kept open between requests instead of being opened for
+# every request. With SQLite, WAL mode lets readers carry on while an editor
+# is writing.
+
+DATABASES['default']['CONN_MAX_AGE'] = 600
+
+if DATABASES['default']['ENGINE'] in ('django.db.backends.sqlite3', 'Avarion.sqlite_backend'):
+    DATABASES['default']['ENGINE'] = 'Avarion.sqlite_backend'
+    DATABASES['default']['OPTIONS'] = {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'busy_timeout': 5000,
+        },
+        'transaction_mode': 'IMMEDIATE',
+    }
+
+
+# Templates
+# Parse every template once per process instead of on every request.
+
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+
+# Cache
+# A file-based cache is shared by all worker processes on the host, so a
+# page invalidated by an edit in one process is gone for all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('AVARION_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+
+# Static files
+# The stylesheet bundles built by `manage.py build_assets` are served with
+# far-future caching, precompressed, before any other middleware runs.
+
+MIDDLEWARE = ['Avarion.assets.PrecompressedStaticMiddleware'] + MIDDLEWARE
+
+
+# Sitemaps and feeds
+# The public address of the site, which their links are made absolute with.
+
+SITE_URL = os.environ.get('AVARION_SITE_URL', SITE_URL)
+
+
+# Shared caching
+# The pages showing an essay are purged from the proxy in front of the site
+# (Varnish by default) when it changes, see Avarion/edge.py.
+
+EDGE_PURGE_BACKEND = 'Avarion.edge.PurgeRequestBackend'
+EDGE_PURGE_URL = os.environ.get('AVARION_EDGE_PURGE_URL', 'http://127.0.0.1:6081/')
@@ -0,0 +1,66 @@
+"""
+Rate limiting with token buckets kept in the cache.
+
+A bucket holds up to `burst` tokens and is refilled with `rate` tokens a
+second. Every request takes one, and a request finding the bucket empty is
+refused with a 429. So a client can send `burst` requests at once, and
+`rate` a second on average after that. The bucket of a client is one cache
+entry, (tokens, time it was last taken from), in the cache named by
+RATE_LIMIT_CACHE.
+
+Buckets are read and written under a lock, so they are exact within a
+process. Across processes they are as shared as the cache is: with the
+local-memory cache of the development settings every process has its own,
+with the file-based cache of production they are shared, and two processes
+taking the last token at the very same time may both get it.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+def take_token(name, client, burst, rate):
+    """
+    Takes a token from the bucket of a client.
+    :param name: What is limited, e.g. 'essay-write'
+    :param client: Who is asking, see client_key
+    :return: 0 if a token was taken, otherwise the number of seconds until
+            the bucket has one
+    """
+    cache = get_cache()
+    key = 'ratelimit:%s:%s' % (name, client)
+    with lock:
+        now = time.time()
+        tokens, taken_on = cache.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - taken_on) * rate)
+        if tokens < 1:
+            return (1 - tokens) / rate
+        # Once it is full again, the bucket is as good as gone
+        cache.set(key, (tokens - 1, now), math.ceil(burst / rate))
+        return 0
+
+
+def client_key(request):
+    """Who is asking: the signed-in user, or the address of an anonymous client"""
+    if request.user.is_authenticated:
+        return 'user:%d' % request.user.pk
+    return 'address:%s' % request.META.get('REMOTE_ADDR', '')
+
+
+def too_many_requests(wait):
+    """The response to a request refused by a rate limit, telling when to try again"""
+    response = HttpResponse("Too many requests, try again later.", status=429,
+                            content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
@@ -0,0 +1,21 @@
+"""
+Development settings with a read replica, for trying out the replica
+routing locally with two SQLite files. The replica is a plain copy of the
+primary that has to be refreshed by hand, which makes replication lag easy
+to see:
+
+    cp db.sqlite3 db-replica.sqlite3
+    DJANGO_SETTINGS_MODULE=Avarion.replica_settings python manage.py runserver
+
+With PostgreSQL, point 'replica' at a streaming replica of 'default'.
+"""
+from .settings import *
+
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+    # Tests run on the primary alone
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_REPLICAS = ['replica']
@@ -0,0 +1,98 @@
+"""
+Routing of reads to read replicas.
+
+Replicas are aliases in DATABASES listed in DATABASE_REPLICAS; they are
+read-only copies of 'default', kept up to date by the database's own
+replication. Only the views that opt in, by having a read_from_replica
+attribute set to True, read from a replica; everything else, and every
+write, goes to 'default'.
+
+ReplicaMiddleware chooses the database a request reads from, once per
+request, so that all its queries see the same copy. A replica lags behind
+the primary by up to REPLICA_LAG seconds, so a client that just wrote
+something would not necessarily see it there. Every request that may
+write (anything but GET, HEAD and OPTIONS) therefore sets a cookie that
+sends the reads of that client to the primary for the next REPLICA_LAG
+seconds, e.g. the essay EssayUpdate redirects to.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+PRIMARY = 'default'
+PIN_COOKIE = 'avarion_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The database the reads of the current request go to
+read_database = ContextVar('avarion_read_database', default=PRIMARY)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_lag():
+    """How long (in seconds) a replica may be behind the primary"""
+    return getattr(settings, 'REPLICA_LAG', 10)
+
+
+def use_primary():
+    """Sends the remaining reads of the current request to the primary"""
+    read_database.set(PRIMARY)
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in get_replicas()
+
+
+class ReplicaMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = read_database.set(PRIMARY)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_database.reset(token)
+
+        if request.method not in SAFE_METHODS and get_replicas():
+            lag = get_lag()
+            response.set_cookie(PIN_COOKIE, str(int(time.time() + lag)), max_age=lag, httponly=True,
+                                samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = get_replicas()
+        view = getattr(view_func, 'view_class', view_func)
+        if not replicas or not getattr(view, 'read_from_replica', False):
+            return None
+        if request.method not in SAFE_METHODS or self.is_pinned(request):
+            return None
+        read_database.set(random.choice(replicas))
+        return None
+
+    @staticmethod
+    def is_pinned(request):
+        """Whether the client wrote something less than REPLICA_LAG seconds ago"""
+        try:
+            return int(request.COOKIES[PIN_COOKIE]) > time.time()
+        except (KeyError, ValueError):
+            return False
@@ -65,10 +65,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Avarion.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Avarion.edge.SignedInCookieMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -96,17 +98,78 @@ WSGI_APPLICATION = 'Avarion.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
+# Transactions take the write lock when they start, so that concurrent
+# edits wait for each other instead of failing, see Avarion/sqlite_backend.
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.dqlite3'),
+        'ENGINE': 'Avarion.sqlite_backend',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # A file rather than the shared in-memory database, which locks whole
+        # tables and fails instead of waiting when threads write at once
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test-db.sqlite3'),
+        },
     }
 }
 
 #db_from_env = dj_database_url.config(conn_max_age=500)
 #DATABASES['default'].update(db_from_env)
 
+# Read replicas
+# Aliases in DATABASES that are read-only copies of 'default'. The essay
+# pages read from one of them, see Avarion/replicas.py and
+# replica_settings.py. REPLICA_LAG is how far (in seconds) a replica may
+# be behind the primary.
+
+DATABASE_REPLICAS = []
+REPLICA_LAG = 10
+DATABASE_ROUTERS = ['Avarion.replicas.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+# The local-memory cache evicts the least recently used entries once
+# MAX_ENTRIES is reached. It holds, among others, the rendered essays.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'avarion',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    }
+}
+
+# The address the site is served at. Sitemaps and feeds are built ahead of
+# any request (see Essay/feeds.py), so their links are made absolute with
+# it rather than with the host of a request.
+
+SITE_URL = 'http://localhost:8000'
+
+
+# Shared caching
+# The essay pages are the same for every visitor and may be kept by a CDN
+# or reverse proxy for EDGE_CACHE_MAX_AGE seconds; the pages showing an
+# essay are purged through EDGE_PURGE_BACKEND when it changes. There is no
+# proxy in development, so purges are only logged. See Avarion/edge.py.
+
+EDGE_CACHE_MAX_AGE = 60 * 60 * 24
+EDGE_PURGE_BACKEND = 'Avarion.edge.LocalPurgeBackend'
+
+
+# Rate limiting
+# How many essays a client may create or edit at once, and per minute on
+# average after that, or None for no limit. The token buckets are kept in
+# the cache named by RATE_LIMIT_CACHE. See Avarion/ratelimit.py.
+
+ESSAY_WRITE_RATE_LIMIT = (10, 10)
+RATE_LIMIT_CACHE = 'default'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -148,4 +211,15 @@ STATIC_URL = '/static/'
 STATIC_ROOT = '/home/WebJournal97/WebJournal97/assets/'
 STATICFILES_DIRS = [
 	os.path.join(BASE_DIR, 'static'),
-]
\ No newline at end of file
+]
+
+
+# Stylesheet bundles
+# Every entry point is built into one minified, hashed and precompressed
+# file by `manage.py build_assets`, see Avarion/assets.py.
+
+ASSET_BUNDLES = [
+    'root/css/base-note.css',
+    'root/css/base-list.css',
+    'root/css/base-edit.css',
+]
@@ -0,0 +1,67 @@
+"""
+Coalescing of concurrent calls doing the same work.
+
+When many requests miss the same cache entry at once (e.g. an essay shared
+right after it was published), each of them would query and render the
+page. With SingleFlight.run, the first one does it and the others wait for
+it and get its result. The calls are coalesced within a process (across
+its threads, e.g. those of a threaded server or of the async views'
+pool); every process does the work at most once.
+
+The function should store what it made where later callers look first
+(e.g. the cache) before returning, and look there first itself: a caller
+arriving just after a flight ended starts a new one.
+"""
+import threading
+
+
+class Call(object):
+    """A call in flight, and once done its result (or the exception it raised)"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: How long (in seconds) a caller waits for a call in
+                flight before making the call itself, or None to wait for
+                as long as it takes
+        """
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def run(self, key, function):
+        """
+        Calls function, unless a call with the same key is in flight, in
+        which case it waits for that one and returns its result (or raises
+        its exception).
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                return function()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
@@ -0,0 +1,44 @@
+"""
+SQLite database backend that runs the PRAGMA statements listed in
+OPTIONS['pragmas'] on every new connection, and starts transactions with
+OPTIONS['transaction_mode'], for example:
+
+    'ENGINE': 'Avarion.sqlite_backend',
+    'OPTIONS': {
+        'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+        'transaction_mode': 'IMMEDIATE',
+    },
+
+SQLite starts a transaction DEFERRED by default: it takes the write lock
+at the first write, not at BEGIN. A transaction that reads and then writes
+(e.g. an essay edit, see EssayUpdate) can then find another one holding
+the lock. SQLite does not wait in that case but fails at once with
+"database is locked", since waiting could deadlock. IMMEDIATE takes the
+write lock at BEGIN, where the busy timeout applies, so concurrent writers
+wait for each other instead.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+    def get_connection_params(self):
+        params = super(DatabaseWrapper, self).get_connection_params()
+        # Not arguments of sqlite3.connect()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'DEFERRED').upper()
+        if mode not in self.TRANSACTION_MODES:
+            raise ValueError("Unknown SQLite transaction mode %r" % mode)
+        self.cursor().execute('BEGIN %s' % mode)
@@ -0,0 +1,154 @@
+import gzip
+import os
+import shutil
+import tempfile
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, modify_settings, override_settings
+from django.urls import reverse
+
+from Essay.models import Essay
+from Essay.views import EssayDetail, EssayUpdate
+
+from . import assets
+from .metrics import MetricsMiddleware, Registry, registry
+from .replicas import PIN_COOKIE, ReplicaMiddleware, ReplicaRouter
+
+
+class RegistryTests(TestCase):
+
+    def test_export_is_cumulative_per_view(self):
+        histograms = Registry()
+        histograms.observe('essay_detail', (0.003, 2, 0.001, 0.0005))
+        histograms.observe('essay_detail', (0.2, 4, 0.05, 0.1))
+        exported = histograms.export()
+        self.assertIn('# TYPE avarion_request_duration_seconds histogram', exported)
+        self.assertIn('avarion_request_duration_seconds_bucket{view="essay_detail",le="0.005"} 1', exported)
+        self.assertIn('avarion_request_duration_seconds_bucket{view="essay_detail",le="+Inf"} 2', exported)
+        self.assertIn('avarion_db_queries_sum{view="essay_detail"} 6.0', exported)
+        self.assertIn('avarion_db_queries_count{view="essay_detail"} 2', exported)
+
+
+@modify_settings(MIDDLEWARE={'prepend': 'Avarion.metrics.MetricsMiddleware'})
+@override_settings(TEMPLATES=[dict(settings.TEMPLATES[0], BACKEND='Avarion.metrics.TimedDjangoTemplates')])
+class MetricsMiddlewareTests(TestCase):
+
+    def setUp(self):
+        registry.clear()
+
+    def test_essay_views_are_measured(self):
+        essay = Essay.essay_manager.create_essay(title='Post #1', content='Text')
+        self.client.get(reverse('essay_update', kwargs={'slug': essay.slug}))
+
+        view = registry.views['essay_update']
+        total, queries, db_time, template_time = view
+        self.assertEqual(total.count, 1)
+        self.assertEqual(queries.sum, 1)
+        self.assertGreater(db_time.sum, 0)
+        self.assertGreater(template_time.sum, 0)
+        self.assertLess(template_time.sum, total.sum)
+
+    def test_metrics_are_for_staff_only(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'avarion_request_duration_seconds', response.content)
+
+    def test_overhead_is_below_50_microseconds(self):
+        response = HttpResponse()
+        request = RequestFactory().get('/')
+
+        def view(request):
+            return response
+
+        middleware = MetricsMiddleware(view)
+        calls = 2000
+        start = perf_counter()
+        for _ in range(calls):
+            view(request)
+        bare = perf_counter() - start
+        start = perf_counter()
+        for _ in range(calls):
+            middleware(request)
+        measured = perf_counter() - start
+        self.assertLess((measured - bare) / calls, 50e-6)
+
+
+class AssetTests(TestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        self.addCleanup(assets.clear_manifest)
+
+    def test_minify_keeps_selector_spaces(self):
+        css = "/* note */\na :hover ,\nb > i {\n    color: red;\n    margin: 0 auto;\n}\n"
+        self.assertEqual(assets.minify(css), "a :hover,b>i{color:red;margin:0 auto}")
+
+    def test_bundle_inlines_imports_and_is_served_precompressed(self):
+        with override_settings(STATIC_ROOT=self.static_root):
+            manifest = assets.build(['root/css/base-note.css'])
+            name = manifest['root/css/base-note.css']
+            self.assertRegex(name, r'^root/css/base-note\.[0-9a-f]{12}\.css$')
+            with open(os.path.join(self.static_root, name)) as f:
+                bundle = f.read()
+            self.assertNotIn('@import', bundle)
+            self.assertIn('.main-body', bundle)
+
+            response = self.client.get(reverse('essay_list', kwargs={'category': Essay.THOUGHTS}))
+            self.assertNotContains(response, 'base-note')
+            self.assertContains(response, 'base-list.css')
+
+            middleware = assets.PrecompressedStaticMiddleware(lambda request: HttpResponse(status=404))
+            request = RequestFactory().get(settings.STATIC_URL + name, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            response = middleware(request)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), bundle)
+            response.close()
+
+            request = RequestFactory().get(settings.STATIC_URL + 'root/css/base.css')
+            self.assertEqual(middleware(request).status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+
+    def route(self, view, method='get', **cookies):
+        """The database the reads of a request to a view go to, and the response"""
+        middleware = ReplicaMiddleware(None)
+        databases = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            databases.append(ReplicaRouter().db_for_read(Essay))
+            return HttpResponse()
+
+        middleware.get_response = get_response
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies)
+        response = middleware(request)
+        return databases[0], response
+
+    def test_opted_in_views_read_from_replica(self):
+        self.assertEqual(self.route(EssayDetail.as_view())[0], 'replica')
+        self.assertEqual(self.route(EssayUpdate.as_view())[0], 'default')
+        self.assertEqual(ReplicaRouter().db_for_read(Essay), 'default')
+        self.assertEqual(ReplicaRouter().db_for_write(Essay), 'default')
+
+    def test_client_reads_from_primary_after_writing(self):
+        database, response = self.route(EssayUpdate.as_view(), method='post')
+        self.assertEqual(database, 'default')
+        pin = response.cookies[PIN_COOKIE].value
+        self.assertEqual(self.route(EssayDetail.as_view(), **{PIN_COOKIE: pin})[0], 'default')
+        self.assertEqual(self.route(EssayDetail.as_view(), **{PIN_COOKIE: '0'})[0], 'replica')
+
+    def test_no_replicas(self):
+        with override_settings(DATABASE_REPLICAS=[]):
+            database, response = self.route(EssayDetail.as_view(), method='post')
+        self.assertEqual(database, 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
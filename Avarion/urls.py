@@ -20,10 +20,15 @@ from django.conf.urls import url, include
 from django.conf import settings
 from django.conf.urls.static import serve
 
-from . import views
+from Essay import views as essay_views
+
+from . import metrics, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics, name='metrics'),
+    url(r'^sitemap\.xml$', essay_views.sitemap_index, name="essay_sitemap_index"),
+    url(r'^sitemap-(?P<part>\d+)\.xml$', essay_views.sitemap, name="essay_sitemap"),
     url(r'^note/', include('Essay.urls')),
     url(r'^$', views.home, name="home"),
 ]
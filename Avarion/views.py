@@ -1,4 +1,8 @@
 from django.shortcuts import render
 
 def home(request):
-	return render(request, 'root/index.html')
\ No newline at end of file
+	return render(request, 'root/index.html')
+
+async def home_async(request):
+	# The page has no database access, so it is rendered on the event loop
+	return render(request, 'root/index.html')
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Essay
+from .models import CategoryCount, Essay, EssayRevision, EssayVersion, Job
 
 # Register your models here.
-admin.site.register(Essay)
\ No newline at end of file
+admin.site.register(Essay)
+admin.site.register(EssayVersion)
+admin.site.register(EssayRevision)
+admin.site.register(CategoryCount)
+admin.site.register(Job)
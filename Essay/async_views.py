@@ -0,0 +1,87 @@
+"""
+Async versions of the read-only Essay views, routed by the ASGI URLconf
+(Avarion/asgi_urls.py).
+
+Under ASGI, Django 3.2 runs every sync view in one shared thread, so a
+sync view waiting on the database holds up every other request of the
+worker. Django 3.2 has no async ORM either (QuerySet.aget and friends
+came with 4.1), so these views do their database work in a pool of
+threads (sync_to_async with thread_sensitive=False), each with its own
+connection, and the event loop keeps serving other requests meanwhile.
+
+A page that is in the page cache (see CachedPageMixin) is answered
+without touching the database at all. The pages are the same for every
+visitor, so the session is not even looked at.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .models import detail_page_cache_key, list_page_cache_key
+from .views import EssayDetail, EssayList, cached_page_response
+
+
+def in_worker_thread(func):
+    """
+    Wraps a sync function into a coroutine function that runs it in a
+    thread of the pool, with the same connection housekeeping Django does
+    around a request.
+    """
+    @wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        return func(*args, **kwargs)
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def rendered_in_worker_thread(view):
+    """
+    Like in_worker_thread, for a view: its TemplateResponse is rendered in
+    the worker thread too, instead of in the shared thread Django would
+    render it in.
+    """
+    @wraps(view)
+    def render_view(request, **kwargs):
+        response = view(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    return in_worker_thread(render_view)
+
+
+get_cached = in_worker_thread(cache.get)
+
+
+async def serve_cached_page(request, key, view, **kwargs):
+    """
+    Serves a page from the page cache of CachedPageMixin if it is there,
+    and through the view otherwise.
+    :param view: A view wrapped with rendered_in_worker_thread
+    """
+    if request.method == 'GET':
+        page = await get_cached(key)
+        if page is not None and 'content' in page:
+            return cached_page_response(request, page)
+    return await view(request, **kwargs)
+
+
+# Never streamed: Django 3.2 iterates a streaming response on the event
+# loop, where the queries reading the content are not allowed
+essay_detail_view = rendered_in_worker_thread(EssayDetail.as_view(stream_threshold=None))
+essay_list_view = rendered_in_worker_thread(EssayList.as_view())
+
+
+async def essay_detail(request, slug):
+    return await serve_cached_page(request, detail_page_cache_key(slug), essay_detail_view, slug=slug)
+
+essay_detail.read_from_replica = EssayDetail.read_from_replica
+
+
+async def essay_list(request, category):
+    if 'before' in request.GET:
+        return await essay_list_view(request, category=category)
+    return await serve_cached_page(request, list_page_cache_key(category), essay_list_view, category=category)
+
+essay_list.read_from_replica = EssayList.read_from_replica
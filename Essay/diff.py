@@ -0,0 +1,90 @@
+"""
+Line-based reverse deltas used to store old essay revisions compactly.
+
+A delta describes how to turn a newer text back into an older one. It is a
+JSON list in which a pair [start, end] means "copy lines start to end of the
+newer text" and a string means "insert this text literally". Since edits
+usually touch a few paragraphs of a long essay, most of a delta is a handful
+of small integer pairs.
+"""
+import json
+from difflib import SequenceMatcher
+
+
+def make_delta(new_text, old_text):
+    """
+    Computes the reverse delta that rebuilds old_text from new_text.
+    :param new_text: The text the delta will be applied to
+    :param old_text: The text the delta will produce
+    :return: The delta, serialized as a JSON string
+    """
+    new_lines = new_text.splitlines(keepends=True)
+    old_lines = old_text.splitlines(keepends=True)
+
+    # An edit usually touches a few lines in the middle of the text. The
+    # unchanged lines around it are matched with plain comparisons, so only
+    # the edited region goes through the (much slower) SequenceMatcher.
+    limit = min(len(new_lines), len(old_lines))
+    prefix = 0
+    while prefix < limit and new_lines[prefix] == old_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and new_lines[-1 - suffix] == old_lines[-1 - suffix]:
+        suffix += 1
+    new_end = len(new_lines) - suffix
+    old_end = len(old_lines) - suffix
+
+    operations = []
+    if prefix:
+        operations.append([0, prefix])
+    matcher = SequenceMatcher(None, new_lines[prefix:new_end], old_lines[prefix:old_end], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append([prefix + i1, prefix + i2])
+        elif j1 != j2:
+            # 'replace' and 'insert' carry the old lines; 'delete' needs nothing
+            operations.append("".join(old_lines[prefix + j1:prefix + j2]))
+    if suffix:
+        operations.append([new_end, len(new_lines)])
+    return json.dumps(operations, separators=(',', ':'))
+
+
+def apply_delta(new_text, delta):
+    """
+    Rebuilds the older text a delta was computed for.
+    :param new_text: The newer text the delta was computed against
+    :param delta: The delta returned by make_delta
+    :return: The older text
+    """
+    new_lines = new_text.splitlines(keepends=True)
+    parts = []
+    for operation in json.loads(delta):
+        if isinstance(operation, list):
+            parts.extend(new_lines[operation[0]:operation[1]])
+        else:
+            parts.append(operation)
+    return "".join(parts)
+
+
+def diff_lines(old_text, new_text, context=3):
+    """
+    Compares two texts line by line for display.
+    :param context: The number of unchanged lines kept around each change
+    :return: A list of hunks, each a list of (tag, line) pairs where the
+            tag is ' ' for an unchanged line, '-' for a removed one and
+            '+' for an added one
+    """
+    old_lines = old_text.splitlines()
+    new_lines = new_text.splitlines()
+    hunks = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for group in matcher.get_grouped_opcodes(context):
+        hunk = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                hunk.extend((' ', line) for line in old_lines[i1:i2])
+                continue
+            hunk.extend(('-', line) for line in old_lines[i1:i2])
+            hunk.extend(('+', line) for line in new_lines[j1:j2])
+        hunks.append(hunk)
+    return hunks
@@ -0,0 +1,143 @@
+"""
+The documents written for crawlers and feed readers: the sitemap index,
+the sitemaps it points to, and an Atom feed per category.
+
+They are built from rows of a few columns (see EssayManager.build_feed
+and friends) and kept in the cache as whole documents in the format of
+CachedPageMixin. A bot fetching them costs one cache lookup. When a
+transaction that changed one of their essays commits, the process that
+made the change removes them from its cache (see clear_documents) and a
+job worker writes them again (see jobs.update_essay). Bulk inserts write
+them in the inserting process instead, see regenerate_documents.
+
+Sitemaps hold at most SITEMAP_SIZE essays each, by primary key, so that
+changing an essay only rebuilds the one sitemap it is listed in.
+"""
+from calendar import timegm
+from datetime import datetime
+from io import StringIO
+import hashlib
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import quote_etag
+from django.utils.timezone import utc
+from django.utils.xmlutils import SimplerXMLGenerator
+
+
+# The number of essays in a category feed, newest first
+FEED_SIZE = 20
+# The number of essays listed in one sitemap (the protocol allows 50,000)
+SITEMAP_SIZE = 10000
+SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+
+def feed_cache_key(category):
+    """The cache key of the Atom feed of a category"""
+    return 'essay:doc:feed:%s' % category.lower()
+
+def sitemap_index_cache_key():
+    """The cache key of the sitemap index"""
+    return 'essay:doc:sitemap'
+
+def sitemap_cache_key(part):
+    """The cache key of the sitemap listing the essays of a part, see sitemap_part"""
+    return 'essay:doc:sitemap:%d' % part
+
+def sitemap_part(pk):
+    """The number of the sitemap an essay is listed in"""
+    return pk // SITEMAP_SIZE
+
+
+def absolute_url(path):
+    return settings.SITE_URL.rstrip('/') + path
+
+def essay_url_format():
+    """
+    The absolute URL of an essay with '{}' for its slug. Resolving the URL
+    once per document instead of once per essay makes building a sitemap
+    several times faster.
+    """
+    placeholder = 'slug-placeholder'
+    return absolute_url(reverse('essay_detail', kwargs={'slug': placeholder})).replace(placeholder, '{}')
+
+def make_document(content, content_type, last_modified):
+    """
+    A document as CachedPageMixin caches pages. The ETag is the hash of the
+    content, so that rebuilding a document that did not change keeps it.
+    """
+    return {
+        'etag': quote_etag(hashlib.md5(content).hexdigest()),
+        'last_modified': timegm(last_modified.utctimetuple()),
+        'content': content,
+        'content_type': content_type,
+    }
+
+
+def atom_feed(category, label, rows):
+    """
+    :param label: The name of the category shown to readers
+    :param rows: (slug, title, excerpt, created_on, modified_on) of the newest
+            published essays of the category, newest first
+    """
+    rows = list(rows)
+    feed = Atom1Feed(
+        title='Avarion: %s' % label,
+        link=absolute_url(reverse('essay_list', kwargs={'category': category})),
+        description='',
+        feed_url=absolute_url(reverse('essay_feed', kwargs={'category': category})),
+        feed_guid=absolute_url(reverse('essay_feed', kwargs={'category': category})),
+    )
+    essay_url = essay_url_format()
+    for slug, title, excerpt, created_on, modified_on in rows:
+        link = essay_url.format(slug)
+        feed.add_item(title=title, link=link, description=excerpt, unique_id=link,
+                      pubdate=created_on, updateddate=modified_on)
+    last_modified = max((row[4] for row in rows), default=EPOCH)
+    return make_document(feed.writeString('utf-8').encode(), feed.content_type, last_modified)
+
+
+def sitemap(rows):
+    """
+    :param rows: (slug, modified_on) of the published essays of a part
+    :return: The sitemap, or None if there are no essays in the part
+    """
+    out = StringIO()
+    handler = SimplerXMLGenerator(out, 'utf-8')
+    handler.startDocument()
+    handler.startElement('urlset', {'xmlns': SITEMAP_NAMESPACE})
+    last_modified = None
+    essay_url = essay_url_format()
+    for slug, modified_on in rows:
+        handler.startElement('url', {})
+        handler.addQuickElement('loc', essay_url.format(slug))
+        handler.addQuickElement('lastmod', modified_on.astimezone(utc).isoformat())
+        handler.endElement('url')
+        last_modified = modified_on if last_modified is None else max(last_modified, modified_on)
+    handler.endElement('urlset')
+    if last_modified is None:
+        return None
+    return make_document(out.getvalue().encode(), 'application/xml; charset=utf-8', last_modified)
+
+
+def sitemap_index(parts):
+    """
+    :param parts: (part, document) of the sitemaps that list essays, see
+            sitemap
+    """
+    out = StringIO()
+    handler = SimplerXMLGenerator(out, 'utf-8')
+    handler.startDocument()
+    handler.startElement('sitemapindex', {'xmlns': SITEMAP_NAMESPACE})
+    last_modified = EPOCH
+    for part, document in parts:
+        modified_on = datetime.fromtimestamp(document['last_modified'], utc)
+        handler.startElement('sitemap', {})
+        handler.addQuickElement('loc', absolute_url(reverse('essay_sitemap', kwargs={'part': part})))
+        handler.addQuickElement('lastmod', modified_on.isoformat())
+        handler.endElement('sitemap')
+        last_modified = max(last_modified, modified_on)
+    handler.endElement('sitemapindex')
+    return make_document(out.getvalue().encode(), 'application/xml; charset=utf-8', last_modified)
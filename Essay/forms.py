@@ -0,0 +1,23 @@
+from django import forms
+
+from .models import Essay, EssayVersion
+
+
+class EssayVersionForm(forms.ModelForm):
+    """
+    The title and content of a version of an essay, and whether it is kept
+    as a draft or published.
+    """
+
+    is_draft = forms.BooleanField(required=False)
+
+    class Meta:
+        model = EssayVersion
+        fields = ['title', 'is_draft', 'content']
+
+
+class EssayCreateForm(EssayVersionForm):
+    category = forms.ChoiceField(choices=Essay.CATEGORY, initial=Essay.THOUGHTS)
+
+    class Meta(EssayVersionForm.Meta):
+        fields = ['title', 'category', 'is_draft', 'content']
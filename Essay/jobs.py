@@ -0,0 +1,130 @@
+"""
+The job queue: work that follows from a change (indexing, rendering,
+rebuilding feeds) done by background workers instead of the request that
+made the change.
+
+Jobs are rows of the Job table, asked for with Job.objects.enqueue in the
+transaction of the change, so that they exist if and only if it commits.
+A job is a name and a key, e.g. 'essay' and the primary key of an essay;
+asking for a job that is already waiting does not add another one. The
+function registered for the name (see handler) is called with the key, and
+has to be idempotent: it works from the state of the database when it
+runs, not from what the change was, so running it twice or late does no
+harm.
+
+Workers (see `manage.py run_workers`) claim due jobs with a lease, so that
+several threads and processes can work on the same table. A job that
+raises is tried again with an exponential backoff, see JobManager.fail.
+"""
+import logging
+import threading
+import traceback
+
+from django.db import close_old_connections, connections, transaction
+
+from . import feeds, search
+from .models import ESSAY_JOB, Essay, Job
+
+
+logger = logging.getLogger(__name__)
+
+# Job name -> the function doing the job, called with the job's key
+handlers = {}
+
+# How long (in seconds) a worker holds the jobs it claimed. A job whose
+# worker died is run again by another one once its lease runs out.
+LEASE = 5 * 60
+
+
+def handler(name):
+    """Registers the decorated function as the one doing the jobs of the given name"""
+    def register(function):
+        handlers[name] = function
+        return function
+    return register
+
+
+@handler(ESSAY_JOB)
+def update_essay(key):
+    """
+    Brings everything derived from an essay up to date with it: its search
+    index entry, the cached HTML of its versions, the feed of its category
+    and the sitemap it is listed in. If the essay is gone, its index entry
+    is removed and the feeds of every category are rebuilt.
+    """
+    pk = int(key)
+    essay = Essay.objects.select_related('published', 'draft').filter(pk=pk).first()
+    with transaction.atomic():
+        if essay is None:
+            search.remove_essay(pk)
+        else:
+            search.index_essay(essay)
+    if essay is None:
+        categories = [category for category, _ in Essay.CATEGORY]
+    else:
+        categories = [essay.category]
+        for version in (essay.published, essay.draft):
+            if version is not None:
+                version.rendered_content()
+    Essay.essay_manager.write_documents(categories, [feeds.sitemap_part(pk)])
+
+
+def run_job(job):
+    """
+    Runs a claimed job and marks it as done, or as failed if it raised.
+    :return: Whether the job succeeded
+    """
+    try:
+        handlers[job.name](job.key)
+    except Exception:
+        logger.exception("Job %s failed (attempt %d)", job, job.attempts + 1)
+        Job.objects.fail(job, traceback.format_exc())
+        return False
+    Job.objects.complete(job)
+    return True
+
+
+def run_due(limit=20):
+    """
+    Claims and runs up to `limit` jobs that are due, one after the other.
+    :return: The number of jobs run
+    """
+    jobs = Job.objects.claim(limit, LEASE)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def work(stop, poll_interval=1.0, batch_size=20):
+    """
+    The loop of a worker thread: runs due jobs until `stop` (a
+    threading.Event) is set, waiting `poll_interval` seconds whenever there
+    are none.
+    """
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                ran = run_due(batch_size)
+            except Exception:
+                # e.g. the database is unavailable; try again later
+                logger.exception("Could not claim jobs")
+                ran = 0
+            if not ran:
+                stop.wait(poll_interval)
+    finally:
+        connections.close_all()
+
+
+def start_workers(count, poll_interval=1.0, batch_size=20):
+    """
+    Starts `count` worker threads.
+    :return: The threading.Event that stops them, and the threads
+    """
+    stop = threading.Event()
+    threads = [threading.Thread(target=work, args=(stop, poll_interval, batch_size),
+                                name='job-worker-%d' % i, daemon=True)
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return stop, threads
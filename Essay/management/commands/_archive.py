@@ -0,0 +1,57 @@
+"""
+The NDJSON archive format shared by export_essays and import_essays.
+
+Every line is one essay: its columns (without the primary key and the
+version pointers), its "published" and "draft" versions (or null) and a
+"revisions" list holding its EssayRevision rows, oldest first. The
+revision deltas are stored as they are, since they only refer to the
+content of the latest version and of each other.
+
+Archives written before essays had versions hold the title and content
+on the essay itself, with is_draft and is_published flags; they are
+still read.
+"""
+from contextlib import contextmanager
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from Essay.models import Essay, EssayRevision, EssayVersion
+
+
+ESSAY_FIELDS = ('slug', 'category', 'created_on', 'modified_on')
+VERSION_FIELDS = ('title', 'content', 'modified_on')
+VERSIONS = ('published', 'draft')
+REVISION_FIELDS = ('number', 'title', 'content_delta', 'modified_on', 'created_on')
+DATETIME_FIELDS = ('created_on', 'modified_on')
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    """
+    Keeps the microseconds of datetimes, which DjangoJSONEncoder drops.
+    EssayList pages by modification time, so the order has to survive.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super(ArchiveEncoder, self).default(o)
+
+
+@contextmanager
+def keep_timestamps():
+    """
+    Turns off auto_now and auto_now_add for the duration of the block, so
+    that bulk inserts keep the creation and modification times they are
+    given instead of stamping the current time.
+    """
+    fields = [field for model in (Essay, EssayVersion, EssayRevision) for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
@@ -0,0 +1,110 @@
+"""
+Helpers shared by the bench_* management commands.
+"""
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.utils import timezone
+
+from Essay.models import Essay, EssayRevision
+
+
+@contextmanager
+def scratch_database(verbosity=0, threaded=False):
+    """
+    Creates a freshly migrated throwaway database (the same one the test
+    runner would use), points the default connection at it for the duration
+    of the block, and destroys it afterwards. This way a benchmark can seed
+    as many rows as it likes without touching the real data.
+
+    Benchmarks that write from several threads should pass threaded=True:
+    SQLite's shared in-memory test database locks whole tables between
+    connections, so a temporary file is used instead.
+    """
+    old_name = connection.settings_dict['NAME']
+    old_test_settings = connection.settings_dict['TEST']
+    temp_dir = None
+    if threaded and connection.vendor == 'sqlite':
+        temp_dir = tempfile.mkdtemp()
+        connection.settings_dict['TEST'] = dict(old_test_settings, NAME=os.path.join(temp_dir, 'bench.sqlite3'))
+
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        connection.settings_dict['TEST'] = old_test_settings
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def time_calls(func, repeat):
+    """
+    Calls func repeat times and returns the duration of every call in seconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Reduces a list of durations in seconds to a dictionary of
+    millisecond statistics.
+    """
+    return {
+        'count': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+
+def seed_essays(rng, essays, revisions, paragraphs, batch_size=1000):
+    """
+    Creates the essays through EssayManager.bulk_create_essays (one in ten
+    is a draft) and spreads the revisions over them. Returns the slugs of
+    the published finals.
+    """
+    categories = [choice for choice, _ in Essay.CATEGORY]
+    words = ["word%d" % i for i in range(2000)]
+
+    def text():
+        return "\n".join(" ".join(rng.choice(words) for _ in range(40)) for _ in range(paragraphs))
+
+    created = Essay.essay_manager.bulk_create_essays([
+        Essay.essay_manager.build('Post #%d' % i, text(), is_draft=(i % 10 == 0),
+                                  category=categories[i % len(categories)])
+        for i in range(essays)
+    ], batch_size=batch_size)
+
+    modified_on = timezone.now()
+    rows = []
+    for i in range(revisions):
+        rows.append(EssayRevision(
+            essay_id=created[i % essays].pk,
+            number=i // essays + 1,
+            title='Post #%d' % (i % essays),
+            content_delta='[[0,%d],"An older paragraph.\\n"]' % (paragraphs - 1),
+            modified_on=modified_on,
+        ))
+        if len(rows) == batch_size:
+            EssayRevision.objects.bulk_create(rows)
+            rows = []
+    EssayRevision.objects.bulk_create(rows)
+    return [essay.slug for essay in created if not essay.is_draft]
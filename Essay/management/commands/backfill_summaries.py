@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Essay.models import Essay, EssayVersion, list_page_cache_key
+
+SUMMARY_FIELDS = ['excerpt', 'word_count', 'reading_minutes']
+
+
+class Command(BaseCommand):
+    help = ("Computes the excerpt, word count and reading time of every essay "
+            "version, e.g. those saved before they were kept. The versions are "
+            "read in batches by primary key, so only one batch of contents is held "
+            "at a time, and each batch is written back with one UPDATE.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of versions read and updated at a time.")
+
+    def handle(self, *args, **options):
+        count = 0
+        last_pk = 0
+        while True:
+            batch = list(EssayVersion.objects.filter(pk__gt=last_pk).order_by('pk')
+                         .only('pk', 'content')[:options['batch_size']])
+            if not batch:
+                break
+            for version in batch:
+                version.summarize()
+            with transaction.atomic():
+                EssayVersion.objects.bulk_update(batch, SUMMARY_FIELDS)
+            last_pk = batch[-1].pk
+            count += len(batch)
+            self.stderr.write("%d versions..." % count)
+
+        # The cached lists were rendered with the old cards
+        cache.delete_many([list_page_cache_key(category) for category, _ in Essay.CATEGORY])
+        self.stderr.write("Updated %d versions" % count)
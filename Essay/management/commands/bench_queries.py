@@ -0,0 +1,95 @@
+import random
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+
+from Essay.models import Essay, EssayRevision
+from Essay.views import EssayDetail, EssayList
+from ._bench import scratch_database, summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = ("Seeds a scratch database with essay revisions and times the "
+            "detail and list lookups with and without the Essay indexes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revisions', type=int, default=100000,
+                            help="Total number of EssayRevision rows to seed.")
+        parser.add_argument('--essays', type=int, default=20000,
+                            help="Number of essays the revisions belong to.")
+        parser.add_argument('--repeat', type=int, default=200,
+                            help="Number of timed lookups per query.")
+
+    def handle(self, *args, **options):
+        with scratch_database() as connection:
+            slugs = self.seed(options['revisions'], options['essays'])
+            indexes = Essay._meta.indexes
+
+            with_indexes = self.measure(slugs, options['repeat'])
+            with connection.schema_editor() as schema_editor:
+                for index in indexes:
+                    schema_editor.remove_index(Essay, index)
+            without_indexes = self.measure(slugs, options['repeat'])
+            with connection.schema_editor() as schema_editor:
+                for index in indexes:
+                    schema_editor.add_index(Essay, index)
+
+        for name in ('detail', 'list'):
+            self.stdout.write("%s query:" % name)
+            for label, results in (('without indexes', without_indexes), ('with indexes', with_indexes)):
+                stats = results[name]
+                self.stdout.write("  %-16s mean %.3f ms  p50 %.3f ms  p95 %.3f ms  p99 %.3f ms" % (
+                    label, stats['mean_ms'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms']))
+
+    def seed(self, revisions, essays, batch_size=1000):
+        """
+        Creates `essays` published essays and spreads `revisions` old
+        versions over them. Returns the slugs of the essays.
+        """
+        categories = [choice for choice, _ in Essay.CATEGORY]
+        content = "A paragraph of an essay.\n" * 20
+
+        Essay.essay_manager.bulk_create_essays([
+            Essay.essay_manager.build('Post #%d' % i, content, is_draft=(i % 10 == 0),
+                                      category=categories[i % len(categories)])
+            for i in range(essays)
+        ], batch_size=batch_size)
+
+        essay_pks = list(Essay.objects.values_list('pk', flat=True))
+        modified_on = timezone.now()
+        rows = []
+        for i in range(revisions):
+            rows.append(EssayRevision(
+                essay_id=essay_pks[i % essays],
+                number=i // essays + 1,
+                title='Post #%d' % (i % essays),
+                content_delta='[[0,19],"An older paragraph.\\n"]',
+                modified_on=modified_on,
+            ))
+            if len(rows) == batch_size:
+                EssayRevision.objects.bulk_create(rows)
+                rows = []
+        EssayRevision.objects.bulk_create(rows)
+        return list(Essay.objects.values_list('slug', flat=True))
+
+    def measure(self, slugs, repeat):
+        detail_view = EssayDetail()
+        list_view = EssayList()
+        list_view.request = RequestFactory().get('/')
+        list_view.request.user = AnonymousUser()
+        categories = [choice for choice, _ in Essay.CATEGORY]
+
+        def detail():
+            detail_view.queryset.get(slug=random.choice(slugs))
+
+        def listing():
+            list_view.kwargs = {'category': random.choice(categories)}
+            list_view.object_list = list_view.get_queryset()
+            list_view.get_context_data()
+
+        return {
+            'detail': summarize(time_calls(detail, repeat)),
+            'list': summarize(time_calls(listing, repeat)),
+        }
@@ -0,0 +1,182 @@
+import json
+import os
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from Essay.models import Essay
+from ._bench import scratch_database, seed_essays, summarize
+
+
+class Command(BaseCommand):
+    help = ("Seeds a scratch database with essays and revisions, then drives the "
+            "detail, list, create and update views through the test client from "
+            "parallel threads. Reports throughput, latency percentiles and queries "
+            "per request as JSON, and fails if a run is slower than a stored baseline. "
+            "Run it with the settings profile to be measured, e.g. "
+            "--settings=Avarion.production_settings.")
+
+    SCENARIOS = ('detail', 'list', 'create', 'update')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--essays', type=int, default=10000,
+                            help="Number of essays to seed.")
+        parser.add_argument('--revisions', type=int, default=50000,
+                            help="Total number of EssayRevision rows to seed.")
+        parser.add_argument('--paragraphs', type=int, default=30,
+                            help="Number of paragraphs per essay.")
+        parser.add_argument('--requests', type=int, default=2000,
+                            help="Number of requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help="Number of threads sending requests at the same time.")
+        parser.add_argument('--scenarios', nargs='+', choices=self.SCENARIOS, default=list(self.SCENARIOS),
+                            help="The scenarios to run.")
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+        parser.add_argument('--baseline', help="JSON report of an earlier run to compare against.")
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Write the report to --baseline instead of comparing against it.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed slowdown against the baseline, as a fraction.")
+
+    def handle(self, *args, **options):
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError("--save-baseline needs --baseline")
+
+        rng = random.Random(0)
+        # One client sends every write, far beyond what the rate limit allows
+        with scratch_database(threaded=True), override_settings(ESSAY_WRITE_RATE_LIMIT=None):
+            slugs = seed_essays(rng, options['essays'], options['revisions'], options['paragraphs'])
+            User.objects.create_user('bench')
+
+            report = {
+                'essays': options['essays'],
+                'revisions': options['revisions'],
+                'concurrency': options['concurrency'],
+                'scenarios': {},
+            }
+            for name in options['scenarios']:
+                cache.clear()
+                report['scenarios'][name] = self.run_scenario(
+                    name, slugs, options['requests'], options['concurrency'], options['paragraphs'])
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as f:
+                f.write(output + '\n')
+        elif options['baseline']:
+            if not os.path.isfile(options['baseline']):
+                raise CommandError("No baseline at %s" % options['baseline'])
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = self.compare(report, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Slower than the baseline:\n  " + "\n  ".join(regressions))
+
+    def make_request(self, name, client, rng, slugs, paragraphs):
+        """Sends one request of a scenario and returns the response"""
+        if name == 'detail':
+            return client.get(reverse('essay_detail', kwargs={'slug': rng.choice(slugs)}))
+        if name == 'list':
+            category = rng.choice([choice for choice, _ in Essay.CATEGORY])
+            return client.get(reverse('essay_list', kwargs={'category': category}))
+        content = "\n".join("Paragraph %d, edit %d." % (i, rng.getrandbits(32)) for i in range(paragraphs))
+        if name == 'create':
+            return client.post(reverse('essay_create'),
+                               {'title': 'Benchmark', 'category': Essay.THOUGHTS, 'content': content})
+        return client.post(reverse('essay_update', kwargs={'slug': rng.choice(slugs)}),
+                           {'title': 'Benchmark', 'content': content})
+
+    def run_scenario(self, name, slugs, requests, concurrency, paragraphs):
+        """
+        Sends `requests` requests of a scenario from `concurrency` threads,
+        each with its own client (logged in for create and update) and its
+        own database connection.
+        """
+        user = User.objects.get(username='bench')
+        clients = []
+        for _ in range(concurrency):
+            # 'testserver', the client's default host, is not in ALLOWED_HOSTS
+            client = Client(SERVER_NAME='localhost')
+            if name in ('create', 'update'):
+                client.force_login(user)
+            clients.append(client)
+        connection.close()
+        results = []
+
+        def worker(index, count):
+            result = {'samples': [], 'queries': 0, 'errors': 0}
+
+            def count_queries(execute, sql, params, many, context):
+                result['queries'] += 1
+                return execute(sql, params, many, context)
+
+            client = clients[index]
+            rng = random.Random(index)
+            try:
+                with connection.execute_wrapper(count_queries):
+                    for _ in range(count):
+                        start = time.perf_counter()
+                        try:
+                            response = self.make_request(name, client, rng, slugs, paragraphs)
+                        except Exception:
+                            # The test client re-raises what the view raised
+                            result['errors'] += 1
+                            continue
+                        result['samples'].append(time.perf_counter() - start)
+                        if response.status_code >= 400:
+                            result['errors'] += 1
+            finally:
+                connection.close()
+                results.append(result)
+
+        per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0)
+                      for i in range(concurrency)]
+        threads = [threading.Thread(target=worker, args=(i, count)) for i, count in enumerate(per_thread)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        samples = [sample for result in results for sample in result['samples']]
+        if not samples:
+            raise CommandError("Every %s request failed" % name)
+        stats = summarize(samples)
+        stats['throughput_rps'] = len(samples) / elapsed
+        stats['queries_per_request'] = sum(result['queries'] for result in results) / float(requests)
+        stats['errors'] = sum(result['errors'] for result in results)
+        return stats
+
+    @staticmethod
+    def compare(report, baseline, tolerance):
+        """
+        :return: A description of every scenario that is slower (higher p95,
+                lower throughput) or runs more queries than in the baseline
+        """
+        regressions = []
+        for name, stats in sorted(report['scenarios'].items()):
+            before = baseline.get('scenarios', {}).get(name)
+            if before is None:
+                continue
+            if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append("%s: p95 %.2f ms, baseline %.2f ms" % (name, stats['p95_ms'], before['p95_ms']))
+            if stats['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+                regressions.append("%s: %.1f requests/s, baseline %.1f requests/s" % (
+                    name, stats['throughput_rps'], before['throughput_rps']))
+            if stats['queries_per_request'] > before['queries_per_request'] + 0.5:
+                regressions.append("%s: %.2f queries per request, baseline %.2f" % (
+                    name, stats['queries_per_request'], before['queries_per_request']))
+        return regressions
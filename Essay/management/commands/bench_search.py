@@ -0,0 +1,59 @@
+import random
+import string
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Essay import search
+from Essay.models import Essay
+from Essay.views import EssaySearch
+from ._bench import percentile, scratch_database, summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = ("Seeds a scratch database with essays, builds the search index and "
+            "reports the latency of random one and two word searches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--essays', type=int, default=100000,
+                            help="Number of published essays to seed.")
+        parser.add_argument('--words', type=int, default=300,
+                            help="Number of words per essay.")
+        parser.add_argument('--vocabulary', type=int, default=20000,
+                            help="Number of distinct words the essays are made of.")
+        parser.add_argument('--repeat', type=int, default=500,
+                            help="Number of timed searches.")
+        parser.add_argument('--target', type=float, default=20.0,
+                            help="p95 latency (ms) the run has to stay under.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        vocabulary = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+                      for _ in range(options['vocabulary'])]
+
+        with scratch_database():
+            self.seed(rng, vocabulary, options['essays'], options['words'])
+            queryset = Essay.objects.filter(published__isnull=False).select_related('published').only(
+                'slug', 'modified_on', 'published', 'published__title')
+
+            def run_search():
+                query = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 2)))
+                search.search(queryset, query, limit=EssaySearch.max_results)
+
+            samples = time_calls(run_search, options['repeat'])
+
+        stats = summarize(samples)
+        self.stdout.write("%d searches over %d essays: mean %.2f ms  p50 %.2f ms  p95 %.2f ms  p99 %.2f ms" % (
+            stats['count'], options['essays'], stats['mean_ms'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms']))
+        if percentile(samples, 95) * 1000 > options['target']:
+            raise CommandError("p95 is above the %.1f ms target" % options['target'])
+
+    def seed(self, rng, vocabulary, essays, words, batch_size=1000):
+        """
+        Bulk inserts the essays (bypassing Essay.save), indexing each batch
+        at once.
+        """
+        Essay.essay_manager.bulk_create_essays([
+            Essay.essay_manager.build(" ".join(rng.choice(vocabulary) for _ in range(4)),
+                                      " ".join(rng.choice(vocabulary) for _ in range(words)))
+            for i in range(essays)
+        ], batch_size=batch_size)
@@ -0,0 +1,156 @@
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from Essay.models import Essay
+from ._bench import scratch_database, seed_essays, summarize
+
+
+class Command(BaseCommand):
+    help = ("Seeds a scratch database, starts the WSGI (runserver, threaded) and the "
+            "ASGI (uvicorn) entry points on it one after the other, each as a single "
+            "local process, and measures their throughput and latency under many "
+            "concurrent clients reading essay and list pages. Needs uvicorn.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--essays', type=int, default=10000,
+                            help="Number of essays to seed.")
+        parser.add_argument('--clients', type=int, default=500,
+                            help="Number of simulated clients sending requests at the same time.")
+        parser.add_argument('--duration', type=float, default=20.0,
+                            help="Seconds of load per server.")
+        parser.add_argument('--servers', nargs='+', choices=('wsgi', 'asgi'), default=['wsgi', 'asgi'],
+                            help="The servers to measure.")
+
+    def handle(self, *args, **options):
+        if 'asgi' in options['servers'] and importlib.util.find_spec('uvicorn') is None:
+            raise CommandError("The ASGI server needs uvicorn (pip install uvicorn)")
+
+        report = {'essays': options['essays'], 'clients': options['clients'], 'servers': {}}
+        with scratch_database(threaded=True), tempfile.TemporaryDirectory() as temp_dir:
+            slugs = seed_essays(random.Random(0), options['essays'], 0, 30)
+            paths = ['/note/%s/' % slug for slug in slugs]
+            paths += ['/note/all/%s/' % category for category, _ in Essay.CATEGORY]
+            database = connection.settings_dict['NAME']
+            connection.close()
+
+            for server in options['servers']:
+                port = self.free_port()
+                with self.run_server(server, port, database, temp_dir):
+                    report['servers'][server] = asyncio.run(
+                        self.load(port, paths, options['clients'], options['duration']))
+
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def run_server(self, server, port, database, temp_dir):
+        """
+        Starts a server process on the scratch database, with a settings
+        module of its own, and stops it when the block ends.
+        """
+        profile = 'Avarion.asgi_settings' if server == 'asgi' else 'Avarion.production_settings'
+        module = 'bench_%s_settings' % server
+        with open(os.path.join(temp_dir, module + '.py'), 'w') as f:
+            f.write("from %s import *\n" % profile)
+            f.write("DATABASES['default']['NAME'] = %r\n" % database)
+        env = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE=module,
+                   PYTHONPATH=os.pathsep.join([temp_dir, settings.BASE_DIR, os.environ.get('PYTHONPATH', '')]),
+                   AVARION_CACHE_DIR=os.path.join(temp_dir, 'cache-%s' % server))
+        if server == 'asgi':
+            command = [sys.executable, '-m', 'uvicorn', 'Avarion.asgi:application',
+                       '--port', str(port), '--log-level', 'warning', '--no-access-log']
+        else:
+            command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'runserver',
+                       '127.0.0.1:%d' % port, '--noreload']
+        return ServerProcess(command, env, port, os.path.join(temp_dir, '%s.log' % server))
+
+    async def load(self, port, paths, clients, duration):
+        """
+        Runs `clients` clients for `duration` seconds. Every client sends one
+        request per connection (Connection: close) and waits for the whole
+        response before sending the next one.
+        """
+        samples = []
+        errors = [0]
+        deadline = time.perf_counter() + duration
+
+        async def client(rng):
+            while time.perf_counter() < deadline:
+                path = rng.choice(paths)
+                start = time.perf_counter()
+                try:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                    writer.write(('GET %s HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'
+                                  % path).encode('ascii'))
+                    await writer.drain()
+                    response = await reader.read()
+                    writer.close()
+                except OSError:
+                    errors[0] += 1
+                    continue
+                if response.split(b' ', 2)[1:2] == [b'200']:
+                    samples.append(time.perf_counter() - start)
+                else:
+                    errors[0] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(random.Random(i)) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+        if not samples:
+            raise CommandError("Every request failed")
+        stats = summarize(samples)
+        stats['throughput_rps'] = len(samples) / elapsed
+        stats['errors'] = errors[0]
+        return stats
+
+
+class ServerProcess(object):
+    """Context manager running a server process until the block ends"""
+
+    def __init__(self, command, env, port, log_path, timeout=30):
+        self.command = command
+        self.env = env
+        self.port = port
+        self.log_path = log_path
+        self.timeout = timeout
+
+    def __enter__(self):
+        # The output goes to a file, a pipe nobody reads would fill up and block the server
+        with open(self.log_path, 'wb') as log:
+            self.process = subprocess.Popen(self.command, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                with open(self.log_path) as log:
+                    raise CommandError("%s exited:\n%s" % (self.command[2], log.read()))
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.process.kill()
+        raise CommandError("%s did not start listening on port %d" % (self.command[2], self.port))
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
@@ -0,0 +1,80 @@
+import random
+import string
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection
+
+from Essay.models import Essay
+from ._bench import scratch_database
+
+
+def legacy_gen_slug(size=11, chars=string.ascii_letters + string.digits + "_"):
+    """
+    The slug generator EssayManager used to have: draw a random slug and look
+    it up, up to 10 times, before saving. Kept here for comparison only.
+    """
+    for _ in range(10):
+        new_slug = "".join(random.choice(chars) for _ in range(size))
+        if not Essay.objects.filter(slug=new_slug).exists():
+            return new_slug
+    return legacy_gen_slug(size=size + 1)
+
+
+class Command(BaseCommand):
+    help = ("Creates essays from parallel threads in a scratch database and "
+            "reports throughput, queries per insert and failed inserts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--essays', type=int, default=5000,
+                            help="Total number of essays to create.")
+        parser.add_argument('--threads', type=int, default=8,
+                            help="Number of threads creating essays concurrently.")
+        parser.add_argument('--legacy', action='store_true',
+                            help="Generate slugs with the old lookup-per-attempt generator.")
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        per_thread = options['essays'] // threads
+        results = []
+
+        with scratch_database(threaded=True):
+            workers = [threading.Thread(target=self.create_essays, args=(per_thread, options['legacy'], results))
+                       for _ in range(threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            unique_slugs = Essay.objects.values('slug').distinct().count()
+
+        created = sum(result['created'] for result in results)
+        queries = sum(result['queries'] for result in results)
+        failed = sum(result['failed'] for result in results)
+        self.stdout.write("created %d essays from %d threads in %.2f s (%.0f essays/s)" % (
+            created, threads, elapsed, created / elapsed))
+        self.stdout.write("queries per insert: %.2f" % (queries / max(created, 1)))
+        self.stdout.write("failed inserts: %d, distinct slugs: %d" % (failed, unique_slugs))
+
+    def create_essays(self, count, legacy, results):
+        result = {'created': 0, 'queries': 0, 'failed': 0}
+
+        def count_queries(execute, sql, params, many, context):
+            result['queries'] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(count_queries):
+                for i in range(count):
+                    fields = {'slug': legacy_gen_slug()} if legacy else {}
+                    try:
+                        Essay.essay_manager.create_essay('Post #%d' % i, 'Text', **fields)
+                    except IntegrityError:
+                        result['failed'] += 1
+                    else:
+                        result['created'] += 1
+        finally:
+            connection.close()
+        results.append(result)
@@ -0,0 +1,132 @@
+import json
+import os
+import random
+import resource
+import statistics
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from Essay.models import Essay
+from Essay.views import EssayDetail
+from ._bench import scratch_database
+
+
+def current_rss():
+    """The resident set size of this process in bytes (Linux only)"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Command(BaseCommand):
+    help = ("Seeds a scratch database with one very long essay and requests its page "
+            "with the page and HTML caches empty, rendered whole and streamed (see "
+            "EssayDetail.stream). Reports the time to the first byte, the time to the "
+            "last byte and how much the resident set size of the process grew, as JSON. "
+            "Every request runs in a forked process of its own, so that one does not "
+            "inherit the memory of another.")
+
+    MODES = ('rendered', 'streamed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=500000,
+                            help="Number of words of the essay.")
+        parser.add_argument('--paragraph-words', type=int, default=100,
+                            help="Number of words per paragraph.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Number of requests per mode.")
+        parser.add_argument('--read-size', type=int, default=EssayDetail.stream_read_size,
+                            help="Characters read from the database at a time when streaming.")
+        parser.add_argument('--chunk-size', type=int, default=EssayDetail.stream_chunk_size,
+                            help="Characters sent at a time when streaming.")
+
+    def handle(self, *args, **options):
+        if not hasattr(os, 'fork') or not os.path.exists('/proc/self/statm'):
+            raise CommandError("This benchmark needs fork() and /proc (Linux)")
+
+        rng = random.Random(0)
+        words = ["word%d" % i for i in range(2000)]
+        paragraphs = [" ".join(rng.choice(words) for _ in range(options['paragraph_words']))
+                      for _ in range(options['words'] // options['paragraph_words'])]
+        content = "\n\n".join(paragraphs)
+        del paragraphs
+
+        with scratch_database(threaded=True):
+            essay = Essay.essay_manager.create_essay('Long essay', content)
+            url = reverse('essay_detail', kwargs={'slug': essay.slug})
+            del content, essay
+            connection.close()
+
+            report = {
+                'words': options['words'],
+                'read_size': options['read_size'],
+                'chunk_size': options['chunk_size'],
+                'modes': {},
+            }
+            for mode in self.MODES:
+                samples = [self.run_in_child(mode, url, options['read_size'], options['chunk_size'])
+                           for _ in range(options['repeat'])]
+                report['modes'][mode] = {
+                    'ttfb_ms': statistics.median(sample['ttfb'] for sample in samples) * 1000,
+                    'total_ms': statistics.median(sample['total'] for sample in samples) * 1000,
+                    'rss_growth_mb': max(sample['rss_growth'] for sample in samples) / 2**20,
+                    'bytes': samples[0]['bytes'],
+                }
+
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+
+    def run_in_child(self, mode, url, read_size, chunk_size):
+        """Requests the page once in a forked process and returns its measurements"""
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            status = 0
+            try:
+                sample = self.request(mode, url, read_size, chunk_size)
+                with os.fdopen(write_end, 'w') as f:
+                    json.dump(sample, f)
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+
+        os.close(write_end)
+        with os.fdopen(read_end) as f:
+            output = f.read()
+        _, status = os.waitpid(pid, 0)
+        if status != 0 or not output:
+            raise CommandError("The %s request failed" % mode)
+        return json.loads(output)
+
+    def request(self, mode, url, read_size, chunk_size):
+        """
+        Sends one request and reads the response the way a server writing
+        it to a socket would, one piece at a time, keeping none of them.
+        """
+        cache.clear()
+        # 'testserver', the client's default host, is not in ALLOWED_HOSTS
+        client = Client(SERVER_NAME='localhost')
+        threshold = None if mode == 'rendered' else 0
+        with mock.patch.multiple(EssayDetail, stream_threshold=threshold, stream_read_size=read_size,
+                                 stream_chunk_size=chunk_size):
+            rss_before = current_rss()
+            start = time.perf_counter()
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError("Got a %d" % response.status_code)
+            size = 0
+            ttfb = None
+            for chunk in response:
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                size += len(chunk)
+            total = time.perf_counter() - start
+        # ru_maxrss is in kilobytes on Linux
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - rss_before
+        return {'ttfb': ttfb, 'total': total, 'rss_growth': max(rss_growth, 0), 'bytes': size}
@@ -0,0 +1,24 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from Avarion import assets
+
+
+class Command(BaseCommand):
+    help = ("Runs collectstatic, then bundles every stylesheet in ASSET_BUNDLES into "
+            "one minified file with a content hash in its name, with .gz (and .br, "
+            "if brotli is installed) siblings, and writes the manifest the asset_url "
+            "tag reads.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-collectstatic', action='store_true',
+                            help="Only build the bundles.")
+
+    def handle(self, *args, **options):
+        if not options['skip_collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
+        manifest = assets.build()
+        for path, name in sorted(manifest.items()):
+            self.stdout.write("%s -> %s" % (path, name))
+        if assets.brotli is None:
+            self.stdout.write("brotli is not installed, no .br files were written")
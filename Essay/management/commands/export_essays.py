@@ -0,0 +1,61 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Essay.models import Essay, EssayRevision
+from ._archive import ESSAY_FIELDS, REVISION_FIELDS, VERSION_FIELDS, VERSIONS, ArchiveEncoder
+
+
+class Command(BaseCommand):
+    help = ("Writes every essay, with its revisions, as one JSON object per line. "
+            "Essays and revisions are streamed from two queries walked side by side, "
+            "so memory use does not depend on the size of the archive.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help="The file to write to, or - for standard output.")
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Number of rows fetched from the database at a time.")
+
+    def handle(self, *args, **options):
+        out = self.stdout if options['output'] == '-' else open(options['output'], 'w')
+        try:
+            # One transaction, so that essays and revisions come from the same snapshot
+            with transaction.atomic():
+                count = self.export(out, options['chunk_size'])
+        finally:
+            if out is not self.stdout:
+                out.close()
+        self.stderr.write("Exported %d essays" % count)
+
+    def export(self, out, chunk_size):
+        encoder = ArchiveEncoder(separators=(',', ':'))
+        version_columns = ['%s__%s' % (version, field) for version in VERSIONS for field in VERSION_FIELDS]
+        essays = (Essay.objects.order_by('pk').values('pk', *(ESSAY_FIELDS + VERSIONS), *version_columns)
+                  .iterator(chunk_size=chunk_size))
+        revisions = groupby(
+            EssayRevision.objects.order_by('essay_id', 'number')
+            .values('essay_id', *REVISION_FIELDS).iterator(chunk_size=chunk_size),
+            key=lambda revision: revision['essay_id'])
+
+        count = 0
+        essay_id, group = next(revisions, (None, None))
+        for essay in essays:
+            pk = essay.pop('pk')
+            for version in VERSIONS:
+                fields = {field: essay.pop('%s__%s' % (version, field)) for field in VERSION_FIELDS}
+                essay[version] = fields if essay[version] is not None else None
+            essay['revisions'] = []
+            # Both queries are ordered by essay, so the revisions of this
+            # essay (if it has any) are the next group
+            while essay_id is not None and essay_id < pk:
+                essay_id, group = next(revisions, (None, None))
+            if essay_id == pk:
+                for revision in group:
+                    del revision['essay_id']
+                    essay['revisions'].append(revision)
+                essay_id, group = next(revisions, (None, None))
+            out.write(encoder.encode(essay) + '\n')
+            count += 1
+        return count
@@ -0,0 +1,82 @@
+import json
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils.dateparse import parse_datetime
+
+from Essay.models import Essay, EssayRevision, EssayVersion
+from ._archive import DATETIME_FIELDS, ESSAY_FIELDS, REVISION_FIELDS, VERSION_FIELDS, VERSIONS, keep_timestamps
+
+
+class Command(BaseCommand):
+    help = ("Reads essays written by export_essays and inserts them, with their "
+            "revisions, in batches. Each batch is one transaction with one INSERT "
+            "for its essays and one for their revisions. The slugs of the archive "
+            "are kept; essays without one get a generated slug.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', default='-',
+                            help="The file to read, or - for standard input.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of essays inserted at a time.")
+
+    def handle(self, *args, **options):
+        lines = sys.stdin if options['input'] == '-' else open(options['input'])
+        essays = revisions = 0
+        try:
+            with keep_timestamps():
+                while True:
+                    batch = list(islice(lines, options['batch_size']))
+                    if not batch:
+                        break
+                    try:
+                        imported = self.import_batch(batch)
+                    except IntegrityError as e:
+                        raise CommandError("Could not import essays %d to %d: %s" % (
+                            essays + 1, essays + len(batch), e))
+                    essays += len(batch)
+                    revisions += imported
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        self.stderr.write("Imported %d essays and %d revisions" % (essays, revisions))
+
+    def import_batch(self, lines):
+        """
+        Inserts the essays of a batch of lines, then their revisions.
+        :return: The number of revisions inserted
+        """
+        records = [json.loads(line) for line in lines if line.strip()]
+        essays = [self.build(record) for record in records]
+
+        with transaction.atomic():
+            Essay.essay_manager.bulk_create_essays(essays, batch_size=len(essays) or 1)
+            revisions = [EssayRevision(essay_id=essay.pk, **self.parse(revision, REVISION_FIELDS))
+                         for essay, record in zip(essays, records)
+                         for revision in record.get('revisions', ())]
+            EssayRevision.objects.bulk_create(revisions)
+        return len(revisions)
+
+    def build(self, record):
+        """An unsaved Essay, with its unsaved versions, from a JSON record"""
+        fields = self.parse(record, ESSAY_FIELDS)
+        if 'content' in record:
+            # An archive from before essays had versions
+            is_draft = record.get('is_draft', False) or not record.get('is_published', True)
+            return Essay.essay_manager.build(record['title'], record['content'], is_draft=is_draft, **fields)
+        essay = Essay(**fields)
+        for version in VERSIONS:
+            if record.get(version):
+                setattr(essay, version, EssayVersion(**self.parse(record[version], VERSION_FIELDS)))
+        return essay
+
+    @staticmethod
+    def parse(record, fields):
+        """The values of the given fields in a JSON record, with the dates parsed"""
+        values = {field: record[field] for field in fields if field in record}
+        for field in DATETIME_FIELDS:
+            if values.get(field):
+                values[field] = parse_datetime(values[field])
+        return values
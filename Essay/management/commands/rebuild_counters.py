@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from Essay.models import CategoryCount
+
+
+class Command(BaseCommand):
+    help = ("Recounts the published essays of every category, drafts and finals "
+            "apart, and replaces the counts kept in CategoryCount with the result.")
+
+    def handle(self, *args, **options):
+        counts = CategoryCount.objects.rebuild()
+        for (category, is_draft), count in sorted(counts.items()):
+            self.stdout.write("%s %s: %d" % (category, 'drafts' if is_draft else 'finals', count))
@@ -0,0 +1,43 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from Essay import jobs
+
+
+class Command(BaseCommand):
+    help = ("Runs the jobs asked for by essay saves (search indexing, rendering, "
+            "feeds and sitemaps) in a pool of worker threads until interrupted. "
+            "Several of these processes can run against the same database; each "
+            "job is claimed by one worker at a time, see Essay/jobs.py.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2,
+                            help="Number of worker threads.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds a worker waits before looking again when no job is due.")
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help="Number of jobs a worker claims at a time.")
+        parser.add_argument('--once', action='store_true',
+                            help="Run the jobs that are due in this process, then exit.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = 0
+            while True:
+                ran = jobs.run_due(options['batch_size'])
+                if not ran:
+                    break
+                count += ran
+            self.stderr.write("Ran %d jobs" % count)
+            return
+
+        stop, threads = jobs.start_workers(options['threads'], options['poll_interval'], options['batch_size'])
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+        self.stderr.write("Started %d workers" % len(threads))
+        while not stop.is_set():
+            stop.wait(1)
+        for thread in threads:
+            thread.join()
+        self.stderr.write("Stopped")
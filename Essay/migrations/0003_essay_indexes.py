@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-17 16:10
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def lower_categories(apps, schema_editor):
+    Essay = apps.get_model('Essay', 'Essay')
+    Essay.objects.exclude(category=Lower('category')).update(category=Lower('category'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0002_essay_is_draft'),
+    ]
+
+    operations = [
+        migrations.RunPython(lower_categories, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='essay',
+            name='is_draft',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='essay',
+            index=models.Index(fields=['slug', 'is_published'], name='essay_slug_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='essay',
+            index=models.Index(fields=['category', 'is_published', 'is_draft', '-modified_on'], name='essay_category_state_idx'),
+        ),
+    ]
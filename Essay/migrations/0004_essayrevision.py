@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-17 16:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0003_essay_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EssayRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=100)),
+                ('content_delta', models.TextField()),
+                ('modified_on', models.DateTimeField()),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('essay', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='Essay.essay')),
+            ],
+            options={
+                'unique_together': {('essay', 'number')},
+            },
+        ),
+    ]
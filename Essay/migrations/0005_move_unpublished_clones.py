@@ -0,0 +1,85 @@
+from django.db import migrations
+from django.utils import timezone
+
+from Essay.diff import make_delta
+
+
+DRAFT_SLUG_APPEND = '--'
+
+
+def find_owner(Essay, clone):
+    """
+    Finds the published essay an unpublished clone belongs to. Clones of
+    published essays and of their draft copies (the slug of the essay
+    followed by '--') share the slug of the published essay; those of a
+    draft copy are drafts made after the copy was split off, which is when
+    the published row was created. Clones of drafts that were never
+    published lost the last two characters of their slug when they were
+    saved, so those are matched on the remaining prefix, whether or not the
+    draft was published since. The clone saved when a draft copy was
+    published kept the slug of the copy.
+    """
+    slug = clone.slug
+    published = Essay.objects.filter(is_published=True)
+    if clone.is_draft:
+        copy = published.filter(slug=slug + DRAFT_SLUG_APPEND, is_draft=True).first()
+        final = published.filter(slug=slug, is_draft=False).first()
+        if copy is not None and (final is None or clone.modified_on >= final.created_on):
+            return copy
+    for candidates in (published.filter(slug=slug, is_draft=False),
+                       published.filter(slug=slug),
+                       published.filter(slug=slug + DRAFT_SLUG_APPEND)):
+        owner = candidates.first()
+        if owner is not None:
+            return owner
+    for owner in published.filter(slug__startswith=slug).order_by('pk'):
+        if len(owner.slug) == len(slug) + len(DRAFT_SLUG_APPEND):
+            return owner
+    if slug.endswith(DRAFT_SLUG_APPEND):
+        return published.filter(slug=slug[:-len(DRAFT_SLUG_APPEND)], is_draft=False).first()
+    return None
+
+
+def move_clones(apps, schema_editor):
+    Essay = apps.get_model('Essay', 'Essay')
+    EssayRevision = apps.get_model('Essay', 'EssayRevision')
+
+    owners = {}
+    clone_pks = {}
+    clones = Essay.objects.filter(is_published=False).only('slug', 'is_draft', 'modified_on').order_by('pk')
+    for clone in list(clones):
+        owner = find_owner(Essay, clone)
+        if owner is None:
+            # Nothing left to attach the history to; keep the row as it is
+            continue
+        owners[owner.pk] = owner
+        clone_pks.setdefault(owner.pk, []).append(clone.pk)
+
+    for owner_pk, pks in clone_pks.items():
+        owner = owners[owner_pk]
+        clones = list(Essay.objects.filter(pk__in=pks).order_by('modified_on', 'pk'))
+        # Every clone is stored as a delta against the version that replaced it
+        newer_contents = [clone.content for clone in clones[1:]] + [owner.content]
+        revisions = []
+        for number, (clone, newer_content) in enumerate(zip(clones, newer_contents), start=1):
+            revisions.append(EssayRevision(
+                essay=owner,
+                number=number,
+                title=clone.title,
+                content_delta=make_delta(newer_content, clone.content),
+                modified_on=clone.modified_on,
+                created_on=timezone.now(),
+            ))
+        EssayRevision.objects.bulk_create(revisions)
+        Essay.objects.filter(pk__in=pks).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0004_essayrevision'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_clones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def rename_duplicate_slugs(apps, schema_editor):
+    """
+    Only the unpublished clones 0005 could not attach to an essay can still
+    share a slug. They get a unique slug derived from their primary key; the
+    published essay keeps the original one.
+    """
+    Essay = apps.get_model('Essay', 'Essay')
+    duplicates = (Essay.objects.values('slug').order_by()
+                  .annotate(rows=Count('pk')).filter(rows__gt=1).values_list('slug', flat=True))
+    for slug in list(duplicates):
+        rows = Essay.objects.filter(slug=slug).order_by('-is_published', '-modified_on')
+        for essay in list(rows)[1:]:
+            Essay.objects.filter(pk=essay.pk).update(slug='%s-%d' % (slug[:38], essay.pk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0005_move_unpublished_clones'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0006_rename_duplicate_slugs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='essay',
+            name='slug',
+            field=models.SlugField(unique=True),
+        ),
+    ]
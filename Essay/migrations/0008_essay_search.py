@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from Essay import search
+
+
+def create_search_index(apps, schema_editor):
+    Essay = apps.get_model('Essay', 'Essay')
+    search.create_index(schema_editor.connection)
+    search.rebuild_index(Essay._meta.db_table, schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0007_essay_slug_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:26
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+DRAFT_SLUG_APPEND = '--'
+
+
+def count_essays(apps, schema_editor):
+    Essay = apps.get_model('Essay', 'Essay')
+    CategoryCount = apps.get_model('Essay', 'CategoryCount')
+    # Draft copies of published essays are not counted
+    counts = Counter()
+    rows = Essay.objects.filter(is_published=True).values_list('slug', 'category', 'is_draft')
+    for slug, category, is_draft in rows.iterator():
+        if not slug.endswith(DRAFT_SLUG_APPEND):
+            counts[category, is_draft] += 1
+    CategoryCount.objects.bulk_create(CategoryCount(category=category, is_draft=is_draft, count=count)
+                                      for (category, is_draft), count in counts.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0008_essay_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=20)),
+                ('is_draft', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('category', 'is_draft')},
+            },
+        ),
+        migrations.RunPython(count_essays, migrations.RunPython.noop),
+    ]
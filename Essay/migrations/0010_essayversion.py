@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0009_categorycount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EssayVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('content', models.TextField()),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='essayversion',
+            name='essay',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='Essay.essay'),
+        ),
+        migrations.AddField(
+            model_name='essay',
+            name='draft',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='Essay.essayversion'),
+        ),
+        migrations.AddField(
+            model_name='essay',
+            name='published',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='Essay.essayversion'),
+        ),
+    ]
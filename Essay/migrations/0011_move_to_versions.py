@@ -0,0 +1,99 @@
+from collections import Counter
+
+from django.db import migrations
+from django.db.models import F, Max
+
+from Essay.diff import apply_delta, make_delta
+
+
+DRAFT_SLUG_APPEND = '--'
+
+
+def create_versions(Essay, EssayVersion):
+    """
+    Moves the title and content of every essay into an EssayVersion: its
+    draft if it was a draft (or unpublished), its published version
+    otherwise.
+    """
+    for pk in list(Essay.objects.order_by('pk').values_list('pk', flat=True)):
+        essay = Essay.objects.get(pk=pk)
+        version = EssayVersion.objects.create(essay_id=essay.pk, title=essay.title, content=essay.content)
+        # create() stamps the current time
+        EssayVersion.objects.filter(pk=version.pk).update(modified_on=essay.modified_on)
+        if essay.is_draft or not essay.is_published:
+            Essay.objects.filter(pk=essay.pk).update(draft=version)
+        else:
+            Essay.objects.filter(pk=essay.pk).update(published=version)
+
+
+def fold_draft_copies(Essay, EssayVersion, EssayRevision):
+    """
+    Makes every draft copy (the slug of a published essay followed by '--')
+    the draft of the essay it was copied from. The history of the essay
+    continues with that of the copy: the essay's own revisions, then its
+    published version, then the revisions of the copy. Copies whose essay
+    is gone, or already has a draft, are left as essays of their own.
+    """
+    copies = Essay.objects.filter(slug__endswith=DRAFT_SLUG_APPEND).order_by('pk')
+    for copy in list(copies):
+        owner = Essay.objects.filter(slug=copy.slug[:-len(DRAFT_SLUG_APPEND)], published__isnull=False,
+                                     draft__isnull=True).first()
+        if owner is None:
+            continue
+        draft = EssayVersion.objects.get(pk=copy.draft_id or copy.published_id)
+        published = EssayVersion.objects.get(pk=owner.published_id)
+
+        # The published version is followed by the oldest version of the copy
+        copy_revisions = EssayRevision.objects.filter(essay_id=copy.pk)
+        oldest_copy_content = draft.content
+        for revision in copy_revisions.order_by('-number').iterator():
+            oldest_copy_content = apply_delta(oldest_copy_content, revision.content_delta)
+
+        last_number = EssayRevision.objects.filter(essay_id=owner.pk).aggregate(last=Max('number'))['last'] or 0
+        EssayRevision.objects.create(
+            essay_id=owner.pk,
+            number=last_number + 1,
+            title=published.title,
+            content_delta=make_delta(oldest_copy_content, published.content),
+            modified_on=published.modified_on,
+        )
+        copy_revisions.update(essay_id=owner.pk, number=F('number') + last_number + 1)
+
+        EssayVersion.objects.filter(pk=draft.pk).update(essay_id=owner.pk)
+        Essay.objects.filter(pk=copy.pk).update(published=None, draft=None)
+        Essay.objects.filter(pk=owner.pk).update(draft=draft.pk)
+        Essay.objects.filter(pk=copy.pk).delete()
+
+
+def recount_essays(Essay, CategoryCount):
+    """
+    Essays that were never published are now drafts, and draft copies are
+    gone, so the counts are taken again.
+    """
+    counts = Counter()
+    for category, published_id in Essay.objects.values_list('category', 'published_id').iterator():
+        counts[category, published_id is None] += 1
+    CategoryCount.objects.all().delete()
+    CategoryCount.objects.bulk_create(CategoryCount(category=category, is_draft=is_draft, count=count)
+                                      for (category, is_draft), count in counts.items())
+
+
+def move_to_versions(apps, schema_editor):
+    Essay = apps.get_model('Essay', 'Essay')
+    EssayVersion = apps.get_model('Essay', 'EssayVersion')
+    EssayRevision = apps.get_model('Essay', 'EssayRevision')
+    CategoryCount = apps.get_model('Essay', 'CategoryCount')
+    create_versions(Essay, EssayVersion)
+    fold_draft_copies(Essay, EssayVersion, EssayRevision)
+    recount_essays(Essay, CategoryCount)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0010_essayversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_to_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0011_move_to_versions'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='essay',
+            name='essay_slug_published_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='essay',
+            name='essay_category_state_idx',
+        ),
+        migrations.RemoveField(
+            model_name='essay',
+            name='content',
+        ),
+        migrations.RemoveField(
+            model_name='essay',
+            name='is_draft',
+        ),
+        migrations.RemoveField(
+            model_name='essay',
+            name='is_published',
+        ),
+        migrations.RemoveField(
+            model_name='essay',
+            name='title',
+        ),
+        migrations.AddIndex(
+            model_name='essay',
+            index=models.Index(fields=['category', '-modified_on'], name='essay_category_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0012_remove_essay_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('key', models.CharField(max_length=100)),
+                ('run_after', models.DateTimeField(blank=True, null=True)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('generation', models.IntegerField(default=1)),
+                ('attempts', models.IntegerField(default=0)),
+                ('failed', models.BooleanField(default=False)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['run_after'], name='job_run_after_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='job',
+            unique_together={('name', 'key')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Essay', '0013_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='essayversion',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='essayversion',
+            name='reading_minutes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='essayversion',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,49 +1,373 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max, Q, Sum
+from django.db.models.functions import Substr
 from django.urls import reverse
+from django.utils import timezone
 #from django.template.defaultfilters import slugify
-from django.core.exceptions import ObjectDoesNotExist
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.utils.text import normalize_newlines
 
-from copy import deepcopy
-from random import choice
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import lru_cache
+import re
+import secrets
 import string
+import time
+
+from Avarion import edge, replicas
+
+from . import feeds, search
+from .diff import apply_delta, make_delta
 
 # Create your models here.
 
+def detail_page_cache_key(slug):
+    """The cache key of the EssayDetail page of an essay"""
+    return 'essay:page:detail:%s' % slug
+
+def list_page_cache_key(category):
+    """The cache key of the (first) EssayList page of a category"""
+    return 'essay:page:list:%s' % category.lower()
+
+def essay_surrogate_key(slug):
+    """The surrogate key of the pages showing an essay, see Avarion/edge.py"""
+    return 'essay-%s' % slug
+
+def category_surrogate_key(category):
+    """The surrogate key of the pages listing the essays of a category"""
+    return 'category-%s' % category.lower()
+
+def counter_key(category, published_id, draft_id):
+    """
+    The CategoryCount an essay is counted in, as a (category, is_draft)
+    pair, or None for an essay that has no version yet.
+    """
+    if published_id is None and draft_id is None:
+        return None
+    return category, published_id is None
+
+# The job that follows a change to an essay, see Essay.enqueue_jobs
+ESSAY_JOB = 'essay'
+
+PARAGRAPH_BREAK = re.compile(r'\n{2,}')
+
+@lru_cache(maxsize=20000)
+def render_paragraph(paragraph):
+    """
+    The HTML of one paragraph, as the linebreaks filter renders it. Kept in
+    a per-process LRU keyed by the paragraph's text, so that rendering a
+    new version of an essay only renders the paragraphs that changed.
+    """
+    return '<p>%s</p>' % escape(paragraph).replace('\n', '<br>')
+
+def render_paragraphs(content):
+    """The same HTML as linebreaks(content, autoescape=True), one paragraph at a time"""
+    return '\n\n'.join(render_paragraph(paragraph) for paragraph in iter_paragraphs([content]))
+
+def iter_paragraphs(chunks):
+    """
+    Splits a text given in pieces into paragraphs the way linebreaks does,
+    yielding each one as soon as it is complete. Only the paragraph being
+    read is held, not the whole text, see EssayDetail.stream.
+    :param chunks: The text, in pieces of any length
+    """
+    text = ''
+    for chunk in chunks:
+        text += chunk
+        # A '\r' at the end may be the start of a '\r\n'
+        held = '\r' if text.endswith('\r') else ''
+        text = normalize_newlines(text[:len(text) - len(held)])
+        start = 0
+        for match in PARAGRAPH_BREAK.finditer(text):
+            if match.end() == len(text):
+                # The break may go on in the next piece
+                break
+            yield text[start:match.start()]
+            start = match.end()
+        text = text[start:] + held
+    yield from PARAGRAPH_BREAK.split(normalize_newlines(text))
+
+# The length (in characters) an excerpt is cut to, and the reading speed
+# reading times are estimated with
+EXCERPT_LENGTH = 200
+WORDS_PER_MINUTE = 200
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    """The first paragraph of the content, cut at a word to at most `length` characters"""
+    paragraph = next((paragraph for paragraph in PARAGRAPH_BREAK.split(normalize_newlines(content))
+                      if paragraph.strip()), '')
+    excerpt = ' '.join(paragraph.split())
+    if len(excerpt) <= length:
+        return excerpt
+    # Up to the last space within the limit, leaving room for the ellipsis
+    cut = excerpt[:length]
+    cut = cut.rsplit(' ', 1)[0] if ' ' in cut else cut[:length - 1]
+    return cut.rstrip(',;:.') + '\u2026'
+
+def summarize(content):
+    """
+    The excerpt, word count and reading time (in whole minutes, at least one
+    for any text) of a content, as stored on EssayVersion.
+    """
+    word_count = len(content.split())
+    return {
+        'excerpt': make_excerpt(content),
+        'word_count': word_count,
+        'reading_minutes': -(-word_count // WORDS_PER_MINUTE),
+    }
+
+def clear_cached_pages(keys):
+    """
+    Removes cached pages once the current transaction commits. A request
+    that read the old version and caches its page after that notices the
+    change and takes it out again, see CachedPageMixin.store_page. With read
+    replicas, the pages are replaced by a marker that keeps them from being
+    cached from a lagging replica for a while.
+    """
+    if replicas.get_replicas():
+        lag = replicas.get_lag()
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, {'stale': True}), lag))
+    else:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+def purge_pages(surrogate_keys):
+    """Purges pages from the CDN once the current transaction commits, see Avarion/edge.py"""
+    transaction.on_commit(lambda: edge.purge(surrogate_keys))
+
+def cached_document(key, build):
+    """
+    A document of feeds.py from the cache, built and cached if it is not
+    there (e.g. evicted). Documents are replaced when their essays change,
+    see Essay.enqueue_jobs, so they are kept without a timeout.
+    :param build: Builds the document, or returns None if there is none
+    """
+    document = cache.get(key)
+    if document is None:
+        document = build()
+        if document is not None:
+            cache.set(key, document, None)
+    return document
+
+def clear_documents(categories, pks):
+    """
+    Removes the feeds of the given categories, the sitemaps listing the
+    given essays and the sitemap index from the cache once the current
+    transaction commits, so that the next request builds them again. The
+    job workers write them too, but with a cache of their own (the
+    local-memory cache of the development settings) this process would
+    keep serving its old copies, which never expire.
+    """
+    keys = [feeds.feed_cache_key(category) for category in set(category.lower() for category in categories)]
+    keys += [feeds.sitemap_cache_key(part) for part in set(feeds.sitemap_part(pk) for pk in pks if pk is not None)]
+    keys.append(feeds.sitemap_index_cache_key())
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+def regenerate_documents(categories, pks):
+    """
+    Writes the feeds of the given categories and the sitemaps listing the
+    given essays (and the sitemap index) again once the current transaction
+    commits, so that they are built from what was committed. Meant for
+    bulk inserts; single essays leave it to a job, see Essay.enqueue_jobs.
+    """
+    categories = set(category.lower() for category in categories)
+    parts = set(feeds.sitemap_part(pk) for pk in pks if pk is not None)
+    transaction.on_commit(lambda: Essay.essay_manager.write_documents(categories, parts))
+
 class EssayManager(models.Manager):
-    def copy_essay(self, old_draft):
-        """
-        Makes a deep copy of an essay and returns it
-        :param old_draft: The Essay object to be copied
-        :return: The copied instance of the Essay object
-        """
-        copy = deepcopy(old_draft)
-        copy.is_published = False
-        return copy
+    # Sorted, so that slugs of the same length sort in the order they were made
+    SLUG_CHARS = "".join(sorted(string.ascii_letters + string.digits + "_"))
+    SLUG_RANDOM_BITS = 23
 
-    def gen_slug(self, size=11, chars=string.ascii_letters + string.digits + "_"):
+    def gen_slug(self, size=11, chars=SLUG_CHARS):
         """
-        You still need to do this doc.
+        Generates a new slug without querying the database. The slug encodes
+        the current time in milliseconds followed by SLUG_RANDOM_BITS random
+        bits, so two slugs can only be equal if they are generated within the
+        same millisecond and draw the same random bits (about one in eight
+        million). The unique constraint on Essay.slug catches that case, and
+        Essay.save retries with a new slug.
         :param size: The length of the slug
         :param chars: The characters that will constitute the makeup of the slug
         :return: The newly generated slug
         """
-        acceptable_collisions = 10
+        value = (int(time.time() * 1000) << self.SLUG_RANDOM_BITS) | secrets.randbits(self.SLUG_RANDOM_BITS)
 
-        for collisioni in range(acceptable_collisions):
-            new_slug = "".join(choice(chars) for _ in range(size))
-            try:
-                Essay.objects.get(slug=new_slug)
-            except ObjectDoesNotExist:
-                return new_slug
+        base = len(chars)
+        slug = []
+        for _ in range(size):
+            value, index = divmod(value, base)
+            slug.append(chars[index])
+        return "".join(reversed(slug))
+
+    def build(self, title, content, is_draft=False, **fields):
+        """
+        Makes an unsaved essay with a single version, to be inserted with
+        bulk_create_essays.
+        :param is_draft: Whether the version is a draft or the published one
+        :param fields: Other fields of the Essay, e.g. category or slug
+        :return: The Essay, with the unsaved EssayVersion as its draft or
+                published version
+        """
+        essay = Essay(**fields)
+        version = EssayVersion(title=title, content=content, modified_on=fields.get('modified_on'))
+        if is_draft:
+            essay.draft = version
+        else:
+            essay.published = version
+        return essay
+
+    def create_essay(self, title, content, is_draft=False, **fields):
+        """
+        Creates an essay with a single version.
+        :param is_draft: Whether the version is a draft or the published one
+        :param fields: Other fields of the Essay, e.g. category
+        :return: The saved Essay
+        """
+        essay = Essay(**fields)
+        with transaction.atomic(savepoint=False):
+            essay.save()
+            version = EssayVersion.objects.create(essay=essay, title=title, content=content)
+            if is_draft:
+                essay.draft = version
             else:
-                if collisioni == (acceptable_collisions - 1):
-                    # Recursive
-                    return self.gen_slug(size=(size + 1))
+                essay.published = version
+            essay.save()
+        return essay
+
+    def bulk_create_essays(self, essays, batch_size=1000):
+        """
+        Inserts many essays with one INSERT per batch for the essays and one
+        for their versions, bypassing Essay.save. Essays without a slug get
+        one from gen_slug; the slugs of a batch are checked against the
+        database (and each other) with a single query, and the few generated
+        ones that collide are drawn again. The essays are added to the search
+        index once they are inserted, and the cached list pages of their
+        categories are cleared.
+        :param essays: Unsaved Essay objects, whose published and draft
+                versions are unsaved EssayVersion objects (see build)
+        :param batch_size: The number of essays inserted at once
+        :return: The saved essays, with their primary keys set
+        """
+        for start in range(0, len(essays), batch_size):
+            batch = essays[start:start + batch_size]
+            generated = []
+            for essay in batch:
+                essay.category = essay.category.lower()
+                if not essay.slug:
+                    essay.slug = self.gen_slug()
+                    generated.append(essay)
+
+            slugs = [essay.slug for essay in batch]
+            taken = set(Essay.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+            generated_ids = set(id(essay) for essay in generated)
+            seen = set(essay.slug for essay in batch if id(essay) not in generated_ids)
+            for essay in generated:
+                while essay.slug in taken or essay.slug in seen:
+                    essay.slug = self.gen_slug()
+                seen.add(essay.slug)
+
+            # The versions can only be inserted once the essays have keys
+            versions = []
+            for essay in batch:
+                for field in ('published', 'draft'):
+                    version = getattr(essay, field)
+                    if version is not None:
+                        versions.append((essay, field, version))
+                        setattr(essay, field, None)
+
+            with transaction.atomic():
+                Essay.objects.bulk_create(batch)
+                if batch and batch[0].pk is None:
+                    # Not every database hands the primary keys back from a bulk insert
+                    pks = dict(Essay.objects.filter(slug__in=[essay.slug for essay in batch])
+                               .values_list('slug', 'pk'))
+                    for essay in batch:
+                        essay.pk = pks[essay.slug]
+
+                for essay, field, version in versions:
+                    version.essay = essay
+                    version.summarize()
+                EssayVersion.objects.bulk_create([version for _, _, version in versions])
+                if versions and versions[0][2].pk is None:
+                    # The versions of an essay were inserted in order, so their keys are too
+                    version_pks = defaultdict(list)
+                    for essay_id, pk in (EssayVersion.objects.filter(essay_id__in=[essay.pk for essay in batch])
+                                         .order_by('pk').values_list('essay_id', 'pk')):
+                        version_pks[essay_id].append(pk)
+                    for essay, field, version in versions:
+                        version.pk = version_pks[essay.pk].pop(0)
+                for essay, field, version in versions:
+                    setattr(essay, field, version)
+                Essay.objects.bulk_update(batch, ['published', 'draft'])
+
+                search.index_essays(batch)
+                CategoryCount.objects.add_many(Counter(essay.counter_key() for essay in batch))
+                clear_cached_pages([list_page_cache_key(category)
+                                    for category in set(essay.category for essay in batch)])
+                purge_pages([category_surrogate_key(category)
+                             for category in set(essay.category for essay in batch)])
+                regenerate_documents(set(essay.category for essay in batch), [essay.pk for essay in batch])
+        return essays
+
+    def build_feed(self, category):
+        """The Atom feed of the newest published essays of a category, see feeds.atom_feed"""
+        rows = (Essay.objects.filter(category=category, published__isnull=False).order_by('-modified_on')
+                .values_list('slug', 'published__title', 'published__excerpt', 'created_on', 'modified_on')
+                [:feeds.FEED_SIZE])
+        return feeds.atom_feed(category, dict(Essay.CATEGORY).get(category, category), rows)
+
+    def build_sitemap(self, part):
+        """The sitemap of the published essays of a part, or None if it has none, see feeds.sitemap"""
+        last_pk = Essay.objects.aggregate(last=Max('pk'))['last']
+        # Parts past the last essay are empty, and may be too large to query
+        if last_pk is None or part > feeds.sitemap_part(last_pk):
+            return None
+        start = part * feeds.SITEMAP_SIZE
+        rows = (Essay.objects.filter(published__isnull=False, pk__gte=start, pk__lt=start + feeds.SITEMAP_SIZE)
+                .order_by('pk').values_list('slug', 'modified_on'))
+        return feeds.sitemap(rows.iterator())
+
+    def build_sitemap_index(self):
+        """
+        The sitemap index, from the sitemaps in the cache. Only the ones
+        missing from it are built.
+        """
+        last_pk = Essay.objects.aggregate(last=Max('pk'))['last']
+        parts = []
+        for part in range(0 if last_pk is None else feeds.sitemap_part(last_pk) + 1):
+            document = cached_document(feeds.sitemap_cache_key(part), lambda: self.build_sitemap(part))
+            if document is not None:
+                parts.append((part, document))
+        return feeds.sitemap_index(parts)
+
+    def write_documents(self, categories, parts):
+        """Builds the given feeds and sitemaps, and the sitemap index, and replaces them in the cache"""
+        documents = {feeds.feed_cache_key(category): self.build_feed(category) for category in categories}
+        for part in parts:
+            documents[feeds.sitemap_cache_key(part)] = self.build_sitemap(part)
+        cache.set_many({key: document for key, document in documents.items() if document is not None}, None)
+        cache.delete_many([key for key, document in documents.items() if document is None])
+        cache.set(feeds.sitemap_index_cache_key(), self.build_sitemap_index(), None)
+
+    def rebuild_search_index(self):
+        """Replaces the whole search index with the published versions of the essays"""
+        search.rebuild_index(Essay.objects.filter(published__isnull=False)
+                             .values_list('pk', 'published__title', 'published__content'))
 
 class Essay(models.Model):
     """
     Represents an entire treatment of a topic,
     which is added upon gradually over time.
+
+    The essay is what stays the same from version to version: its slug,
+    category and creation date. What it says is held by up to two
+    EssayVersion rows it points to: the published version readers see, and
+    the draft being worked on. An essay that has never been published only
+    has a draft. Publishing and unpublishing move the pointers (see publish
+    and unpublish), and older versions are kept as EssayRevision deltas.
     """
 
     THOUGHTS = 'thoughts'
@@ -53,22 +377,36 @@ class Essay(models.Model):
         (MEDITATIONS, 'Meditations'),
     ]
 
-    title = models.CharField(max_length=100)
-    slug = models.SlugField(max_length=50)
+    slug = models.SlugField(max_length=50, unique=True)
     category = models.CharField(max_length=20, choices=CATEGORY, default=THOUGHTS)
-    content = models.TextField()
     created_on = models.DateTimeField(auto_now_add=True)
+    # When the version readers see last changed
     modified_on = models.DateTimeField(auto_now=True)
-    is_published = models.BooleanField(default=True)
-    is_draft = models.BooleanField(default=False)
+    published = models.OneToOneField('EssayVersion', null=True, blank=True, on_delete=models.DO_NOTHING,
+                                     related_name='+')
+    draft = models.OneToOneField('EssayVersion', null=True, blank=True, on_delete=models.DO_NOTHING,
+                                 related_name='+')
     objects = models.Manager()
     essay_manager = EssayManager()
 
+    # How many generated slugs save() tries before giving up
+    slug_attempts = 5
+    # The fields counter_key depends on
+    COUNTER_FIELDS = frozenset(['category', 'published_id', 'draft_id'])
+
+    class Meta:
+        indexes = [
+            # EssayList filters on category, newest first. Lookups by slug
+            # use the index of the unique constraint.
+            models.Index(fields=['category', '-modified_on'], name='essay_category_modified_idx'),
+        ]
+
     def __unicode__(self):
-        return self.title
+        return self.__str__()
 
     def __str__(self):
-        return self.title
+        version = self.current
+        return version.title if version is not None else self.slug
 
     def save(self, *args, **kwargs):
         """
@@ -80,33 +418,238 @@ class Essay(models.Model):
         changed when the essay is edited, the slug and essay title will not
         match. That would look horrendous.
 
-        Note: There is no way to check for collisions yet.
+        Collisions are caught by the unique constraint on the slug: if the
+        insert fails, a new slug is generated and the insert is retried.
+
+        The category is stored lower-cased so that lookups from the URL can
+        use a plain (indexed) equality instead of a case-insensitive scan.
+
+        The CategoryCount the essay is counted in is updated in the same
+        transaction. The rest of the work that follows from the save is left
+        to a job, see enqueue_jobs.
         """
 
-        if not self.slug:
-            self.slug = Essay.essay_manager.gen_slug()
-        return super(Essay, self).save(*args, **kwargs)
+        self.category = self.category.lower()
+        with transaction.atomic(savepoint=False):
+            old_key = None if (self._state.adding or self.pk is None) else self.saved_counter_key()
+            if self.slug:
+                super(Essay, self).save(*args, **kwargs)
+            else:
+                for attempt in range(self.slug_attempts):
+                    self.slug = Essay.essay_manager.gen_slug()
+                    try:
+                        with transaction.atomic():
+                            super(Essay, self).save(*args, **kwargs)
+                        break
+                    except IntegrityError:
+                        self.slug = ''
+                        if attempt == (self.slug_attempts - 1):
+                            raise
+            self.enqueue_jobs()
+            self.update_counters(old_key, self.counter_key())
+        self.clear_cached_pages()
 
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            old_key = self.saved_counter_key()
+            self.enqueue_jobs()
+            self.clear_cached_pages()
+            deleted = super(Essay, self).delete(*args, **kwargs)
+            self.update_counters(old_key, None)
+        return deleted
 
-    #@models.permalink
-    def get_absolute_url(self):
-        return reverse('essay_detail', kwargs={'slug': self.object.slug})
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Override. Remembers which CategoryCount the essay is counted in as
+        loaded, so that saving it does not have to look that up again.
+        """
+        essay = super(Essay, cls).from_db(db, field_names, values)
+        if cls.COUNTER_FIELDS.issubset(field_names):
+            essay._saved_counter_key = (essay.pk, essay.counter_key())
+        return essay
 
-    #############################
     @property
-    def h_title(self):
-        """Getter of the essay title"""
-        return self.title
+    def is_draft(self):
+        """Whether the essay has not been published (yet)"""
+        return self.published_id is None
+
+    @property
+    def current(self):
+        """The version shown at the essay's address: the published one, or the draft if there is none"""
+        return self.published if self.published_id is not None else self.draft
+
+    @property
+    def latest(self):
+        """The newest version: the draft, or the published one if there is none"""
+        return self.draft if self.draft_id is not None else self.published
+
+    def counter_key(self):
+        """The CategoryCount this essay is counted in, see counter_key"""
+        return counter_key(self.category, self.published_id, self.draft_id)
+
+    def saved_counter_key(self):
+        """
+        The CategoryCount the row of this essay is counted in, as it is saved
+        in the database. It is known without a query if the essay was loaded
+        with all the fields it depends on and still has the same primary key.
+        """
+        pk, key = getattr(self, '_saved_counter_key', (None, None))
+        if pk is not None and pk == self.pk:
+            return key
+        row = Essay.objects.filter(pk=self.pk).values_list('category', 'published_id', 'draft_id').first()
+        return None if row is None else counter_key(*row)
+
+    def update_counters(self, old_key, new_key):
+        """Moves the essay from the CategoryCount it was counted in to the one it is now counted in"""
+        if old_key != new_key:
+            CategoryCount.objects.add_many({old_key: -1, new_key: 1})
+        self._saved_counter_key = (self.pk, new_key)
+
+    def edit(self, title, content, as_draft):
+        """
+        Saves a new version of the essay. The version it replaces is stored as
+        the newest EssayRevision, so that the history runs back from the
+        latest version without gaps:
+
+        - as a draft, the draft is updated, or started next to the published
+          version, which stays in public view until the draft is published;
+        - otherwise the draft, if there is one, is updated and published, or
+          else the published version is updated.
+
+        Meant to be called in a transaction, with the essay locked.
+        :param as_draft: Whether the new version is kept as a draft
+        :return: The EssayVersion holding the new version
+        """
+        latest = self.latest
+        changed = (latest.title, latest.content) != (title, content)
+        with transaction.atomic(savepoint=False):
+            if as_draft and self.draft_id is None:
+                # The published version stays as it is and becomes the
+                # version before the draft in the history
+                if changed:
+                    EssayRevision.objects.record(latest, content)
+                self.draft = EssayVersion.objects.create(essay=self, title=title, content=content)
+                Essay.objects.filter(pk=self.pk).update(draft=self.draft)
+                self.enqueue_jobs()
+                return self.draft
+
+            if changed:
+                EssayRevision.objects.record(latest, content)
+                latest.title = title
+                latest.content = content
+                latest.save()
+            if not as_draft and self.draft_id is not None:
+                self.publish()
+            elif changed and latest is self.current:
+                self.save()
+            elif changed:
+                self.enqueue_jobs()
+        return latest
+
+    def publish(self):
+        """
+        Makes the draft the published version, with one UPDATE moving the
+        pointers. The version it replaces is already in the history (see
+        edit), so it is deleted.
+        """
+        if self.draft_id is None:
+            return
+        old_key = self.counter_key()
+        replaced = self.published_id
+        with transaction.atomic(savepoint=False):
+            self.modified_on = timezone.now()
+            Essay.objects.filter(pk=self.pk).update(published=F('draft'), draft=None, modified_on=self.modified_on)
+            self.published, self.draft = self.draft, None
+            if replaced is not None:
+                EssayVersion.objects.filter(pk=replaced).delete()
+            self.enqueue_jobs()
+            self.update_counters(old_key, self.counter_key())
+        self.clear_cached_pages()
+
+    def unpublish(self):
+        """
+        Takes the essay out of public view, with one UPDATE moving the
+        pointers: the published version becomes the draft. If there already
+        is a draft, it is newer and stays; the published version is then
+        already in the history (see edit), so it is deleted.
+        """
+        if self.published_id is None:
+            return
+        old_key = self.counter_key()
+        replaced = None
+        with transaction.atomic(savepoint=False):
+            self.modified_on = timezone.now()
+            essays = Essay.objects.filter(pk=self.pk)
+            if self.draft_id is None:
+                essays.update(draft=F('published'), published=None, modified_on=self.modified_on)
+                self.draft_id, self.published_id = self.published_id, None
+            else:
+                replaced = self.published_id
+                essays.update(published=None, modified_on=self.modified_on)
+                self.published = None
+                EssayVersion.objects.filter(pk=replaced).delete()
+            self.enqueue_jobs()
+            self.update_counters(old_key, self.counter_key())
+        self.clear_cached_pages()
+
+    def clear_cached_pages(self):
+        """
+        Removes the cached detail page of this essay and the cached list page
+        of its category, here (see clear_cached_pages) and from the CDN (see
+        purge_pages).
+        """
+        clear_cached_pages([detail_page_cache_key(self.slug), list_page_cache_key(self.category)])
+        purge_pages([essay_surrogate_key(self.slug), category_surrogate_key(self.category)])
 
-    @h_title.setter
-    def h_title(self, value):
-        """Setter of the essay title"""
-        self.title = value
+    def enqueue_jobs(self):
+        """
+        Asks for the work that follows from a change to this essay: its search
+        index entry, the HTML of its versions, the feed of its category and
+        the sitemap listing it. It is done by the job workers once the
+        transaction commits (see jobs.update_essay), so that a save only
+        costs the request one UPDATE of the jobs table. The copies of the
+        feed and sitemap cached by this process are removed, see
+        clear_documents.
+        """
+        Job.objects.enqueue(ESSAY_JOB, self.pk)
+        clear_documents([self.category], [self.pk])
 
-    @h_title.deleter
-    def h_title(self):
-        """Deleter of the essay title"""
-        del self.title
+    def history(self, oldest=1):
+        """
+        Walks the revisions of this essay from newest to oldest, rebuilding
+        the content of each one from the version that replaced it. Only one
+        version is held at a time.
+        :param oldest: The number of the oldest revision to walk to
+        :return: A generator of (EssayRevision, content) pairs
+        """
+        content = self.latest.content
+        revisions = self.revisions.filter(number__gte=oldest).order_by('-number')
+        for revision in revisions.iterator():
+            content = apply_delta(content, revision.content_delta)
+            yield revision, content
+
+    def version_contents(self, numbers):
+        """
+        Rebuilds the content of a few versions of this essay in one walk
+        through its history. The latest version is numbered None.
+        :param numbers: Revision numbers (or None)
+        :return: A dictionary from number to content, without the numbers
+                that do not exist
+        """
+        wanted = set(numbers)
+        contents = {}
+        if None in wanted:
+            contents[None] = self.latest.content
+            wanted.discard(None)
+        if wanted:
+            for revision, content in self.history(oldest=min(wanted)):
+                if revision.number in wanted:
+                    contents[revision.number] = content
+        return contents
+
+    def get_absolute_url(self):
+        return reverse('essay_detail', kwargs={'slug': self.slug})
 
     ##############################
     @property
@@ -124,22 +667,6 @@ class Essay(models.Model):
         """Deleter of the essay slug"""
         del self.slug
 
-    ##############################
-    @property
-    def h_content(self):
-        """Getter of the essay content"""
-        return self.content
-
-    @h_content.setter
-    def h_content(self, value):
-        """Setter of the essay content"""
-        self.slug = value
-
-    @h_content.deleter
-    def h_content(self):
-        """Deleter of the essay content"""
-        del self.content
-
     ###############################
     @property
     def h_creation_time(self):
@@ -161,5 +688,312 @@ class Essay(models.Model):
     @property
     def h_is_published(self):
         """Getter of whether the essay is published"""
-        return self.is_published
+        return self.published_id is not None
+
+
+class EssayVersion(models.Model):
+    """
+    A version of an essay that is in use: the published one readers see or
+    the draft being worked on (see Essay.published and Essay.draft). It is
+    edited in place, the versions it replaces are kept as EssayRevision
+    deltas.
+    """
+
+    essay = models.ForeignKey(Essay, on_delete=models.CASCADE, related_name='versions')
+    title = models.CharField(max_length=100)
+    content = models.TextField()
+    modified_on = models.DateTimeField(auto_now=True)
+    # Derived from the content when the version is saved (see summarize), so
+    # that the list shows them without loading it
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, default='')
+    word_count = models.PositiveIntegerField(default=0)
+    reading_minutes = models.PositiveIntegerField(default=0)
+
+    # How long (in seconds) the rendered HTML of a version stays cached
+    rendered_content_timeout = 60 * 60 * 24
+
+    def __str__(self):
+        return self.title
+
+    def save(self, *args, **kwargs):
+        self.clear_rendered_content()
+        self.summarize()
+        super(EssayVersion, self).save(*args, **kwargs)
+
+    def summarize(self):
+        """Sets the excerpt, word count and reading time from the content"""
+        for field, value in summarize(self.content).items():
+            setattr(self, field, value)
+
+    def rendered_content_key(self):
+        """
+        The cache key of the rendered HTML of this version. It contains the
+        modification time, so an edit never serves a stale rendering even
+        if the old entry has not been deleted (yet).
+        """
+        return 'essay:html:%d:%s' % (self.pk, self.modified_on.timestamp())
+
+    def rendered_content(self):
+        """
+        Returns the content as HTML paragraphs, the same way the linebreaks
+        filter would, but renders it only once per version and keeps the
+        result in the cache. A new version only renders its new or edited
+        paragraphs, see render_paragraph.
+        """
+        if self.pk is None or self.modified_on is None:
+            return mark_safe(render_paragraphs(self.content))
+
+        key = self.rendered_content_key()
+        html = cache.get(key)
+        if html is None:
+            html = render_paragraphs(self.content)
+            cache.set(key, html, self.rendered_content_timeout)
+        return mark_safe(html)
+
+    def clear_rendered_content(self):
+        """Removes the cached HTML of the saved state of this version"""
+        if self.pk is not None and self.modified_on is not None:
+            cache.delete(self.rendered_content_key())
+
+    def iter_content(self, chunk_size):
+        """
+        Reads the saved content of this version in pieces of `chunk_size`
+        characters, one query each, so that it is never loaded whole.
+        Raises EssayVersion.DoesNotExist if the version is changed (or
+        deleted) before it has been read to the end, rather than mixing two
+        states of it.
+        """
+        versions = EssayVersion.objects.filter(pk=self.pk, modified_on=self.modified_on)
+        start = 1
+        while True:
+            chunk = (versions.annotate(chunk=Substr('content', start, chunk_size))
+                     .values_list('chunk', flat=True).first())
+            if chunk is None:
+                raise EssayVersion.DoesNotExist("The version changed while it was read")
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            start += chunk_size
+
+
+class EssayRevisionManager(models.Manager):
+    def record(self, old_version, new_content):
+        """
+        Stores a superseded version of an essay as its newest revision.
+        :param old_version: The EssayVersion as it is currently saved in the
+                database
+        :param new_content: The content of the version replacing it
+        :return: The created EssayRevision
+        """
+        last_number = self.filter(essay_id=old_version.essay_id).aggregate(last=Max('number'))['last'] or 0
+        return self.create(
+            essay_id=old_version.essay_id,
+            number=last_number + 1,
+            title=old_version.title,
+            content_delta=make_delta(new_content, old_version.content),
+            modified_on=old_version.modified_on,
+        )
+
+
+class EssayRevision(models.Model):
+    """
+    A superseded version of an essay. The title is kept as is, but the
+    content is stored as a reverse delta against the version that replaced
+    it: the next revision, or the latest version of the essay (see
+    Essay.latest) for the newest revision.
+    """
+
+    essay = models.ForeignKey(Essay, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    title = models.CharField(max_length=100)
+    content_delta = models.TextField()
+    modified_on = models.DateTimeField()
+    created_on = models.DateTimeField(auto_now_add=True)
+    objects = EssayRevisionManager()
+
+    class Meta:
+        unique_together = [('essay', 'number')]
+
+    def __str__(self):
+        return '%s (revision %d)' % (self.title, self.number)
+
+
+class CategoryCountManager(models.Manager):
+    def add_many(self, deltas):
+        """
+        Adds to the counts. Only called inside the transaction that creates,
+        edits or deletes the essays being counted.
+        :param deltas: A mapping from (category, is_draft) to the number to
+                add. The None key (essays that are not counted) is ignored.
+        :return: nothing
+        """
+        for key, delta in deltas.items():
+            if key is None or delta == 0:
+                continue
+            category, is_draft = key
+            counts = self.filter(category=category, is_draft=is_draft)
+            if counts.update(count=F('count') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(category=category, is_draft=is_draft, count=delta)
+            except IntegrityError:
+                # Created by a concurrent transaction in the meantime
+                counts.update(count=F('count') + delta)
+
+    def for_category(self, category):
+        """:return: A dictionary with the number of 'finals' and 'drafts' of a category"""
+        counts = dict(self.filter(category=category.lower()).values_list('is_draft', 'count'))
+        return {'finals': counts.get(False, 0), 'drafts': counts.get(True, 0)}
+
+    def total(self):
+        """The number of essays, finals and drafts, of every category"""
+        return self.aggregate(total=Sum('count'))['total'] or 0
+
+    def rebuild(self):
+        """
+        Recounts every essay, for when the counts have drifted (e.g. after
+        rows were changed with queryset methods that bypass Essay.save).
+        :return: A dictionary from (category, is_draft) to count
+        """
+        counts = Counter()
+        rows = Essay.objects.values_list('category', 'published_id', 'draft_id')
+        for row in rows.iterator():
+            counts[counter_key(*row)] += 1
+        counts.pop(None, None)
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(CategoryCount(category=category, is_draft=is_draft, count=count)
+                             for (category, is_draft), count in counts.items())
+        return dict(counts)
+
+
+class CategoryCount(models.Model):
+    """
+    The number of essays of a category, drafts (never published) and
+    finals counted apart, kept up to date as essays are saved, published
+    and deleted. It saves counting the essays whenever the numbers are
+    shown.
+    """
+
+    category = models.CharField(max_length=20)
+    is_draft = models.BooleanField()
+    count = models.IntegerField(default=0)
+    objects = CategoryCountManager()
+
+    class Meta:
+        unique_together = [('category', 'is_draft')]
+
+    def __str__(self):
+        return '%s (%s): %d' % (self.category, 'drafts' if self.is_draft else 'finals', self.count)
+
+
+class JobManager(models.Manager):
+    def enqueue(self, name, key, delay=0):
+        """
+        Asks for a job to be run by the workers (see jobs.py), in the current
+        transaction: it is only seen by them once the transaction commits,
+        and not at all if it rolls back. A job that is already waiting is
+        not added again, and one that is running is run again once it is
+        done, so the work is done at least once after the last request.
+        :param name: The name of the job, see jobs.handler
+        :param key: What the job works on, e.g. the primary key of an essay
+        :param delay: The number of seconds to wait before running it
+        """
+        key = str(key)
+        run_after = timezone.now() + timedelta(seconds=delay)
+        changes = dict(generation=F('generation') + 1, run_after=run_after, attempts=0, failed=False)
+        if self.filter(name=name, key=key).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, key=key, run_after=run_after)
+        except IntegrityError:
+            # Added by a concurrent transaction
+            self.filter(name=name, key=key).update(**changes)
+
+    def claim(self, limit, lease):
+        """
+        Takes up to `limit` jobs that are due, so that no other worker runs
+        them for the next `lease` seconds.
+        :return: The claimed jobs, as they were before the claim
+        """
+        now = timezone.now()
+        due = list(self.filter(run_after__lte=now).filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+                   .order_by('run_after')[:limit])
+        claimed = []
+        for job in due:
+            # Whichever worker moves the lease first gets the job
+            if self.filter(pk=job.pk, locked_until=job.locked_until).update(
+                    locked_until=now + timedelta(seconds=lease)):
+                claimed.append(job)
+        return claimed
+
+    def complete(self, job):
+        """
+        Marks a claimed job as done, unless it was asked for again while it
+        ran, in which case it is only released to be run again.
+        """
+        if not self.filter(pk=job.pk, generation=job.generation).update(
+                run_after=None, locked_until=None, attempts=0, last_error=''):
+            self.filter(pk=job.pk).update(locked_until=None)
+
+    def fail(self, job, error):
+        """
+        Releases a claimed job that raised an error, to be tried again after
+        a delay that doubles with every attempt, see Job.backoff. After
+        Job.max_attempts it is given up on and kept with its error.
+        """
+        attempts = job.attempts + 1
+        if attempts >= Job.max_attempts:
+            changes = dict(run_after=None, failed=True)
+        else:
+            changes = dict(run_after=timezone.now() + timedelta(seconds=Job.backoff(attempts)))
+        if not self.filter(pk=job.pk, generation=job.generation).update(
+                attempts=attempts, locked_until=None, last_error=error, **changes):
+            self.filter(pk=job.pk).update(locked_until=None)
+
+
+class Job(models.Model):
+    """
+    Work that follows from a change, e.g. indexing an essay that was saved,
+    run by the workers of `manage.py run_workers` instead of the request
+    that made the change (see jobs.py). There is one row per job name and
+    key; it is kept once the job is done, with no run_after, so asking for
+    the job again is a single UPDATE.
+    """
+
+    name = models.CharField(max_length=50)
+    key = models.CharField(max_length=100)
+    # When the job is due, or None if it has nothing to do
+    run_after = models.DateTimeField(null=True, blank=True)
+    # Until when the worker running the job holds it
+    locked_until = models.DateTimeField(null=True, blank=True)
+    # Counts the times the job was asked for, so that one asked for while it
+    # ran is run again
+    generation = models.IntegerField(default=1)
+    attempts = models.IntegerField(default=0)
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    objects = JobManager()
+
+    # How often a failing job is tried before it is given up on
+    max_attempts = 8
+    # The delay (in seconds) before the first retry, and the longest one
+    backoff_base = 5
+    backoff_max = 60 * 60
+
+    class Meta:
+        unique_together = [('name', 'key')]
+        indexes = [
+            models.Index(fields=['run_after'], name='job_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return '%s:%s' % (self.name, self.key)
 
+    @classmethod
+    def backoff(cls, attempts):
+        """The number of seconds to wait before trying a job again after `attempts` failures"""
+        return min(cls.backoff_base * 2 ** (attempts - 1), cls.backoff_max)
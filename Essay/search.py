@@ -0,0 +1,210 @@
+"""
+Full-text search over the published essays.
+
+The search index lives next to the Essay table and holds one entry per
+published essay, made of the title and content of its published version
+(drafts and old revisions are never indexed). How it is stored depends on
+the database:
+
+- SQLite: an FTS5 virtual table whose rowid is the primary key of the
+  essay, ranked with bm25.
+- PostgreSQL: a table of tsvector documents with a GIN index, ranked with
+  ts_rank. Titles are weighted above the content.
+
+Other databases have no index; searching them falls back to a LIKE scan.
+
+Essay.save keeps the index up to date one essay at a time, index_essays
+adds a batch of essays inserted in bulk, and rebuild_index fills it from
+scratch (used by the migration that creates it).
+"""
+import re
+
+from django.db import connection as default_connection, connections
+from django.db.models import Q
+
+
+class SQLiteBackend(object):
+    table = 'Essay_essay_search'
+
+    def create(self, cursor):
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS %s "
+                       "USING fts5(title, content, tokenize='porter unicode61')" % self.table)
+
+    def drop(self, cursor):
+        cursor.execute("DROP TABLE IF EXISTS %s" % self.table)
+
+    def rebuild(self, cursor, rows_sql, params):
+        cursor.execute("DELETE FROM %s" % self.table)
+        cursor.execute("INSERT INTO %s (rowid, title, content) %s" % (self.table, rows_sql), params)
+
+    def index(self, cursor, entry):
+        self.remove(cursor, entry[0])
+        cursor.execute("INSERT INTO %s (rowid, title, content) VALUES (%%s, %%s, %%s)" % self.table, entry)
+
+    def index_many(self, cursor, entries):
+        pks = [pk for pk, _, _ in entries]
+        cursor.execute("DELETE FROM %s WHERE rowid IN (%s)" % (self.table, ", ".join(["%s"] * len(pks))), pks)
+        cursor.executemany("INSERT INTO %s (rowid, title, content) VALUES (%%s, %%s, %%s)" % self.table,
+                           entries)
+
+    def remove(self, cursor, pk):
+        cursor.execute("DELETE FROM %s WHERE rowid = %%s" % self.table, [pk])
+
+    def search(self, cursor, terms, limit):
+        # Every term is quoted, so nothing the user types is read as FTS5 syntax
+        match = " ".join('"%s"' % term for term in terms)
+        cursor.execute("SELECT rowid FROM %s WHERE %s MATCH %%s "
+                       "ORDER BY bm25(%s, 10.0, 1.0) LIMIT %%s" % (self.table, self.table, self.table),
+                       [match, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLBackend(object):
+    table = 'Essay_essay_search'
+    document = ("setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'B')")
+
+    def create(self, cursor):
+        cursor.execute('CREATE TABLE IF NOT EXISTS "%s" ('
+                       'essay_id integer PRIMARY KEY, document tsvector NOT NULL)' % self.table)
+        cursor.execute('CREATE INDEX IF NOT EXISTS "%s_document_idx" ON "%s" USING GIN (document)'
+                       % (self.table, self.table))
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS "%s"' % self.table)
+
+    def rebuild(self, cursor, rows_sql, params):
+        cursor.execute('DELETE FROM "%s"' % self.table)
+        cursor.execute('INSERT INTO "%s" (essay_id, document) SELECT id, %s FROM (%s) essays (id, title, content)'
+                       % (self.table, self.document % ('title', 'content'), rows_sql), params)
+
+    def index(self, cursor, entry):
+        self.index_many(cursor, [entry])
+
+    def index_many(self, cursor, entries):
+        cursor.executemany('INSERT INTO "%s" (essay_id, document) VALUES (%%s, %s) '
+                           'ON CONFLICT (essay_id) DO UPDATE SET document = EXCLUDED.document'
+                           % (self.table, self.document % ('%s', '%s')),
+                           entries)
+
+    def remove(self, cursor, pk):
+        cursor.execute('DELETE FROM "%s" WHERE essay_id = %%s' % self.table, [pk])
+
+    def search(self, cursor, terms, limit):
+        cursor.execute('SELECT essay_id FROM "%s", plainto_tsquery(\'english\', %%s) query '
+                       'WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %%s'
+                       % self.table, [" ".join(terms), limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'postgresql': PostgreSQLBackend(),
+}
+
+
+def get_backend(connection=default_connection):
+    """The search backend of a database connection, or None if it has none"""
+    return BACKENDS.get(connection.vendor)
+
+
+def is_searchable(essay):
+    """Only the published version of an essay is indexed"""
+    return essay.published_id is not None
+
+
+def index_entry(essay):
+    """The (primary key, title, content) of the index entry of an essay"""
+    return essay.pk, essay.published.title, essay.published.content
+
+
+def create_index(connection=default_connection):
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.create(cursor)
+
+
+def drop_index(connection=default_connection):
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.drop(cursor)
+
+
+def rebuild_index(rows, connection=default_connection):
+    """
+    Replaces the whole index, with a single INSERT ... SELECT.
+    :param rows: A queryset of (primary key, title, content) tuples, one
+            per essay to index (see EssayManager.rebuild_search_index), or
+            the name of an essay table of the schema before EssayVersion,
+            whose published finals are indexed (see migration 0008)
+    """
+    backend = get_backend(connection)
+    if backend is not None:
+        if isinstance(rows, str):
+            rows_sql = ("SELECT id, title, content FROM %s WHERE is_published AND NOT is_draft"
+                        % connection.ops.quote_name(rows))
+            params = ()
+        else:
+            rows_sql, params = rows.query.get_compiler(connection=connection).as_sql()
+        with connection.cursor() as cursor:
+            backend.rebuild(cursor, rows_sql, params)
+
+
+def index_essay(essay, connection=default_connection):
+    """Adds, updates or removes the index entry of a single essay"""
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            if is_searchable(essay):
+                backend.index(cursor, index_entry(essay))
+            else:
+                backend.remove(cursor, essay.pk)
+
+
+def index_essays(essays, connection=default_connection):
+    """
+    Adds or updates the index entries of many essays with a few statements.
+    Essays that are not searchable are skipped, so this is meant for essays
+    that have no entry yet, e.g. ones that were just bulk inserted.
+    """
+    backend = get_backend(connection)
+    essays = [essay for essay in essays if is_searchable(essay)]
+    if backend is not None and essays:
+        with connection.cursor() as cursor:
+            backend.index_many(cursor, [index_entry(essay) for essay in essays])
+
+
+def remove_essay(pk, connection=default_connection):
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, pk)
+
+
+def search(queryset, query, limit=50):
+    """
+    Finds the essays matching every word of a query, best match first.
+    :param queryset: The essays that may be returned (the index is only used
+            to rank them, so this is what filters out stale entries)
+    :param query: The text typed by the user
+    :param limit: The maximum number of results
+    :return: A list of objects from queryset
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return []
+
+    # The database the queryset reads from, which may be a read replica
+    connection = connections[queryset.db]
+    backend = get_backend(connection)
+    if backend is None:
+        for term in terms:
+            queryset = queryset.filter(Q(published__title__icontains=term) | Q(published__content__icontains=term))
+        return list(queryset.order_by('-modified_on')[:limit])
+
+    with connection.cursor() as cursor:
+        pks = backend.search(cursor, terms, limit)
+    essays = queryset.in_bulk(pks)
+    return [essays[pk] for pk in pks if pk in essays]
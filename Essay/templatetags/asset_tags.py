@@ -0,0 +1,10 @@
+from django import template
+
+from Avarion import assets
+
+register = template.Library()
+
+@register.simple_tag
+def asset_url(path):
+    """The URL of the built bundle of a stylesheet, see Avarion/assets.py"""
+    return assets.asset_url(path)
@@ -7,10 +7,6 @@ register = template.Library()
 def essay_format(value):
     """Formats the essay content to the proper layout"""
     tokens = value.split("\n")
-    formatted_value = ""
-    for token in tokens:
-        token = "<p>" + token + "</p>"
-        formatted_value = formatted_value + token
-    return formatted_value
+    return "".join("<p>" + token + "</p>" for token in tokens)
 
 register.filter('essay_format', essay_format)
\ No newline at end of file
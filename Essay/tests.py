@@ -1,3 +1,1116 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import linebreaks
+
+from Avarion import edge, ratelimit
+from Avarion.edge import PurgeBackend
+from Avarion.singleflight import SingleFlight
+from . import feeds, jobs, search
+from .diff import apply_delta, make_delta
+from .models import (ESSAY_JOB, EXCERPT_LENGTH, CategoryCount, Essay, EssayVersion, Job,
+                     category_surrogate_key, detail_page_cache_key, essay_surrogate_key, list_page_cache_key,
+                     iter_paragraphs, make_excerpt, render_paragraph, render_paragraphs, summarize)
+from .templatetags.essay_extras import essay_format
+from .views import EssayDetail, EssayList
+
+
+def run_jobs():
+    """Runs the jobs that are due, as a worker would, see jobs.py"""
+    call_command('run_workers', once=True, stderr=StringIO())
+
+
+class EssayListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_category_is_stored_lower_case(self):
+        essay = Essay.essay_manager.create_essay(title='Post #1', category='Thoughts', content='Text')
+        essay.refresh_from_db()
+        self.assertEqual(essay.category, Essay.THOUGHTS)
+
+    def test_category_lookup_ignores_case(self):
+        Essay.essay_manager.create_essay(title='Post #1', category=Essay.THOUGHTS, content='Text')
+        response = self.client.get(reverse('essay_list', kwargs={'category': 'Thoughts'}))
+        self.assertContains(response, 'Post #1')
+
+    def test_list_is_newest_first(self):
+        older = Essay.essay_manager.create_essay(title='Older', content='Text')
+        newer = Essay.essay_manager.create_essay(title='Newer', content='Text')
+        response = self.client.get(reverse('essay_list', kwargs={'category': Essay.THOUGHTS}))
+        self.assertEqual(list(response.context['all_final']), [newer, older])
+
+    def test_list_runs_one_query_without_content(self):
+        Essay.essay_manager.create_essay(title='Final', content='Text')
+        Essay.essay_manager.create_essay(title='Draft', content='Text', is_draft=True)
+        self.client.force_login(User.objects.create_user('editor'))
+        url = reverse('essay_list', kwargs={'category': Essay.THOUGHTS})
+        # One query for the last modification time, one for the essays, one
+        # for the category counts and one to check the page before caching
+        # it (see CachedPageMixin.store_page), none for the session or user
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual([essay.published.title for essay in response.context['all_final']], ['Final'])
+        self.assertNotContains(response, 'Draft')
+        self.assertIn('content', response.context['all_final'][0].published.get_deferred_fields())
+
+    def test_cards_show_summary_without_content(self):
+        content = 'A first paragraph that opens the essay.\n\n' + 'word ' * 450
+        Essay.essay_manager.create_essay(title='Long', content=content)
+        response = self.client.get(reverse('essay_list', kwargs={'category': Essay.THOUGHTS}))
+        self.assertContains(response, 'A first paragraph that opens the essay.')
+        self.assertContains(response, '457 words &middot; 3 min read')
+        self.assertIn('content', response.context['all_final'][0].published.get_deferred_fields())
+
+    def test_list_pages_with_cursor(self):
+        titles = ['Post #%d' % i for i in range(5)]
+        for title in titles:
+            Essay.essay_manager.create_essay(title=title, content='Text')
+        url = reverse('essay_list', kwargs={'category': Essay.THOUGHTS})
+
+        seen = []
+        with mock.patch.object(EssayList, 'page_size', 2):
+            response = self.client.get(url)
+            while True:
+                seen.extend(essay.published.title for essay in response.context['all_final'])
+                if response.context['next_cursor'] is None:
+                    break
+                response = self.client.get(url, {'before': response.context['next_cursor']})
+        self.assertEqual(seen, list(reversed(titles)))
+
+    def test_malformed_cursor_is_not_found(self):
+        url = reverse('essay_list', kwargs={'category': Essay.THOUGHTS})
+        self.assertEqual(self.client.get(url, {'before': 'nonsense'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'before': '99999999999999999999-1'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'before': '1-99999999999999999999'}).status_code, 404)
+
+
+class CategoryCountTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='First version')
+
+    def counts(self):
+        return CategoryCount.objects.for_category(Essay.THOUGHTS)
+
+    def edit(self, slug, content, is_draft=False):
+        data = {'title': 'Post #1', 'content': content}
+        if is_draft:
+            data['is_draft'] = 'on'
+        return self.client.post(reverse('essay_update', kwargs={'slug': slug}), data)
+
+    def test_counts_follow_saves_and_deletes(self):
+        draft = Essay.essay_manager.create_essay(title='Post #2', content='Text', is_draft=True)
+        Essay.essay_manager.create_essay(title='Post #3', category=Essay.MEDITATIONS, content='Text')
+        self.assertEqual(self.counts(), {'finals': 1, 'drafts': 1})
+
+        draft.publish()
+        self.assertEqual(self.counts(), {'finals': 2, 'drafts': 0})
+        Essay.objects.get(pk=draft.pk).delete()
+        self.assertEqual(self.counts(), {'finals': 1, 'drafts': 0})
+        self.assertEqual(CategoryCount.objects.total(), 2)
+
+    def test_drafts_of_published_essays_are_not_counted(self):
+        self.edit(self.essay.slug, content='Draft', is_draft=True)
+        self.assertEqual(self.counts(), {'finals': 1, 'drafts': 0})
+        self.edit(self.essay.slug, content='Final version')
+        self.assertEqual(self.counts(), {'finals': 1, 'drafts': 0})
+        Essay.objects.get(pk=self.essay.pk).unpublish()
+        self.assertEqual(self.counts(), {'finals': 0, 'drafts': 1})
+
+    def test_bulk_created_essays_are_counted(self):
+        Essay.essay_manager.bulk_create_essays(
+            [Essay.essay_manager.build('Post', 'Text', is_draft=bool(i % 2)) for i in range(5)])
+        self.assertEqual(self.counts(), {'finals': 4, 'drafts': 2})
+
+    def test_default_title_uses_counts(self):
+        self.client.force_login(User.objects.create_user('editor'))
+        with mock.patch.object(CategoryCount.objects, 'total', return_value=41):
+            response = self.client.get(reverse('essay_create'))
+        self.assertEqual(response.context['form'].initial['title'], 'Post #42')
+
+    def test_rebuild(self):
+        Essay.objects.filter(pk=self.essay.pk).update(draft=F('published'), published=None)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(self.counts(), {'finals': 0, 'drafts': 1})
+
+
+class SummaryTests(TestCase):
+
+    def test_summarize(self):
+        self.assertEqual(summarize(''), {'excerpt': '', 'word_count': 0, 'reading_minutes': 0})
+        summary = summarize('\n\nOne  short\nparagraph.\n\nAnother one.')
+        self.assertEqual(summary, {'excerpt': 'One short paragraph.', 'word_count': 5, 'reading_minutes': 1})
+        excerpt = make_excerpt('word ' * 100, length=20)
+        self.assertEqual(excerpt, 'word word word word\u2026')
+        self.assertEqual(len(make_excerpt('x' * 300)), EXCERPT_LENGTH)
+
+    def test_versions_are_summarized_when_saved(self):
+        essay = Essay.essay_manager.create_essay(title='Post #1', content='Two words')
+        essay.edit('Post #1', 'Now three words', as_draft=False)
+        version = EssayVersion.objects.get()
+        self.assertEqual((version.excerpt, version.word_count), ('Now three words', 3))
+        Essay.essay_manager.bulk_create_essays([Essay.essay_manager.build('Post #2', 'Bulk words')])
+        self.assertEqual(EssayVersion.objects.get(title='Post #2').word_count, 2)
+
+    def test_backfill(self):
+        Essay.essay_manager.create_essay(title='Post #1', content='Some words here')
+        Essay.essay_manager.create_essay(title='Post #2', content='More', is_draft=True)
+        EssayVersion.objects.update(excerpt='', word_count=0, reading_minutes=0)
+        call_command('backfill_summaries', batch_size=1, stderr=StringIO())
+        self.assertEqual(sorted(EssayVersion.objects.values_list('word_count', 'reading_minutes')),
+                         [(1, 1), (3, 1)])
+
+
+class SlugTests(TestCase):
+
+    def test_gen_slug_does_not_query(self):
+        with self.assertNumQueries(0):
+            slugs = [Essay.essay_manager.gen_slug() for _ in range(100)]
+        self.assertEqual(len(set(slugs)), 100)
+        self.assertTrue(all(len(slug) == 11 for slug in slugs))
+
+    def test_save_retries_on_slug_collision(self):
+        taken = Essay.essay_manager.create_essay(title='Post #1', content='Text').slug
+        with mock.patch.object(Essay.essay_manager, 'gen_slug', side_effect=[taken, 'freshslug01']):
+            essay = Essay.essay_manager.create_essay(title='Post #2', content='Text')
+        self.assertEqual(essay.slug, 'freshslug01')
+        self.assertEqual(Essay.objects.count(), 2)
+
+    def test_bulk_create_redraws_colliding_slugs(self):
+        taken = Essay.essay_manager.create_essay(title='Post #1', content='Text').slug
+        essays = [Essay.essay_manager.build('Post #%d' % i, 'Text', category='Thoughts') for i in range(2, 5)]
+        with mock.patch.object(Essay.essay_manager, 'gen_slug',
+                               side_effect=[taken, 'freshslug01', 'freshslug01', 'freshslug02', 'freshslug03']):
+            Essay.essay_manager.bulk_create_essays(essays, batch_size=2)
+        self.assertEqual([essay.slug for essay in essays], ['freshslug01', 'freshslug02', 'freshslug03'])
+        self.assertEqual(Essay.objects.get(pk=essays[0].pk).category, Essay.THOUGHTS)
+        self.assertEqual(Essay.objects.count(), 4)
+
+
+class DeltaTests(TestCase):
+
+    def test_delta_rebuilds_old_text(self):
+        old = "First paragraph.\nSecond paragraph.\nThird paragraph."
+        new = "First paragraph.\nA rewritten second paragraph.\nThird paragraph.\nA fourth one."
+        self.assertEqual(apply_delta(new, make_delta(new, old)), old)
+
+    def test_delta_of_unchanged_lines_is_small(self):
+        old = "".join("Paragraph %d of a long essay.\n" % i for i in range(200))
+        new = old.replace("Paragraph 100 ", "Paragraph one hundred ")
+        delta = make_delta(new, old)
+        self.assertLess(len(delta), len(old) // 10)
+        self.assertEqual(apply_delta(new, delta), old)
+
+
+@override_settings(ESSAY_WRITE_RATE_LIMIT=None)
+class ConcurrentEditTests(TransactionTestCase):
+    # Every editor is a thread with its own connection, so the essays have
+    # to be committed for them to be seen
+
+    def test_editing_different_essays_at_once(self):
+        essays = [Essay.essay_manager.create_essay(title='Post #%d' % i, content='Text') for i in range(8)]
+        user = User.objects.create_user('editor')
+        statuses = []
+
+        def edit(essay):
+            client = Client()
+            client.force_login(user)
+            try:
+                for i in range(10):
+                    url = reverse('essay_update', kwargs={'slug': essay.slug})
+                    statuses.append(client.post(url, {'title': 'Post', 'content': 'Edit %d' % i}).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=edit, args=(essay,)) for essay in essays]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [302] * 80)
+        for essay in essays:
+            essay.refresh_from_db()
+            self.assertEqual(essay.published.content, 'Edit 9')
+
+
+class EssayUpdateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='First version', is_draft=False)
+
+    def edit(self, slug, content, is_draft=False):
+        data = {'title': 'Post #1', 'content': content}
+        if is_draft:
+            data['is_draft'] = 'on'
+        return self.client.post(reverse('essay_update', kwargs={'slug': slug}), data)
+
+    def test_edit_keeps_old_version_as_revision(self):
+        self.edit(self.essay.slug, content='Second version')
+        self.assertEqual(EssayVersion.objects.count(), 1)
+        essay = Essay.objects.get()
+        self.assertEqual(essay.published.content, 'Second version')
+        self.assertEqual([content for _, content in essay.history()], ['First version'])
+
+    def test_moving_to_drafts_leaves_public_essay(self):
+        self.edit(self.essay.slug, content='Draft version', is_draft=True)
+        essay = Essay.objects.get()
+        self.assertEqual(essay.published.content, 'First version')
+        self.assertEqual(essay.draft.content, 'Draft version')
+        self.assertContains(self.client.get(reverse('essay_detail', kwargs={'slug': essay.slug})), 'First version')
+        self.assertContains(self.client.get(reverse('essay_draft', kwargs={'slug': essay.slug})), 'Draft version')
+        self.assertEqual([content for _, content in essay.history()], ['First version'])
+
+    def test_publishing_draft_swaps_pointers(self):
+        self.edit(self.essay.slug, content='Draft one', is_draft=True)
+        self.edit(self.essay.slug, content='Draft two', is_draft=True)
+        draft_id = Essay.objects.get().draft_id
+        self.edit(self.essay.slug, content='Final version')
+
+        essay = Essay.objects.get()
+        self.assertEqual(essay.pk, self.essay.pk)
+        self.assertEqual(essay.published_id, draft_id)
+        self.assertIsNone(essay.draft_id)
+        self.assertEqual(essay.published.content, 'Final version')
+        self.assertEqual(EssayVersion.objects.count(), 1)
+        self.assertEqual([content for _, content in essay.history()],
+                         ['Draft two', 'Draft one', 'First version'])
+        response = self.client.get(reverse('essay_draft', kwargs={'slug': essay.slug}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_moving_to_drafts_twice_replaces_draft(self):
+        self.edit(self.essay.slug, content='Draft one', is_draft=True)
+        self.edit(self.essay.slug, content='Draft two', is_draft=True)
+        essay = Essay.objects.get()
+        self.assertEqual(EssayVersion.objects.count(), 2)
+        self.assertEqual(essay.draft.content, 'Draft two')
+        self.assertEqual([content for _, content in essay.history()], ['Draft one', 'First version'])
+
+    def test_publish_and_unpublish_are_one_update(self):
+        essay = Essay.objects.get()
+        published_id = essay.published_id
+        # The pointer UPDATE, the job and the two counters (plus creating
+        # the drafts counter) around the transaction
+        with self.assertNumQueries(7):
+            essay.unpublish()
+        essay = Essay.objects.get()
+        self.assertEqual((essay.published_id, essay.draft_id), (None, published_id))
+        list_url = reverse('essay_list', kwargs={'category': essay.category})
+        self.assertNotContains(self.client.get(list_url), 'Post #1')
+
+        with self.assertNumQueries(5):
+            essay.publish()
+        essay = Essay.objects.get()
+        self.assertEqual((essay.published_id, essay.draft_id), (published_id, None))
+        self.assertContains(self.client.get(list_url), 'Post #1')
+
+    def test_edit_query_count_does_not_grow_with_history(self):
+        for version in range(5):
+            self.edit(self.essay.slug, content='Version %d' % version)
+        # Savepoint, locked select, revision number, revision insert,
+        # version update, essay update, job update and release
+        with self.assertNumQueries(8):
+            self.edit(self.essay.slug, content='Latest version')
+
+    def test_unchanged_edit_writes_nothing(self):
+        modified_on = self.essay.modified_on
+        with self.assertNumQueries(3):
+            self.edit(self.essay.slug, content='First version')
+        self.essay.refresh_from_db()
+        self.assertEqual(self.essay.modified_on, modified_on)
+
+    def test_publishing_draft_query_count_does_not_grow_with_history(self):
+        self.edit(self.essay.slug, content='Draft', is_draft=True)
+        for version in range(5):
+            self.edit(self.essay.slug, content='Draft %d' % version, is_draft=True)
+        # As an edit, then the pointer UPDATE and the deletion of the
+        # replaced published version; the counters do not move
+        with self.assertNumQueries(9):
+            self.edit(self.essay.slug, content='Final version')
+        self.assertEqual(Essay.objects.get().published.content, 'Final version')
+
+
+class HistoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='Version 0\nUnchanged', is_draft=False)
+        for version in range(1, 6):
+            self.essay.edit('Post #1', 'Version %d\nUnchanged' % version, as_draft=False)
+
+    def test_version_contents(self):
+        contents = self.essay.version_contents([2, 4, None])
+        self.assertEqual(contents, {2: 'Version 1\nUnchanged', 4: 'Version 3\nUnchanged',
+                                    None: 'Version 5\nUnchanged'})
+        self.assertEqual(self.essay.version_contents([99]), {})
+
+    def test_history_is_paged(self):
+        with mock.patch('Essay.views.EssayHistory.page_size', 2):
+            response = self.client.get(reverse('essay_history', kwargs={'slug': self.essay.slug}))
+            self.assertEqual([revision.number for revision in response.context['revisions']], [5, 4])
+            self.assertEqual(response.context['revisions'][0].successor, 'current')
+            self.assertEqual(response.context['next_cursor'], 4)
+
+            response = self.client.get(reverse('essay_history', kwargs={'slug': self.essay.slug}), {'before': 4})
+            self.assertEqual([revision.number for revision in response.context['revisions']], [3, 2])
+            self.assertEqual(response.context['revisions'][0].successor, 4)
+
+        url = reverse('essay_history', kwargs={'slug': self.essay.slug})
+        self.assertEqual(self.client.get(url, {'before': '99999999999999999999'}).status_code, 404)
+
+    def test_diff(self):
+        url = reverse('essay_diff', kwargs={'slug': self.essay.slug, 'a': 1, 'b': 'current'})
+        response = self.client.get(url)
+        self.assertEqual(response.context['hunks'],
+                         [[('-', 'Version 0'), ('+', 'Version 5'), (' ', 'Unchanged')]])
+
+    def test_diff_is_memoized(self):
+        url = reverse('essay_diff', kwargs={'slug': self.essay.slug, 'a': 2, 'b': 3})
+        self.client.get(url)
+        with mock.patch.object(Essay, 'version_contents', side_effect=AssertionError):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_diff_of_missing_revision(self):
+        url = reverse('essay_diff', kwargs={'slug': self.essay.slug, 'a': 2, 'b': 30})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('essay_diff', kwargs={'slug': self.essay.slug, 'a': 99999999999999999999, 'b': 'current'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class MigrationTests(TransactionTestCase):
+    """Moves rows of the old one-row-per-version schema through the migrations"""
+
+    def migrate(self, target=None):
+        """:return: The models as of the target migration, by default the latest one"""
+        executor = MigrationExecutor(connection)
+        target = target or executor.loader.graph.leaf_nodes('Essay')[0]
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def tearDown(self):
+        self.migrate()
+
+    def test_draft_edited_then_published(self):
+        OldEssay = self.migrate(('Essay', '0004_essayrevision')).get_model('Essay', 'Essay')
+        start = timezone.now() - timedelta(days=1)
+
+        def add(slug, content, minutes, **fields):
+            essay = OldEssay.objects.create(title='B', slug=slug, content=content, **fields)
+            OldEssay.objects.filter(pk=essay.pk).update(modified_on=start + timedelta(minutes=minutes))
+
+        # A draft saved twice as a draft (each clone losing two characters
+        # of its slug), then published with a last edit
+        add('zh67XfXjv', 'b1', 1, is_published=False, is_draft=True)
+        add('zh67XfXjv', 'b2', 2, is_published=False, is_draft=True)
+        add('zh67XfXjvAB', 'b3', 3, is_published=False, is_draft=True)
+        add('zh67XfXjvAB', 'b4', 4)
+
+        self.migrate()
+        essay = Essay.objects.get()
+        self.assertEqual(essay.slug, 'zh67XfXjvAB')
+        self.assertEqual(essay.published.content, 'b4')
+        self.assertIsNone(essay.draft)
+        self.assertEqual([(revision.number, content) for revision, content in essay.history()],
+                         [(3, 'b3'), (2, 'b2'), (1, 'b1')])
+
+    def test_search_index_is_built_from_the_old_schema(self):
+        OldEssay = self.migrate(('Essay', '0007_essay_slug_unique')).get_model('Essay', 'Essay')
+        OldEssay.objects.create(title='Final', slug='final', content='about lighthouses')
+        OldEssay.objects.create(title='Draft', slug='draft', content='about lighthouses', is_draft=True)
+        self.migrate()
+        results = search.search(Essay.objects.filter(published__isnull=False), 'lighthouses')
+        self.assertEqual([essay.slug for essay in results], ['final'])
+
+
+class RenderedContentTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='First line\nSecond <line>')
+        self.version = self.essay.published
+
+    def test_rendered_content_matches_linebreaks(self):
+        self.assertEqual(self.version.rendered_content(), '<p>First line<br>Second &lt;line&gt;</p>')
+
+    def test_rendered_content_is_cached(self):
+        self.version.rendered_content()
+        self.version.content = 'Changed without saving'
+        self.assertIn('First line', self.version.rendered_content())
+
+    def test_save_invalidates_rendered_content(self):
+        self.version.rendered_content()
+        key = self.version.rendered_content_key()
+        self.essay.edit('Post #1', 'Edited', as_draft=False)
+        self.assertIsNone(cache.get(key))
+        response = self.client.get(reverse('essay_detail', kwargs={'slug': self.essay.slug}))
+        self.assertContains(response, '<p>Edited</p>')
+
+    def test_paragraphs_render_like_linebreaks(self):
+        content = 'One <b>\r\nline\n\n\nTwo & three\r\n\r\n\nFour\n'
+        self.assertEqual(render_paragraphs(content), linebreaks(content, autoescape=True))
+
+    def test_edit_renders_only_changed_paragraphs(self):
+        paragraphs = ['Paragraph %d of a long essay.' % i for i in range(200)]
+        render_paragraphs('\n\n'.join(paragraphs))
+        paragraphs[100] = 'An edited paragraph.'
+        misses = render_paragraph.cache_info().misses
+        render_paragraphs('\n\n'.join(paragraphs))
+        self.assertEqual(render_paragraph.cache_info().misses - misses, 1)
+
+    def test_essay_format(self):
+        self.assertEqual(essay_format('One\nTwo'), '<p>One</p><p>Two</p>')
+
+
+class StreamingTests(TestCase):
+
+    content = 'One <b>\r\nline\n\n\nTwo & three\r\n\r\n\nFour\n' * 3
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content=self.content)
+        self.url = reverse('essay_detail', kwargs={'slug': self.essay.slug})
+
+    def test_paragraphs_split_like_linebreaks_whatever_the_pieces(self):
+        for size in range(1, 12):
+            chunks = [self.content[i:i + size] for i in range(0, len(self.content), size)]
+            self.assertEqual(list(iter_paragraphs(chunks)), list(iter_paragraphs([self.content])))
+        self.assertEqual(list(iter_paragraphs(['a\n\n'])), ['a', ''])
+
+    def test_content_is_read_in_pieces(self):
+        version = self.essay.published
+        with self.assertNumQueries(len(self.content) // 10 + 1):
+            self.assertEqual(''.join(version.iter_content(10)), self.content)
+
+    def test_long_essay_is_streamed_like_rendered(self):
+        rendered = self.client.get(self.url).content
+        cache.clear()
+        with mock.patch.multiple(EssayDetail, stream_threshold=1, stream_read_size=7, stream_chunk_size=5):
+            response = self.client.get(self.url)
+            self.assertTrue(response.streaming)
+            self.assertEqual(b''.join(response.streaming_content), rendered)
+            # Only the validators are cached
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('content', cache.get(detail_page_cache_key(self.essay.slug)))
+
+    def test_stream_stops_when_the_version_changes(self):
+        with mock.patch.multiple(EssayDetail, stream_threshold=1, stream_read_size=7, stream_chunk_size=5):
+            chunks = iter(self.client.get(self.url).streaming_content)
+            next(chunks)
+            self.essay.edit('Post #1', 'Edited', as_draft=False)
+            with self.assertRaises(EssayVersion.DoesNotExist):
+                list(chunks)
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='First version')
+        self.detail_url = reverse('essay_detail', kwargs={'slug': self.essay.slug})
+        self.list_url = reverse('essay_list', kwargs={'category': self.essay.category})
+
+    def test_anonymous_page_is_served_from_cache(self):
+        first = self.client.get(self.detail_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.detail_url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_conditional_get_returns_not_modified(self):
+        pages = [(self.detail_url, detail_page_cache_key(self.essay.slug)),
+                 (self.list_url, list_page_cache_key(self.essay.category))]
+        for url, key in pages:
+            etag = self.client.get(url)['ETag']
+            cache.clear()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            # Answered without rendering, so nothing was cached
+            self.assertIsNone(cache.get(key))
+
+    def test_edit_invalidates_detail_and_list(self):
+        self.client.get(self.detail_url)
+        self.client.get(self.list_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('essay_update', kwargs={'slug': self.essay.slug}),
+                             {'title': 'Renamed', 'content': 'Second version'})
+        self.assertContains(self.client.get(self.detail_url), 'Second version')
+        self.assertContains(self.client.get(self.list_url), 'Renamed')
+
+    def test_page_rendered_during_an_edit_is_not_cached(self):
+        get_context_data = EssayDetail.get_context_data
+
+        def edit_meanwhile(view, **kwargs):
+            context = get_context_data(view, **kwargs)
+            # Committed, and the cached pages deleted, before the old page
+            # is cached
+            with self.captureOnCommitCallbacks(execute=True):
+                Essay.objects.get(pk=self.essay.pk).edit('Post #1', 'Second version', as_draft=False)
+            return context
+
+        with mock.patch.object(EssayDetail, 'get_context_data', edit_meanwhile):
+            self.assertEqual(self.client.get(self.detail_url).status_code, 200)
+        self.assertIsNone(cache.get(detail_page_cache_key(self.essay.slug)))
+        self.assertContains(self.client.get(self.detail_url), 'Second version')
+
+    def test_page_does_not_replace_the_marker_of_an_edit(self):
+        key = detail_page_cache_key(self.essay.slug)
+        get_context_data = EssayDetail.get_context_data
+
+        def edit_meanwhile(view, **kwargs):
+            context = get_context_data(view, **kwargs)
+            cache.set(key, {'stale': True})
+            return context
+
+        with mock.patch.object(EssayDetail, 'get_context_data', edit_meanwhile):
+            self.client.get(self.detail_url)
+        self.assertEqual(cache.get(key), {'stale': True})
+
+    def test_marker_left_while_loading_the_page(self):
+        key = detail_page_cache_key(self.essay.slug)
+        get = cache.get
+        for misses in (1, 2):
+            # The marker of an edit appears after the first lookups, in the
+            # flight reading the validators or in the one rendering the page
+            lookups = []
+
+            def get_after_edit(cache_key, *args, **kwargs):
+                if cache_key != key:
+                    return get(cache_key, *args, **kwargs)
+                lookups.append(cache_key)
+                return None if len(lookups) <= misses else {'stale': True}
+
+            with mock.patch.object(cache, 'get', get_after_edit):
+                response = self.client.get(self.detail_url)
+            self.assertContains(response, 'First version')
+            self.assertNotIn('ETag', response)
+            self.assertIsNone(get(key))
+
+    def test_pages_are_the_same_for_everyone(self):
+        anonymous = self.client.get(self.detail_url)
+        self.client.force_login(User.objects.create_user('editor'))
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.content, anonymous.content)
+        self.assertNotIn('Vary', response)
+        self.assertNotContains(response, 'Edit')
+
+    def test_edit_with_replicas_reads_page_from_primary(self):
+        self.client.get(self.detail_url)
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.essay.edit('Post #1', 'Second version', as_draft=False)
+            # The replica may still have the first version, so the page is
+            # neither read from it nor cached for a while
+            for _ in range(2):
+                response = self.client.get(self.detail_url)
+                self.assertContains(response, 'Second version')
+                self.assertNotIn('ETag', response)
+
+
+class RecordingPurgeBackend(PurgeBackend):
+    """Remembers the keys it is asked to purge, oldest first"""
+
+    purged = []
+
+    def purge(self, keys):
+        self.purged.extend(keys)
+
+
+@override_settings(EDGE_PURGE_BACKEND='Essay.tests.RecordingPurgeBackend')
+class EdgeCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        RecordingPurgeBackend.purged.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='First version')
+        self.detail_url = reverse('essay_detail', kwargs={'slug': self.essay.slug})
+        self.list_url = reverse('essay_list', kwargs={'category': self.essay.category})
+
+    def test_pages_are_publicly_cacheable_with_surrogate_keys(self):
+        pages = [(self.detail_url, essay_surrogate_key(self.essay.slug)),
+                 (self.list_url, category_surrogate_key(self.essay.category)),
+                 (self.list_url + '?before=%d-1' % (time.time() * 10**6), category_surrogate_key(self.essay.category))]
+        for url, key in pages:
+            for _ in range(2):
+                response = self.client.get(url)
+                self.assertEqual(response['Surrogate-Key'], key)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('s-maxage=%d' % edge.get_max_age(), response['Cache-Control'])
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Surrogate-Key', response)
+
+    def test_publishing_through_the_edit_form_purges(self):
+        self.client.force_login(User.objects.create_user('editor'))
+        url = reverse('essay_update', kwargs={'slug': self.essay.slug})
+        self.client.post(url, {'title': 'Post #1', 'content': 'Draft', 'is_draft': 'on'})
+        RecordingPurgeBackend.purged.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'title': 'Post #1', 'content': 'Second version'})
+        self.assertEqual(RecordingPurgeBackend.purged,
+                         [essay_surrogate_key(self.essay.slug), category_surrogate_key(self.essay.category)])
+
+    def test_nothing_is_purged_before_commit(self):
+        self.essay.edit('Post #1', 'Second version', as_draft=False)
+        self.assertEqual(RecordingPurgeBackend.purged, [])
+
+    @override_settings(EDGE_PURGE_URL='http://proxy.invalid/')
+    def test_purge_request(self):
+        with mock.patch.object(edge.urllib.request, 'urlopen') as urlopen:
+            edge.PurgeRequestBackend().purge(['essay-x', 'category-thoughts'])
+        request = urlopen.call_args[0][0]
+        self.assertEqual((request.method, request.full_url), ('PURGE', 'http://proxy.invalid/'))
+        self.assertEqual(request.get_header('Surrogate-key'), 'essay-x category-thoughts')
+
+    def test_failing_purge_is_logged(self):
+        with override_settings(EDGE_PURGE_BACKEND='Avarion.edge.PurgeBackend'), \
+                mock.patch.object(edge, 'logger') as logger:
+            edge.purge(['essay-x'])
+        self.assertTrue(logger.exception.called)
+
+
+class ExtrasTests(TestCase):
+
+    def setUp(self):
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='First version')
+        self.essay.edit('Post #1', 'Draft of a second version', as_draft=True)
+        Essay.essay_manager.create_essay(title='Unpublished', content='Text', is_draft=True)
+        self.url = reverse('essay_extras')
+
+    def test_anonymous_visitors_get_nothing(self):
+        response = self.client.get(self.url, {'slug': self.essay.slug, 'category': Essay.THOUGHTS})
+        self.assertEqual(response.json(), {'authenticated': False})
+        self.assertIn('no-store', response['Cache-Control'])
+
+    def test_essay_links(self):
+        self.client.force_login(User.objects.create_user('editor'))
+        data = self.client.get(self.url, {'slug': self.essay.slug}).json()
+        self.assertEqual(data['essay']['edit_url'], reverse('essay_update', kwargs={'slug': self.essay.slug}))
+        self.assertEqual(data['essay']['draft_url'], reverse('essay_draft', kwargs={'slug': self.essay.slug}))
+        self.assertIsNone(self.client.get(self.url, {'slug': 'missing'}).json()['essay'])
+
+    def test_drafts_of_a_category(self):
+        self.client.force_login(User.objects.create_user('editor'))
+        with self.assertNumQueries(4):
+            data = self.client.get(self.url, {'category': 'Thoughts'}).json()
+        # The draft of a published essay is counted as it is listed
+        self.assertEqual(data['drafts']['count'], 2)
+        self.assertEqual([essay['title'] for essay in data['drafts']['essays']], ['Unpublished', 'Post #1'])
+        self.assertEqual(data['drafts']['essays'][1]['word_count'], 5)
+
+    def test_signed_in_cookie_follows_login(self):
+        User.objects.create_user('editor', password='secret', is_staff=True)
+        response = self.client.post(reverse('admin:login'), {'username': 'editor', 'password': 'secret'})
+        cookie = response.cookies[edge.SIGNED_IN_COOKIE]
+        self.assertEqual(cookie.value, '1')
+        self.assertFalse(cookie['httponly'])
+        # Pages leave it alone
+        self.assertNotIn(edge.SIGNED_IN_COOKIE, self.client.get(reverse('essay_list', kwargs={'category': Essay.THOUGHTS})).cookies)
+        response = self.client.post(reverse('admin:logout'))
+        self.assertEqual(response.cookies[edge.SIGNED_IN_COOKIE].value, '')
+
+    def test_extras_repair_the_signed_in_cookie(self):
+        self.client.cookies[edge.SIGNED_IN_COOKIE] = '1'
+        response = self.client.get(self.url)
+        self.assertEqual(response.cookies[edge.SIGNED_IN_COOKIE].value, '')
+        self.client.force_login(User.objects.create_user('editor'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.cookies[edge.SIGNED_IN_COOKIE].value, '1')
+        self.assertNotIn(edge.SIGNED_IN_COOKIE, self.client.get(self.url).cookies)
+
+
+class SearchTests(TestCase):
+
+    def search(self, query):
+        run_jobs()
+        response = self.client.get(reverse('essay_search'), {'q': query})
+        return [essay.published.title for essay in response.context['results']]
+
+    def test_only_published_finals_are_found(self):
+        Essay.essay_manager.create_essay(title='Final', content='about lighthouses')
+        Essay.essay_manager.create_essay(title='Draft', content='about lighthouses', is_draft=True)
+        self.assertEqual(self.search('lighthouses'), ['Final'])
+
+    def test_title_matches_rank_first(self):
+        Essay.essay_manager.create_essay(title='Notes', content='the sea and the sea again')
+        Essay.essay_manager.create_essay(title='The sea', content='notes')
+        self.assertEqual(self.search('sea'), ['The sea', 'Notes'])
+
+    def test_index_follows_edits(self):
+        essay = Essay.essay_manager.create_essay(title='Post #1', content='an old word')
+        essay.edit('Post #1', 'a new word', as_draft=False)
+        self.assertEqual(self.search('old'), [])
+        self.assertEqual(self.search('new'), ['Post #1'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        Essay.essay_manager.create_essay(title='Post #1', content='water')
+        self.assertEqual(self.search('water AND ("'), [])
+        self.assertEqual(self.search('"water"'), ['Post #1'])
+        self.assertEqual(self.search(''), [])
+
+
+class FeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Published', content='Text')
+        Essay.essay_manager.create_essay(title='Draft', content='Text', is_draft=True)
+        self.feed_url = reverse('essay_feed', kwargs={'category': Essay.THOUGHTS})
+
+    def test_feed_lists_published_essays(self):
+        response = self.client.get(self.feed_url)
+        self.assertEqual(response['Content-Type'], 'application/atom+xml; charset=utf-8')
+        self.assertContains(response, 'Published')
+        self.assertContains(response, reverse('essay_detail', kwargs={'slug': self.essay.slug}))
+        self.assertNotContains(response, 'Draft')
+        self.assertEqual(self.client.get(reverse('essay_feed', kwargs={'category': 'nonsense'})).status_code, 404)
+
+    def test_sitemap_lists_published_essays(self):
+        with mock.patch('Essay.feeds.SITEMAP_SIZE', 1):
+            index = self.client.get(reverse('essay_sitemap_index'))
+            part = feeds.sitemap_part(self.essay.pk)
+            self.assertContains(index, reverse('essay_sitemap', kwargs={'part': part}))
+            self.assertNotContains(index, reverse('essay_sitemap', kwargs={'part': part + 1}))
+            response = self.client.get(reverse('essay_sitemap', kwargs={'part': part}))
+            self.assertContains(response, reverse('essay_detail', kwargs={'slug': self.essay.slug}))
+            self.assertEqual(self.client.get(reverse('essay_sitemap', kwargs={'part': part + 1})).status_code, 404)
+        self.assertEqual(self.client.get('/sitemap-99999999999999999999.xml').status_code, 404)
+
+    def test_documents_are_served_from_cache(self):
+        for url in (self.feed_url, reverse('essay_sitemap_index')):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(first.content, second.content)
+            self.assertIn('Last-Modified', second)
+            self.assertEqual(not_modified.status_code, 304)
+
+    def test_publishing_regenerates_documents(self):
+        self.client.get(self.feed_url)
+        self.client.get(reverse('essay_sitemap_index'))
+        essay = Essay.essay_manager.create_essay(title='Newer', content='Text', is_draft=True)
+        run_jobs()
+        self.assertNotContains(self.client.get(self.feed_url), 'Newer')
+        essay.publish()
+        run_jobs()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.feed_url)
+        self.assertContains(response, 'Newer')
+        response = self.client.get(reverse('essay_sitemap', kwargs={'part': feeds.sitemap_part(essay.pk)}))
+        self.assertContains(response, essay.slug)
+
+    def test_changes_clear_the_documents_of_this_process(self):
+        # Without a worker sharing the cache, e.g. with the local-memory cache
+        self.client.get(self.feed_url)
+        self.client.get(reverse('essay_sitemap_index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.essay.edit('Renamed', 'Text', as_draft=False)
+        self.assertContains(self.client.get(self.feed_url), 'Renamed')
+        self.assertIsNone(cache.get(feeds.sitemap_cache_key(feeds.sitemap_part(self.essay.pk))))
+        self.assertIsNone(cache.get(feeds.sitemap_index_cache_key()))
+
+
+class JobTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='Text')
+
+    def job(self):
+        return Job.objects.get(name=ESSAY_JOB, key=str(self.essay.pk))
+
+    def test_saves_ask_for_one_job(self):
+        self.essay.edit('Post #1', 'Edited', as_draft=False)
+        self.essay.edit('Post #1', 'Edited again', as_draft=False)
+        self.assertEqual(Job.objects.count(), 1)
+        run_jobs()
+        job = self.job()
+        self.assertIsNone(job.run_after)
+        with self.assertNumQueries(1):
+            Job.objects.enqueue(ESSAY_JOB, self.essay.pk)
+
+    def test_job_asked_for_while_running_runs_again(self):
+        job, = Job.objects.claim(10, lease=60)
+        Job.objects.enqueue(ESSAY_JOB, self.essay.pk)
+        Job.objects.complete(job)
+        self.assertIsNotNone(self.job().run_after)
+        self.assertEqual(Job.objects.claim(10, lease=60), [self.job()])
+
+    def test_claimed_job_is_not_claimed_again(self):
+        self.assertEqual(len(Job.objects.claim(10, lease=60)), 1)
+        self.assertEqual(Job.objects.claim(10, lease=60), [])
+
+    def test_failing_job_backs_off(self):
+        with mock.patch.dict('Essay.jobs.handlers', {ESSAY_JOB: mock.Mock(side_effect=ValueError('broken'))}), \
+                self.assertLogs('Essay.jobs', 'ERROR'):
+            run_jobs()
+            job = self.job()
+            self.assertEqual(job.attempts, 1)
+            self.assertIn('broken', job.last_error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=Job.backoff_base - 1))
+            self.assertEqual(Job.objects.claim(10, lease=60), [])
+
+            Job.objects.filter(pk=job.pk).update(attempts=Job.max_attempts - 1, run_after=timezone.now())
+            run_jobs()
+            job = self.job()
+            self.assertTrue(job.failed)
+            self.assertIsNone(job.run_after)
+        self.assertEqual(Job.backoff(20), Job.backoff_max)
+
+    def test_deleted_essay_leaves_search(self):
+        run_jobs()
+        Essay.objects.get(pk=self.essay.pk).delete()
+        run_jobs()
+        response = self.client.get(reverse('essay_search'), {'q': 'text'})
+        self.assertEqual(list(response.context['results']), [])
+
+
+class JobWorkerTests(TransactionTestCase):
+    # The workers are threads with their own connections, so the jobs have
+    # to be committed for them to be seen
+
+    # A claim that fails (e.g. the database is busy for longer than the
+    # timeout) is logged, and the worker tries again
+    @mock.patch.object(jobs, 'logger')
+    def test_workers_run_jobs(self, logger):
+        cache.clear()
+        stop, threads = jobs.start_workers(2, poll_interval=0.01)
+        try:
+            essay = Essay.essay_manager.create_essay(title='Post #1', content='about lighthouses')
+            for _ in range(500):
+                if not Job.objects.filter(run_after__isnull=False).exists():
+                    break
+                time.sleep(0.01)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        response = self.client.get(reverse('essay_search'), {'q': 'lighthouses'})
+        self.assertEqual(list(response.context['results']), [essay])
+
+
+class CoalescingTests(TransactionTestCase):
+    # The requests are threads with their own connections, so the essay has
+    # to be committed for them to see it
+
+    def test_concurrent_misses_fetch_and_render_once(self):
+        cache.clear()
+        essay = Essay.essay_manager.create_essay(title='Post #1', content='Shared right after publishing')
+        url = reverse('essay_detail', kwargs={'slug': essay.slug})
+        count = 200
+        fetches = []
+        renders = []
+        get_object = EssayDetail.get_object
+        rendered_content = EssayVersion.rendered_content
+
+        def slow_get_object(view, queryset=None):
+            fetches.append(view)
+            # Long enough for every other request to arrive meanwhile
+            time.sleep(0.2)
+            return get_object(view, queryset)
+
+        def counted_rendered_content(version):
+            renders.append(version)
+            return rendered_content(version)
+
+        barrier = threading.Barrier(count)
+        responses = []
+
+        def request():
+            try:
+                barrier.wait()
+                responses.append(Client().get(url))
+            finally:
+                connection.close()
+
+        with mock.patch.object(EssayDetail, 'get_object', slow_get_object), \
+                mock.patch.object(EssayVersion, 'rendered_content', counted_rendered_content):
+            threads = [threading.Thread(target=request) for _ in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(responses), count)
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(len({response.content for response in responses}), 1)
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(len(renders), 1)
+
+    def test_error_is_shared_with_waiting_callers(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError('failed')
+
+        def call(function):
+            try:
+                flight.run('key', function)
+            except ValueError as error:
+                errors.append(error)
+
+        leader = threading.Thread(target=call, args=(fail,))
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call, args=(mock.Mock(side_effect=AssertionError),))
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+
+
+@override_settings(ESSAY_WRITE_RATE_LIMIT=(3, 6))
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='Text')
+        self.url = reverse('essay_update', kwargs={'slug': self.essay.slug})
+
+    def edit(self, client, number):
+        return client.post(self.url, {'title': 'Post #1', 'content': 'Edit %d' % number})
+
+    def test_posts_beyond_the_burst_are_refused(self):
+        self.client.force_login(User.objects.create_user('editor'))
+        self.assertEqual([self.edit(self.client, i).status_code for i in range(4)], [302, 302, 302, 429])
+        self.essay.refresh_from_db()
+        self.assertEqual(self.essay.published.content, 'Edit 2')
+        response = self.edit(self.client, 4)
+        # 6 a minute: a token every 10 seconds
+        self.assertEqual(response['Retry-After'], '10')
+        # Reading is not limited
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_bucket_refills(self):
+        now = time.time()
+        with mock.patch.object(ratelimit.time, 'time', return_value=now):
+            for i in range(3):
+                self.edit(self.client, i)
+            self.assertEqual(self.edit(self.client, 3).status_code, 429)
+        with mock.patch.object(ratelimit.time, 'time', return_value=now + 10):
+            self.assertEqual(self.edit(self.client, 4).status_code, 302)
+            self.assertEqual(self.edit(self.client, 5).status_code, 429)
+
+    def test_clients_have_their_own_buckets(self):
+        for i in range(3):
+            self.edit(self.client, i)
+        self.assertEqual(self.edit(self.client, 3).status_code, 429)
+        other = Client()
+        other.force_login(User.objects.create_user('editor'))
+        self.assertEqual(self.edit(other, 4).status_code, 302)
+        create = reverse('essay_create')
+        self.assertEqual(self.client.post(create, {'title': 'Post #2', 'category': Essay.THOUGHTS,
+                                                   'content': 'Text'}).status_code, 429)
+
+    @override_settings(ESSAY_WRITE_RATE_LIMIT=None)
+    def test_no_limit(self):
+        self.assertEqual({self.edit(self.client, i).status_code for i in range(20)}, {302})
+
+
+class ArchiveTests(TestCase):
+
+    def test_export_import_round_trip(self):
+        essay = Essay.essay_manager.create_essay(title='Post #1', content='First version')
+        essay.edit('Post #1', 'Second version', as_draft=False)
+        essay.edit('Post #1', 'Third version', as_draft=True)
+        Essay.essay_manager.create_essay(title='Post #2', category=Essay.MEDITATIONS, content='Draft', is_draft=True)
+        fields = ('slug', 'created_on', 'modified_on', 'published__title', 'published__content',
+                  'published__modified_on', 'draft__title', 'draft__content', 'draft__modified_on')
+        before = list(Essay.objects.order_by('pk').values(*fields))
+
+        out = StringIO()
+        call_command('export_essays', stdout=out, stderr=StringIO())
+        Essay.objects.all().delete()
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as archive:
+            archive.write(out.getvalue())
+            archive.flush()
+            call_command('import_essays', archive.name, batch_size=1, stderr=StringIO())
+
+        after = list(Essay.objects.order_by('pk').values(*fields))
+        self.assertEqual(after, before)
+        imported = Essay.objects.get(slug=essay.slug)
+        self.assertEqual([content for _, content in imported.history()], ['Second version', 'First version'])
+        self.assertEqual(self.search('second'), ['Post #1'])
+
+    def test_import_reads_archives_without_versions(self):
+        record = ('{"slug":"oldessay001","category":"thoughts","title":"Post #1","content":"Text",'
+                  '"created_on":"2020-01-01T00:00:00+00:00","modified_on":"2020-01-02T00:00:00+00:00",'
+                  '"is_published":true,"is_draft":true,"revisions":[]}\n')
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as archive:
+            archive.write(record)
+            archive.flush()
+            call_command('import_essays', archive.name, stderr=StringIO())
+        essay = Essay.objects.get(slug='oldessay001')
+        self.assertIsNone(essay.published_id)
+        self.assertEqual(essay.draft.content, 'Text')
+
+    def search(self, query):
+        response = self.client.get(reverse('essay_search'), {'q': query})
+        return [essay.published.title for essay in response.context['results']]
+
+
+@override_settings(ROOT_URLCONF='Avarion.asgi_urls')
+class AsyncViewTests(TransactionTestCase):
+    # The async views query the database from worker threads, so the rows
+    # have to be committed for them to be seen
+
+    def setUp(self):
+        cache.clear()
+        self.essay = Essay.essay_manager.create_essay(title='Post #1', content='First version')
+        self.detail_url = reverse('essay_detail', kwargs={'slug': self.essay.slug})
+
+    async def test_detail_and_list(self):
+        client = AsyncClient()
+        response = await client.get(self.detail_url)
+        self.assertContains(response, 'First version')
+        response = await client.get(reverse('essay_list', kwargs={'category': Essay.THOUGHTS}))
+        self.assertContains(response, 'Post #1')
+        response = await client.get(reverse('home'))
+        self.assertContains(response, 'Avarion')
+
+    async def test_cached_page_is_served_on_the_event_loop(self):
+        client = AsyncClient()
+        first = await client.get(self.detail_url)
+        with mock.patch.object(EssayDetail, 'get', side_effect=AssertionError):
+            second = await client.get(self.detail_url)
+        self.assertEqual(first.content, second.content)
+        response = await client.get(self.detail_url, **{'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_cached_page_is_served_to_signed_in_users(self):
+        client = AsyncClient()
+        first = await client.get(self.detail_url)
+        user = await sync_to_async(User.objects.create_user)('editor')
+        await sync_to_async(client.force_login)(user)
+        with mock.patch.object(EssayDetail, 'get', side_effect=AssertionError):
+            second = await client.get(self.detail_url)
+        self.assertEqual(first.content, second.content)
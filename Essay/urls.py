@@ -4,9 +4,16 @@ from . import views
 
 urlpatterns = [
     url(r'^create/$', views.EssayCreate.as_view(), name="essay_create"),
+    url(r'^search/$', views.EssaySearch.as_view(), name="essay_search"),
+    url(r'^extras/$', views.essay_extras, name="essay_extras"),
     url(r'^(?P<slug>[-\w]+)/edit/$', views.EssayUpdate.as_view(), name="essay_update"),
+    url(r'^(?P<slug>[-\w]+)/draft/$', views.EssayDraft.as_view(), name="essay_draft"),
+    url(r'^(?P<slug>[-\w]+)/history/$', views.EssayHistory.as_view(), name="essay_history"),
+    url(r'^(?P<slug>[-\w]+)/diff/(?P<a>\d+|current)/(?P<b>\d+|current)/$', views.EssayDiff.as_view(),
+        name="essay_diff"),
     url(r'^(?P<slug>[-\w]+)/$', views.EssayDetail.as_view(), name="essay_detail"),
     url(r'^all/(?P<category>[\w]+)/$', views.EssayList.as_view(), name="essay_list"),
+    url(r'^all/(?P<category>[\w]+)/feed/$', views.essay_feed, name="essay_feed"),
     #url(r'^all/meditations/$', views.EssayList.as_view(), name="all_meditations"),
 ]
 
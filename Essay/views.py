@@ -1,21 +1,248 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404, render
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
+from django.utils.timezone import utc
 from django.views.generic.detail import DetailView
+from django.views.generic.base import TemplateView
 from django.views.generic.list import ListView
 from django.views.generic.edit import UpdateView, CreateView
-from django.db.models import Count
-from .models import *
+from django.db.models import Max, Q
+from .models import (CategoryCount, Essay, cached_document, category_surrogate_key, detail_page_cache_key,
+                     essay_surrogate_key, iter_paragraphs, list_page_cache_key, render_paragraph)
+from . import feeds, search
+from .diff import diff_lines
+from .forms import EssayCreateForm, EssayVersionForm
+from Avarion import edge, ratelimit, replicas
+from Avarion.singleflight import SingleFlight
+
+from calendar import timegm
+from copy import copy
+from datetime import datetime, timedelta
+import hashlib
 
 # Create your views here.
 
-class EssayCreate(CreateView):
-    model = Essay
-    fields = ['title', 'category', 'is_draft', 'content']
-    template_name = "Essay/create_form.html"
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+# The largest integer SQLite stores; binding a larger one raises OverflowError
+MAX_INTEGER = 2**63 - 1
+
+# The pages of CachedPageMixin being loaded in this process, by cache key.
+# A request waits at most this long for another one to load its page.
+pages_in_flight = SingleFlight(timeout=10)
+
+class CachedPageMixin(object):
+    """
+    Serves a page from the cache, and answers conditional requests
+    (If-None-Match / If-Modified-Since) with a 304 without rendering the
+    template. Every response carries an ETag and a Last-Modified header
+    derived from the time the page's essays were last modified. The cached
+    page is deleted whenever one of its essays is saved (see
+    Essay.clear_cached_pages).
+
+    The page is the same for every visitor, signed in or not: what only
+    editors see (edit links, drafts) is filled in by the page from
+    essay_extras. So it is also sent as cacheable by a CDN or proxy, under
+    the surrogate keys of get_surrogate_keys, which are purged when one of
+    its essays is saved (see Avarion/edge.py).
+
+    When read replicas are configured, saving an essay leaves a marker in
+    place of its cached pages for REPLICA_LAG seconds instead of deleting
+    them. Until it expires the page is read from the primary and not
+    cached, since a replica may still hold the old version.
+
+    Concurrent requests for a page that is not in the cache wait for one of
+    them to load it and share the result (see pages_in_flight), rather than
+    all querying and rendering it.
+    """
+
+    page_cache_timeout = 60 * 60
+
+    def get_page_cache_key(self):
+        """
+        :return: The cache key of the page, or None if the page should not
+                be cached
+        """
+        raise NotImplementedError
+
+    def get_last_modified(self):
+        """
+        :return: The time the content of the page last changed, or None if
+                there is nothing to show on the page
+        """
+        raise NotImplementedError
+
+    def get_surrogate_keys(self):
+        """:return: The surrogate keys of what the page shows, see Avarion/edge.py"""
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_page_cache_key()
+        if key is None:
+            return self.render_public(request, *args, **kwargs)
+
+        page = cache.get(key)
+        if page is None:
+            # The marker of an edit may have been left meanwhile
+            page = pages_in_flight.run((key, 'validators'), lambda: cache.get(key) or self.make_page(key))
+            if page is None:
+                return self.render_public(request, *args, **kwargs)
+        if page.get('stale'):
+            return self.render_stale(request, *args, **kwargs)
+
+        if 'content' not in page and get_conditional_response(
+                request, etag=page['etag'], last_modified=page['last_modified']) is None:
+            responses = []
+
+            def render():
+                cached = cache.get(key)
+                if cached is not None and ('content' in cached or cached.get('stale')):
+                    return cached
+                rendered_page, response = self.render_page(key, page, request, *args, **kwargs)
+                responses.append(response)
+                return rendered_page
+
+            shared = pages_in_flight.run(key, render)
+            if responses:
+                # This request rendered the page
+                if responses[0] is not None:
+                    return responses[0]
+                page = shared
+            elif shared is not None and shared.get('stale'):
+                return self.render_stale(request, *args, **kwargs)
+            elif shared is not None and 'content' in shared:
+                page = shared
+            else:
+                # Streamed, or not found: every request has its own response
+                page, response = self.render_page(key, page, request, *args, **kwargs)
+                if response is not None:
+                    return response
+        return cached_page_response(request, page)
+
+    def make_page(self, key):
+        """
+        :return: The validators of the page, without its content, or None if
+                there is nothing to show on the page
+        """
+        last_modified = self.get_last_modified()
+        if last_modified is None:
+            return None
+        return {
+            'etag': self.make_etag(key, last_modified),
+            'last_modified': timegm(last_modified.utctimetuple()),
+            'surrogate_keys': self.get_surrogate_keys(),
+        }
+
+    @staticmethod
+    def make_etag(key, last_modified):
+        """The ETag of a page, from its modification time to the microsecond"""
+        version = '%s:%s' % (key, last_modified.timestamp())
+        return quote_etag(hashlib.md5(version.encode()).hexdigest())
+
+    def render_page(self, key, page, request, *args, **kwargs):
+        """
+        Renders the page and caches it.
+        :return: The page with its content, and None; or the page and the
+                response to send if the page is streamed (see
+                EssayDetail.stream), or None and the response if it is not a
+                200
+        """
+        response = super(CachedPageMixin, self).get(request, *args, **kwargs)
+        if response.streaming:
+            # Too long to keep, but conditional requests can still be
+            # answered from the cache
+            self.store_page(key, page)
+            return page, set_page_headers(response, page)
+        rendered = response.render()
+        if rendered.status_code != 200:
+            return None, rendered
+        page = dict(page, content=rendered.content, content_type=rendered['Content-Type'])
+        self.store_page(key, page)
+        return page, None
+
+    def store_page(self, key, page):
+        """
+        Caches a page, unless the cache holds something for it already (e.g.
+        the marker left by an edit, see clear_cached_pages) or one of its
+        essays changed since its validators were read. The page is added
+        first and checked after: an edit committing meanwhile is either seen
+        by the check, or deletes the page after it was added.
+        """
+        if not cache.add(key, page, self.page_cache_timeout):
+            return
+        last_modified = self.get_last_modified()
+        if last_modified is None or self.make_etag(key, last_modified) != page['etag']:
+            cache.delete(key)
+
+    def render_stale(self, request, *args, **kwargs):
+        """
+        Renders a page an edit left a marker for, from the primary database
+        and without caching it. Not for the CDN either, it would keep it
+        past the lag.
+        """
+        replicas.use_primary()
+        return super(CachedPageMixin, self).get(request, *args, **kwargs)
+
+    def render_public(self, request, *args, **kwargs):
+        """Renders a page that is not cached here, but may be by a CDN"""
+        response = super(CachedPageMixin, self).get(request, *args, **kwargs)
+        if response.status_code == 200:
+            edge.cache_publicly(response, self.get_surrogate_keys())
+        return response
+
 
-    # The same variable exists in EssayUpdate view. Make
-    # sure to keep them in sync
-    draft_slug_append = '--'
+def cached_page_response(request, page):
+    """
+    The response to a request for a page from the cache of CachedPageMixin:
+    a 304 if the client's copy is current, otherwise the page itself.
+    :param page: The cached page. It may lack its content only if the
+            request is conditional and the client's copy is current.
+    """
+    response = get_conditional_response(request, etag=page['etag'], last_modified=page['last_modified'])
+    if response is None:
+        response = HttpResponse(page['content'], content_type=page['content_type'])
+    return set_page_headers(response, page)
+
+
+def set_page_headers(response, page):
+    """Sets the validators and caching headers of a page of CachedPageMixin on a response"""
+    response['ETag'] = page['etag']
+    response['Last-Modified'] = http_date(page['last_modified'])
+    if 'surrogate_keys' in page:
+        edge.cache_publicly(response, page['surrogate_keys'])
+    return response
+
+
+class RateLimitedPostMixin(object):
+    """
+    Refuses a client's POSTs with a 429 once it has sent more than
+    ESSAY_WRITE_RATE_LIMIT allows, see Avarion/ratelimit.py. The bucket is
+    checked before any other work, e.g. before EssayUpdate starts its
+    transaction.
+    """
+
+    rate_limit_name = 'essay-write'
+
+    def dispatch(self, request, *args, **kwargs):
+        limit = getattr(settings, 'ESSAY_WRITE_RATE_LIMIT', None)
+        if request.method == 'POST' and limit is not None:
+            burst, per_minute = limit
+            wait = ratelimit.take_token(self.rate_limit_name, ratelimit.client_key(request), burst, per_minute / 60)
+            if wait:
+                return ratelimit.too_many_requests(wait)
+        return super(RateLimitedPostMixin, self).dispatch(request, *args, **kwargs)
+
+
+class EssayCreate(RateLimitedPostMixin, CreateView):
+    form_class = EssayCreateForm
+    template_name = "Essay/create_form.html"
 
     def get_initial(self):
         """
@@ -27,21 +254,9 @@ class EssayCreate(CreateView):
         """
         initial = super(EssayCreate, self).get_initial()
 
-        """
-        Aggregate functions like Count are used in the "aggregate" clause
-        Aggregate allows you to collect a bunch of objects and then run some
-        aggregate function on this collection to derive some value from it.
-        Here we are running the Count function to count the number of Essay
-        objects that have slugs. All of them do, so set its 'distinct' attribute
-        to True, to make sure we ignore all revisions and only count unique essays.
-        The unique_slugs keyword is arbitrary; it's the key to the dictionary returned.
-        """
-        # First, remove drafts that have been moved from public to private view from
-        # the queryset. They are duplicates of an essay that is still in public view.
-        no_draft_duplicates = Essay.objects.exclude(slug__contains=self.draft_slug_append)
-
-        essay_count = no_draft_duplicates.aggregate(unique_slugs=Count('slug', distinct=True))
-        essay_count = essay_count['unique_slugs']
+        # The number of essays is kept in CategoryCount, so it is a lookup
+        # of a few rows rather than a count of every essay.
+        essay_count = CategoryCount.objects.total()
 
         # The default title will be a number. The number equals to the number of
         # unique essays plus 1
@@ -49,157 +264,473 @@ class EssayCreate(CreateView):
         initial['title'] = default_title
         return initial
 
+    def form_valid(self, form):
+        data = form.cleaned_data
+        self.object = Essay.essay_manager.create_essay(data['title'], data['content'], is_draft=data['is_draft'],
+                                                      category=data['category'])
+        return HttpResponseRedirect(self.get_success_url())
+
     def get_success_url(self, **kwargs):
         return reverse('essay_detail', kwargs={'slug': self.object.slug})
 
-class EssayDetail(DetailView):
+class EssayDetail(CachedPageMixin, DetailView):
     """
     This presents the most recent revision of a
-    particular essay.
+    particular essay: its published version, or its draft if it has
+    never been published.
+
+    Essays longer than stream_threshold words are streamed rather than
+    rendered whole, see stream. The content is never loaded with the
+    essay: the rendered HTML is usually cached (see
+    EssayVersion.rendered_content).
     """
 
     """
     queryset is the default set of objects that get_object()
     will search through using the argument passed to this
     view class, namely <slug>.
-    
-    Another thing to note is that there is no need for
-    'model = Essay' here since this is equivalent to
-    'queryset = Essay.objects.all()'.
     """
-    queryset = Essay.objects.filter(is_published=True)
+    queryset = Essay.objects.select_related('published', 'draft').defer('published__content', 'draft__content')
     context_object_name = "essay"
     template_name = "Essay/essay_detail.html"
+    read_from_replica = True
+    # The number of words (see EssayVersion.word_count) above which an
+    # essay is streamed, or None to never stream
+    stream_threshold = 20000
+    # When streaming, the number of characters read from the database at a
+    # time, and about the number sent at a time. Reading a slice of a long
+    # value costs about as much as reading it whole in SQLite (and for
+    # compressed values in PostgreSQL), so reads are fewer and larger.
+    stream_read_size = 2 ** 20
+    stream_chunk_size = 64 * 1024
 
+    def get_page_cache_key(self):
+        return detail_page_cache_key(self.kwargs['slug'])
 
-class EssayUpdate(UpdateView):
+    def get_last_modified(self):
+        return Essay.objects.filter(slug=self.kwargs['slug']).values_list('modified_on', flat=True).first()
 
-    queryset = Essay.objects.filter(is_published=True)
-    fields = ['title', 'is_draft', 'content']
+    def get_surrogate_keys(self):
+        return [essay_surrogate_key(self.kwargs['slug'])]
+
+    def get_context_data(self, **kwargs):
+        context = super(EssayDetail, self).get_context_data(**kwargs)
+        context['version'] = self.object.current
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.stream_threshold is None or context['version'].word_count <= self.stream_threshold:
+            return super(EssayDetail, self).render_to_response(context, **response_kwargs)
+        return self.stream(context)
+
+    def stream(self, context):
+        """
+        The page as a StreamingHttpResponse, for essays too long to render
+        whole: the template is rendered with a placeholder for the content,
+        and everything up to it is sent at once. The content is then read,
+        rendered and sent paragraph by paragraph (see stream_content), so
+        that a worker holds a piece of it at a time rather than the essay,
+        its HTML and the page.
+        """
+        context['content_placeholder'] = mark_safe(CONTENT_PLACEHOLDER)
+        page = render_to_string(self.get_template_names(), context, self.request)
+        head, _, tail = page.partition(CONTENT_PLACEHOLDER)
+        chunks = context['version'].iter_content(self.stream_read_size)
+        return StreamingHttpResponse(stream_content(head, chunks, tail, self.stream_chunk_size))
+
+
+# Stands for the content of an essay in the page rendered by EssayDetail.stream.
+# Titles and content are escaped, so they can not contain it.
+CONTENT_PLACEHOLDER = '<!-- essay content -->'
+
+
+def stream_content(head, content, tail, chunk_size):
+    """
+    Yields the page of EssayDetail.stream: its head, the content rendered
+    as EssayVersion.rendered_content renders it, in pieces of about
+    chunk_size characters, and its tail. The paragraphs are rendered
+    without the LRU of render_paragraph, which one long essay would flush.
+    :param content: The content of the version, in pieces
+    """
+    yield head
+    render = render_paragraph.__wrapped__
+    pieces = []
+    size = 0
+    separator = ''
+    for paragraph in iter_paragraphs(content):
+        html = separator + render(paragraph)
+        separator = '\n\n'
+        pieces.append(html)
+        size += len(html)
+        if size >= chunk_size:
+            yield ''.join(pieces)
+            pieces = []
+            size = 0
+    pieces.append(tail)
+    yield ''.join(pieces)
+
+
+class EssayDraft(DetailView):
+    """The draft of an essay, which may also have a published version"""
+
+    queryset = Essay.objects.select_related('draft')
+    context_object_name = "essay"
+    template_name = "Essay/essay_detail.html"
+
+    def get_object(self, queryset=None):
+        essay = super(EssayDraft, self).get_object(queryset)
+        if essay.draft_id is None:
+            raise Http404("This essay has no draft")
+        return essay
+
+    def get_context_data(self, **kwargs):
+        context = super(EssayDraft, self).get_context_data(**kwargs)
+        context['version'] = self.object.draft
+        return context
+
+
+class EssayUpdate(RateLimitedPostMixin, UpdateView):
+    """
+    Edits an essay: its draft if it has one, its published version
+    otherwise. The whole edit (reading the essay, storing the old version
+    as a revision, publishing) runs in a single transaction with the essay
+    locked, so concurrent edits of the same essay are applied one after
+    the other instead of interleaving. See Essay.edit.
+    """
+
+    queryset = Essay.objects.select_related('published', 'draft')
+    form_class = EssayVersionForm
     context_object_name = "essay"
     template_name = "Essay/edit_form.html"
 
-    # The same variable exists in EssayCreate view. Make
-    # sure to keep them in sync
-    draft_slug_append = '--'
-    slug_append_len = len(draft_slug_append)
-
-    def save_revision(self, form):
-        """
-        This function retrieves the instance of the essay that is
-        about to be updated, and creates a copy of it and saves it
-        to the database. This is done easily by setting pk to None
-        and saving the object. This is assuming primary keys are
-        auto-generated.
-
-        If the essay is being moved from public view to private view
-        (turned to draft), then the last revision in public view will
-        still remain in public view, and the last edit version of the
-        essay will be moved to the drafts section. However, both will
-        have the same slugs this way which will prevent Django from
-        displaying either in Detail View, so a special string,
-        draft_slug_append, is appended to the last edit to denote
-        that it is a draft.
-
-        If the essay is being moved back to public view, any last
-        revisions of this essay in public view will be un-published,
-        and this current edit will take its place.
-        :param form: Contains the updated fields that are to be posted.
-        :return: nothing
-        """
-
-        old_draft = self.queryset.get(slug=self.kwargs['slug'])
-        old_draft.pk = None
-
-        changed_data = form.changed_data
-        # If moving from public view to private (draft) view
-        if ('is_draft' in changed_data) and (self.object.is_draft is True):
-            self.object.slug = self.object.slug + self.draft_slug_append
-        elif ('is_draft' not in changed_data) and (self.object.is_draft is True):
-            # If remaining in private (draft) view
-            old_draft.is_published = False
-            old_draft.slug = old_draft.slug[:-self.slug_append_len]
-            self.object.save()
-        else:
-            # Call function to check if private draft is replacing an existing
-            # public essay
-            self.check_final_exists()
-            old_draft.is_published = False
-
-        old_draft.save()
-        return
-
-    def check_final_exists(self):
-        """
-        This method checks if the essay being updated will be removed as
-        a draft and moved to public view (as a final draft). If this is
-        the case, then it will check if a previous revision of the essay
-        currently exists as a final draft, and un-publish it if this is
-        the case. The latest revision of the essay (which is currently
-        being handled by this view) will take its place.
-        :param form: Contains the updated fields that are to be posted.
-        :return: nothing
-        """
-
-        # Check if slug of the submitted form ends in draft_slug_append
-        # If so, find the earlier revision and un-publish it.
-        if self.object.slug[-self.slug_append_len:] == self.draft_slug_append:
-            # First remove the last letters of the slug of the draft, draft_slug_append
-            self.object.slug = self.object.slug[:-self.slug_append_len]
-
-            # Then use the slug to find the copy of the last revision that was public
-            old_draft = self.queryset.filter(is_draft=False).get(slug=self.object.slug)
-            old_draft.is_published = False
-            old_draft.save()
-        return
+    def post(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super(EssayUpdate, self).post(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super(EssayUpdate, self).get_queryset()
+        if self.request.method == 'POST':
+            # Locked until the transaction started in post() ends. Only the
+            # essay row, the versions are only ever changed with it locked.
+            queryset = queryset.select_for_update(of=('self',))
+        return queryset
+
+    def get_form_kwargs(self):
+        """
+        Override. The form edits the latest version of the essay. It gets a
+        copy of it, since the form writes the submitted values straight into
+        its instance, and Essay.edit needs the saved ones to tell what
+        changed and to store the old version.
+        """
+        kwargs = super(EssayUpdate, self).get_form_kwargs()
+        kwargs['instance'] = copy(self.object.latest)
+        kwargs['initial'] = dict(kwargs['initial'], is_draft=self.object.draft_id is not None)
+        return kwargs
 
     def form_valid(self, form):
         """
         If the form is valid, Django executes this function on its
         own.
 
-        This method checks which fields of the form were changed,
-        and if the content or title of the essay were changed then
-        save_revision is called to save a copy of the old revision
-        in the database.
-        If no changes were made or if the user only publishes the
-        essay as a draft or as a final draft (unchecks the is_draft
-        form field), then no copy of the previous revision needs to
-        be made and saved to the database.
+        If anything was changed (the title, the content or whether the
+        essay is a draft), the essay is edited, see Essay.edit. If nothing
+        was changed, nothing is written at all.
         :param form: The form that is submitted by the user
-        :return: Don't know don't care.. for now
+        :return: A redirect to the edited version
         """
 
-        changed_data = form.changed_data
-        if (len(changed_data) == 1) and ('is_draft' in changed_data):
-            # If 'is_draft' is False then draft is being moved to public view
-            # Call function to check if draft is replacing an existing public essay
-            if (form.cleaned_data['is_draft'] == False):
-                self.check_final_exists()
-
-            self.object.save()
-        elif len(changed_data) == 0:
-            self.object.save()
-        else:
-            self.save_revision(form)
-        return super(EssayUpdate, self).form_valid(form)
+        if form.has_changed():
+            data = form.cleaned_data
+            self.object.edit(data['title'], data['content'], as_draft=data['is_draft'])
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self, **kwargs):
+        if self.object.draft_id is not None and self.object.published_id is not None:
+            return reverse('essay_draft', kwargs={'slug': self.object.slug})
         return reverse('essay_detail', kwargs={'slug': self.object.slug})
 
-class EssayList(ListView):
+class EssayList(CachedPageMixin, ListView):
+    """
+    Lists the essays of a category, newest first. The list is paged with a
+    cursor (the ?before= parameter holds the modification time and primary
+    key of the last essay of the previous page) rather than an offset, so
+    every page is a single range scan on the category index no matter how
+    far back it is.
+    """
+
     template_name = "Essay/list.html"
+    read_from_replica = True
+    # Number of published essays shown per page
+    page_size = 50
+    # The columns the list template uses, plus what the cursor needs. The
+    # cards show the summary fields of the versions, never their content.
+    list_fields = ['slug', 'modified_on',
+                   'published', 'published__title', 'published__excerpt', 'published__word_count',
+                   'published__reading_minutes']
+
+    def get_page_cache_key(self):
+        # Only the first page is cached, since that is the one edits invalidate
+        if 'before' in self.request.GET:
+            return None
+        return list_page_cache_key(self.kwargs['category'])
+
+    def get_last_modified(self):
+        published = self.get_category_queryset().filter(published__isnull=False)
+        return published.aggregate(last_modified=Max('modified_on'))['last_modified']
+
+    def get_surrogate_keys(self):
+        return [category_surrogate_key(self.kwargs['category'])]
 
     def get_context_data(self, **kwargs):
+        """
+        Fetches one page of published essays with a single query. Drafts
+        are listed by the page from essay_extras, for editors only.
+        """
         context = super(EssayList, self).get_context_data(**kwargs)
-        all_published = Essay.objects.filter(is_published=True).filter(category__iexact=self.kwargs['category'])
-        context['all_final'] = all_published.filter(is_draft=False)
-        context['all_drafts'] = all_published.filter(is_draft=True)
+        essays = list(self.object_list[:self.page_size + 1])
+        has_next_page = len(essays) > self.page_size
+        essays = essays[:self.page_size]
+
+        context['all_final'] = essays
+        context['next_cursor'] = self.make_cursor(essays[-1]) if has_next_page else None
+        context['counts'] = CategoryCount.objects.for_category(self.kwargs['category'])
         return context
 
+    def get_category_queryset(self):
+        """
+        Categories are stored lower-cased (see Essay.save), so an exact
+        match on the lower-cased URL argument is enough and can use the
+        category index, unlike category__iexact.
+        """
+        return Essay.objects.filter(category=self.kwargs['category'].lower())
+
     def get_queryset(self):
         """
-        This method is literally here only because Django complained that
-        this view was not returning a queryset.
+        The published essays of the requested page, with the summaries of
+        their published versions but not their content.
         """
-        return Essay.objects.filter(is_published=True).filter(category__iexact=self.kwargs['category'])
\ No newline at end of file
+        queryset = (self.get_category_queryset().filter(published__isnull=False).select_related('published')
+                    .only(*self.list_fields).order_by('-modified_on', '-pk'))
+
+        if 'before' in self.request.GET:
+            modified_on, pk = self.parse_cursor(self.request.GET['before'])
+            queryset = queryset.filter(Q(modified_on__lt=modified_on) | Q(modified_on=modified_on, pk__lt=pk))
+        return queryset
+
+    @staticmethod
+    def make_cursor(essay):
+        """Encodes the position of an essay in the list as modification time (µs) and primary key"""
+        delta = essay.modified_on - EPOCH
+        microseconds = (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+        return '%d-%d' % (microseconds, essay.pk)
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """The inverse of make_cursor. Raises Http404 for a malformed cursor."""
+        try:
+            microseconds, pk = (int(part) for part in cursor.split('-'))
+            if pk > MAX_INTEGER:
+                raise ValueError
+            return EPOCH + timedelta(microseconds=microseconds), pk
+        except (ValueError, OverflowError):
+            raise Http404("Invalid page")
+
+
+class EssayHistory(ListView):
+    """
+    Lists the superseded versions of an essay, newest first. Only their
+    metadata is loaded, never their content deltas. Like EssayList, the
+    list is paged with a cursor: ?before= holds the number of the last
+    revision of the previous page.
+    """
+
+    template_name = "Essay/history.html"
+    context_object_name = "revisions"
+    page_size = 50
+
+    def get_queryset(self):
+        essays = Essay.objects.select_related('published', 'draft').defer('published__content', 'draft__content')
+        self.essay = get_object_or_404(essays, slug=self.kwargs['slug'])
+        queryset = self.essay.revisions.only('number', 'title', 'modified_on').order_by('-number')
+        if 'before' in self.request.GET:
+            try:
+                before = int(self.request.GET['before'])
+            except ValueError:
+                raise Http404("Invalid page")
+            if abs(before) > MAX_INTEGER:
+                raise Http404("Invalid page")
+            queryset = queryset.filter(number__lt=before)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super(EssayHistory, self).get_context_data(**kwargs)
+        revisions = list(self.object_list[:self.page_size + 1])
+        has_next_page = len(revisions) > self.page_size
+        revisions = revisions[:self.page_size]
+        for revision in revisions:
+            # The version that replaced it, to diff against
+            revision.successor = revision.number + 1
+        if revisions and 'before' not in self.request.GET:
+            revisions[0].successor = 'current'
+        context['essay'] = self.essay
+        context['revisions'] = revisions
+        context['next_cursor'] = revisions[self.page_size - 1].number if has_next_page else None
+        return context
+
+
+class EssayDiff(TemplateView):
+    """
+    Shows what changed between two versions of an essay, each given by its
+    revision number or by 'current' for its latest version (the draft, if
+    it has one).
+
+    A diff is computed the first time it is asked for and kept in the
+    cache. Old versions are rebuilt by walking the history from the latest
+    version down to the older of the two only, holding one version at a
+    time (see Essay.version_contents).
+    """
+
+    template_name = "Essay/diff.html"
+    diff_cache_timeout = 60 * 60 * 24
+
+    def get_context_data(self, **kwargs):
+        context = super(EssayDiff, self).get_context_data(**kwargs)
+        essay = get_object_or_404(Essay.objects.select_related('published', 'draft'), slug=self.kwargs['slug'])
+        a = self.parse_version(self.kwargs['a'])
+        b = self.parse_version(self.kwargs['b'])
+
+        key = self.diff_cache_key(essay, a, b)
+        hunks = cache.get(key)
+        if hunks is None:
+            contents = essay.version_contents([a, b])
+            if a not in contents or b not in contents:
+                raise Http404("No such revision")
+            hunks = diff_lines(contents[a], contents[b])
+            cache.set(key, hunks, self.diff_cache_timeout)
+
+        context.update(essay=essay, a=self.kwargs['a'], b=self.kwargs['b'], hunks=hunks)
+        return context
+
+    @staticmethod
+    def parse_version(version):
+        """:return: The revision number, or None for the latest version"""
+        if version == 'current':
+            return None
+        number = int(version)
+        if number > MAX_INTEGER:
+            raise Http404("No such revision")
+        return number
+
+    @staticmethod
+    def diff_cache_key(essay, a, b):
+        """
+        Revisions never change once stored, so a diff between two of them
+        is valid for as long as the essay exists. The latest version does
+        change, so a diff against it is keyed by its modification time too.
+        """
+        key = 'essay:diff:%d:%s:%s' % (essay.pk, a, b)
+        if a is None or b is None:
+            key += ':%s' % essay.latest.modified_on.timestamp()
+        return key
+
+
+class EssaySearch(ListView):
+    """
+    Full-text search over the published essays, best match first.
+    See search.py for how the index is kept.
+    """
+
+    template_name = "Essay/search.html"
+    context_object_name = "results"
+    max_results = 50
+    read_from_replica = True
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        published = (Essay.objects.filter(published__isnull=False).select_related('published')
+                     .only('slug', 'modified_on', 'published', 'published__title'))
+        return search.search(published, self.query, limit=self.max_results)
+
+    def get_context_data(self, **kwargs):
+        context = super(EssaySearch, self).get_context_data(**kwargs)
+        context['query'] = self.query
+        return context
+
+
+def essay_extras(request):
+    """
+    What the essay pages show editors only, as JSON, for the page to fill
+    in: the pages themselves are the same for everyone (see
+    CachedPageMixin), so this is the only part that depends on the visitor
+    and it is never cached.
+
+    For a signed-in user it has the link to write an essay, and:
+    - with ?slug=, the links to edit the essay, its history and its draft
+      (if it has one as well as a published version)
+    - with ?category=, the number of essays of the category with a draft
+      (never published, or a new version of a published one) and the
+      newest of them, with the summaries shown on the list cards
+    """
+    if not request.user.is_authenticated:
+        data = {'authenticated': False}
+    else:
+        data = {'authenticated': True, 'create_url': reverse('essay_create')}
+        slug = request.GET.get('slug')
+        if slug:
+            essay = Essay.objects.filter(slug=slug).values('published_id', 'draft_id').first()
+            data['essay'] = essay and {
+                'edit_url': reverse('essay_update', kwargs={'slug': slug}),
+                'history_url': reverse('essay_history', kwargs={'slug': slug}),
+                'draft_url': (reverse('essay_draft', kwargs={'slug': slug})
+                              if essay['draft_id'] is not None and essay['published_id'] is not None else None),
+            }
+        category = request.GET.get('category', '').lower()
+        if category:
+            drafts = Essay.objects.filter(category=category, draft__isnull=False)
+            newest = (drafts.select_related('draft')
+                      .only('slug', 'modified_on', 'published', 'draft', 'draft__title', 'draft__excerpt', 'draft__word_count',
+                            'draft__reading_minutes')
+                      .order_by('-modified_on', '-pk')[:EssayList.page_size])
+            data['drafts'] = {
+                # Not CategoryCount, which leaves out the drafts of published essays
+                'count': drafts.count(),
+                'essays': [{
+                    'url': reverse('essay_draft' if essay.published_id is not None else 'essay_detail',
+                                   kwargs={'slug': essay.slug}),
+                    'title': essay.draft.title,
+                    'excerpt': essay.draft.excerpt,
+                    'word_count': essay.draft.word_count,
+                    'reading_minutes': essay.draft.reading_minutes,
+                } for essay in newest],
+            }
+    response = JsonResponse(data)
+    patch_cache_control(response, private=True, no_store=True)
+    if data['authenticated'] != bool(request.COOKIES.get(edge.SIGNED_IN_COOKIE)):
+        # e.g. the session expired, or began before the cookie existed
+        edge.set_signed_in_cookie(response, data['authenticated'])
+    return response
+
+
+def essay_feed(request, category):
+    """The Atom feed of a category, see feeds.py"""
+    category = category.lower()
+    if category not in dict(Essay.CATEGORY):
+        raise Http404("No such category")
+    document = cached_document(feeds.feed_cache_key(category),
+                               lambda: Essay.essay_manager.build_feed(category))
+    return cached_page_response(request, document)
+
+
+def sitemap_index(request):
+    """The sitemap index, pointing to the sitemaps of the essays, see feeds.py"""
+    document = cached_document(feeds.sitemap_index_cache_key(), Essay.essay_manager.build_sitemap_index)
+    return cached_page_response(request, document)
+
+
+def sitemap(request, part):
+    """The sitemap of a part of the essays, see feeds.py"""
+    part = int(part)
+    document = cached_document(feeds.sitemap_cache_key(part), lambda: Essay.essay_manager.build_sitemap(part))
+    if document is None:
+        raise Http404("No essays in this sitemap")
+    return cached_page_response(request, document)
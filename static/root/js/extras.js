@@ -0,0 +1,100 @@
+/*
+ * Fills in what the essay pages show editors only. The pages are the same
+ * for every visitor, so that a CDN can cache them (see Avarion/edge.py);
+ * an element with a data-extras attribute names the URL of essay_extras
+ * to ask, and its answer is added to the page here. Only signed-in
+ * visitors have the signed_in cookie, so nobody else asks.
+ */
+(function () {
+    'use strict';
+
+    if (!/(?:^|;\s*)signed_in=/.test(document.cookie)) {
+        return;
+    }
+
+    function link(href, text) {
+        var a = document.createElement('a');
+        a.href = href;
+        a.textContent = text;
+        return a;
+    }
+
+    function plural(count, word) {
+        return count + ' ' + word + (count === 1 ? '' : 's');
+    }
+
+    function card(essay) {
+        var entry = document.createElement('div');
+        entry.className = 'entry';
+        var cardLink = link(essay.url, '');
+        var h1 = document.createElement('h1');
+        h1.className = 'card';
+        h1.textContent = 'A';
+        cardLink.appendChild(h1);
+        entry.appendChild(cardLink);
+        var h4 = document.createElement('h4');
+        h4.appendChild(link(essay.url, essay.title));
+        entry.appendChild(h4);
+        if (essay.word_count) {
+            var excerpt = document.createElement('p');
+            excerpt.className = 'excerpt';
+            excerpt.textContent = essay.excerpt;
+            entry.appendChild(excerpt);
+            var reading = document.createElement('p');
+            reading.className = 'reading';
+            reading.textContent = plural(essay.word_count, 'word') + ' · ' + essay.reading_minutes + ' min read';
+            entry.appendChild(reading);
+        }
+        return entry;
+    }
+
+    function showEssayLinks(container, essay) {
+        if (!essay) {
+            return;
+        }
+        container.appendChild(link(essay.edit_url, 'Edit'));
+        container.appendChild(document.createTextNode(' '));
+        container.appendChild(link(essay.history_url, 'History'));
+        if (essay.draft_url) {
+            container.appendChild(document.createTextNode(' '));
+            container.appendChild(link(essay.draft_url, 'Draft'));
+        }
+    }
+
+    function showDrafts(container, data) {
+        var create = container.querySelector('.new');
+        if (create) {
+            create.appendChild(link(data.create_url, 'New +'));
+            create.hidden = false;
+        }
+        var count = container.querySelector('.draft-count');
+        if (count) {
+            count.textContent = ', ' + plural(data.drafts.count, 'draft');
+        }
+        var tray = container.querySelector('.drafts');
+        if (tray && data.drafts.essays.length) {
+            data.drafts.essays.forEach(function (essay) {
+                tray.appendChild(card(essay));
+            });
+            tray.hidden = false;
+        }
+    }
+
+    document.querySelectorAll('[data-extras]').forEach(function (container) {
+        fetch(container.getAttribute('data-extras'), {credentials: 'same-origin'})
+            .then(function (response) {
+                return response.ok ? response.json() : {authenticated: false};
+            })
+            .then(function (data) {
+                if (!data.authenticated) {
+                    return;
+                }
+                if ('essay' in data) {
+                    showEssayLinks(container, data.essay);
+                }
+                if ('drafts' in data) {
+                    showDrafts(container, data);
+                }
+            });
+    });
+})();